@@ -1,26 +1,30 @@
 #Dashboard.py
 import streamlit as st
 import pandas as pd
+import math
 import os
 
 from db_utils.utils import (
     create_new_project,
-    upload_dataset_to_project,
     list_projects,
+    get_projects_overview,
     delete_project,
-    get_dataframe,
-    get_column_details,
-    get_dataset_metadata,
+    get_page,
     register_user,
     authenticate_user,
-    handle_error
+    handle_error,
+    preview_upload,
+    save_upload,
+    append_rows_to_project
 
 )
 
 from db_utils.mongo_utils import insert_knowledge_document
-from db_utils.mongo_utils import list_project_knowledge_files, delete_knowledge_document
+from db_utils.mongo_utils import delete_knowledge_document
 
 from db_utils.knowledge_ingestion import extract_text_from_txt
+from db_utils.jobs import enqueue_ingestion, cancel_job, list_jobs, start_job_workers, sweep_jobs
+from db_utils.index_advisor import get_index_report
 
 
 # Database connection
@@ -32,6 +36,9 @@ from db_utils.db_config import get_engine
 REQUIRED_DIRS = ['knowledge', 'uploads', 'logs']
 for dir_name in REQUIRED_DIRS:
     os.makedirs(dir_name, exist_ok=True)
+
+# Page sizes offered by the dataset browser
+PAGE_SIZES = [25, 50, 100, 500]
 # Initialize database tables on first run
 if 'db_initialized' not in st.session_state:
     init_all_databases()
@@ -46,6 +53,13 @@ engine = get_db_engine()
 
 engine = get_engine()
 
+# Background ingestion workers (started once per server process)
+@st.cache_resource
+def get_job_workers():
+    return start_job_workers(get_db_engine())
+
+get_job_workers()
+
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 
@@ -209,15 +223,16 @@ if page == "Create Project":
 elif page == "View Projects":
     st.header("📁 My Projects")
 
-    # Fetch projects
-    result = list_projects(st.session_state.user_id, engine)
+    # Projects with their datasets, column stats and knowledge files in one
+    # SQL query and one Mongo aggregation
+    result = get_projects_overview(st.session_state.user_id, engine)
 
     if not result.get("success", True):
         st.error(f"❌ Error loading projects: {result.get('error', 'Unknown error')}")
-    elif not result.get("project_list"):
+    elif not result.get("projects"):
         st.info("📝 No projects yet. Create your first project to get started!")
     else:
-        projects = result["project_list"]
+        projects = result["projects"]
 
         # Display summary
         col1, col2 = st.columns(2)
@@ -255,34 +270,72 @@ elif page == "View Projects":
                     if project['dataset_id']:
                         with st.expander("📊 View Dataset Details"):
                             try:
-                                # Get dataset metadata
-                                metadata = get_dataset_metadata(project['dataset_id'], engine)
+                                metadata = project['dataset']
                                 if metadata:
                                     st.write(f"**Dataset Name:** {metadata.get('dataset_name', 'N/A')}")
                                     st.write(f"**Filename:** {metadata.get('file_name', 'N/A')}")
                                     st.write(f"**Rows:** {metadata.get('num_rows', 'N/A')}")
                                     st.write(f"**Uploaded:** {metadata.get('upload_date', 'N/A')}")
 
-                                # Get column details
-                                columns = get_column_details(project['dataset_id'], engine)
+                                columns = project['columns']
                                 if columns:
                                     st.write("**Columns:**")
                                     col_df = pd.DataFrame(columns)
                                     st.dataframe(col_df, use_container_width=True)
 
-                                # Preview data
-                                df = get_dataframe(project['dataset_id'], engine, limit=5)
-                                if df is not None and not df.empty:
-                                    st.write("**Data Preview (first 5 rows):**")
-                                    st.dataframe(df, use_container_width=True)
+                                # Rows and indexes are only queried once asked for, so the
+                                # page does not run a query per project on every rerun
+                                if st.toggle("Browse rows and indexes", key=f"browse_{project['project_id']}"):
+                                    # Browse rows one keyset page at a time; the cursor
+                                    # stack lets "Previous" go back without OFFSET scans
+                                    st.write("**Data:**")
+                                    pager_key = f"dataset_pages_{project['project_id']}"
+                                    page_size = st.selectbox(
+                                        "Rows per page", PAGE_SIZES,
+                                        key=f"page_size_{project['project_id']}"
+                                    )
+                                    if st.session_state.get(f"{pager_key}_size") != page_size:
+                                        st.session_state[pager_key] = [None]
+                                        st.session_state[f"{pager_key}_size"] = page_size
+                                    cursors = st.session_state[pager_key]
+
+                                    page = get_page(project['dataset_id'], engine,
+                                                    page_size=page_size, cursor=cursors[-1])
+
+                                    nav_cols = st.columns([1, 1, 4])
+                                    with nav_cols[0]:
+                                        if st.button("◀ Previous", key=f"prev_page_{project['project_id']}",
+                                                     disabled=len(cursors) == 1):
+                                            cursors.pop()
+                                            st.rerun()
+                                    with nav_cols[1]:
+                                        if st.button("Next ▶", key=f"next_page_{project['project_id']}",
+                                                     disabled=page["next_cursor"] is None):
+                                            cursors.append(page["next_cursor"])
+                                            st.rerun()
+                                    with nav_cols[2]:
+                                        num_rows = metadata.get('num_rows') if metadata else None
+                                        if num_rows:
+                                            st.caption(f"Page {len(cursors)} of {max(math.ceil(num_rows / page_size), 1)}")
+
+                                    if not page["rows"].empty:
+                                        st.dataframe(page["rows"], use_container_width=True)
+
+                                    # Indexes built by the index advisor
+                                    index_report = get_index_report(project['dataset_id'], engine)
+                                    if index_report:
+                                        st.write("**Indexes:**")
+                                        st.dataframe(pd.DataFrame(index_report)[[
+                                            "index_name", "column_name", "method", "size_bytes",
+                                            "saved_ms_per_query", "queries_since", "total_saved_ms", "reason"
+                                        ]], use_container_width=True)
                             except Exception as e:
                                 st.error(f"Error loading dataset: {str(e)}")
                         st.markdown("### 📄 Dataset Knowledge Files")
 
 
 
-                        # List existing files
-                        knowledge_files = list_project_knowledge_files(project['project_id'])
+                        knowledge_files = project['knowledge_files']
 
                         if knowledge_files:
                             st.write(f"**Uploaded Files ({len(knowledge_files)}):**")
@@ -466,20 +519,19 @@ elif page == "Manage Datasets":
 
                 # File uploader
                 uploaded_file = st.file_uploader(
-                    "Choose a CSV file",
-                    type=['csv'],
-                    help="Upload a CSV file to attach to this project"
+                    "Choose a data file",
+                    type=['csv', 'parquet', 'arrow', 'feather'],
+                    help="Upload a CSV, Parquet or Arrow/Feather file to attach to this project"
                 )
 
                 if uploaded_file is not None:
                     # Preview uploaded file
                     st.subheader("📋 Data Preview")
                     try:
-                        preview_df = pd.read_csv(uploaded_file, nrows=5)
+                        preview_df = preview_upload(uploaded_file, uploaded_file.name, rows=5)
                         st.dataframe(preview_df, use_container_width=True)
 
                         # Show file info
-                        uploaded_file.seek(0)
                         file_details = {
                             "Filename": uploaded_file.name,
                             "File size": f"{uploaded_file.size / 1024:.2f} KB",
@@ -489,39 +541,120 @@ elif page == "Manage Datasets":
 
                         # Upload button
                         if st.button("📤 Upload Dataset", use_container_width=True, type="primary"):
-                            with st.spinner("Uploading dataset..."):
-                                # Save file temporarily
-                                import tempfile
-                                import os
-
-                                with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-                                    uploaded_file.seek(0)
-                                    tmp_file.write(uploaded_file.getvalue())
-                                    tmp_path = tmp_file.name
-
-                                try:
-                                    # Upload to database
-                                    upload_result = upload_dataset_to_project(
-                                        project_id=project_id,
-                                        csv_path=tmp_path,
-                                        original_filename=uploaded_file.name,
-                                        user_id=st.session_state.user_id,
-                                        engine=engine
-                                    )
+                            # Keep a persistent copy for the background job;
+                            # the job removes it when it finishes
+                            import uuid
 
-                                    if upload_result["success"]:
-                                        st.success(
-                                            f"✅ Dataset uploaded successfully! (Dataset ID: {upload_result['dataset_id']})")
-                                    else:
-                                        st.error(f"❌ Error: {upload_result['error']}")
-                                finally:
-                                    # Clean up temp file
-                                    if os.path.exists(tmp_path):
-                                        os.unlink(tmp_path)
+                            upload_path = os.path.join(
+                                "uploads", f"{uuid.uuid4().hex}_{os.path.basename(uploaded_file.name)}"
+                            )
+                            save_upload(uploaded_file, upload_path)
+
+                            job_result = enqueue_ingestion(
+                                project_id=project_id,
+                                file_path=upload_path,
+                                original_filename=uploaded_file.name,
+                                user_id=st.session_state.user_id,
+                                engine=engine
+                            )
+
+                            if job_result["success"]:
+                                st.success(
+                                    f"✅ Upload queued (Job ID: {job_result['job_id']}). Progress is shown below.")
+                            else:
+                                if os.path.exists(upload_path):
+                                    os.unlink(upload_path)
+                                st.error(f"❌ Error: {job_result['error']}")
 
                     except Exception as e:
                         st.error(f"❌ Error reading file: {str(e)}")
 
+        # Append new rows to a project's existing dataset
+        projects_with_data = [p for p in projects if p['dataset_id'] is not None]
+
+        if projects_with_data:
+            st.markdown("---")
+            st.subheader("➕ Append Rows to a Dataset")
+
+            append_options = {f"{p['project_name']} (ID: {p['project_id']})": p['project_id']
+                              for p in projects_with_data}
+
+            selected_append = st.selectbox(
+                "Select Project",
+                options=list(append_options.keys()),
+                key="append_project"
+            )
+
+            append_file = st.file_uploader(
+                "Choose a CSV with new rows",
+                type=['csv'],
+                key="append_file",
+                help="The CSV must have the same columns as the dataset; stats are updated without reloading old rows"
+            )
+
+            if append_file is not None and st.button("➕ Append Rows", use_container_width=True):
+                with st.spinner("Appending rows..."):
+                    append_result = append_rows_to_project(
+                        append_options[selected_append],
+                        append_file,
+                        st.session_state.user_id,
+                        engine
+                    )
+
+                if append_result["success"]:
+                    st.success(f"✅ Appended {append_result['rows_appended']:,} rows "
+                               f"({append_result['num_rows']:,} rows in total)")
+                else:
+                    st.error(f"❌ Error: {append_result['error']}")
+
+def render_upload_jobs():
+    # Requeue jobs orphaned by a crashed worker (throttled inside sweep_jobs)
+    sweep_jobs(engine)
+    jobs = list_jobs(st.session_state.user_id, engine, limit=10)
+    if not jobs:
+        st.caption("No uploads yet.")
+        return
+
+    for job in jobs:
+        col_info, col_action = st.columns([5, 1])
+        with col_info:
+            status_icon = {
+                "queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌", "cancelled": "🚫"
+            }.get(job["status"], "")
+            st.write(f"{status_icon} **{job['original_filename']}** "
+                     f"(Job {job['job_id']}, Project {job['project_id']}) — {job['status']}")
+
+            if job["status"] == "running":
+                details = f"Phase: {job['phase'] or 'starting'} · Rows loaded: {job['rows_loaded']:,}"
+                if job["eta_seconds"] is not None:
+                    details += f" · ETA: {int(job['eta_seconds'] // 60)}m {int(job['eta_seconds'] % 60)}s"
+                st.progress(job["progress"] or 0.0, text=details)
+            elif job["status"] == "failed":
+                st.caption(f"Error: {job['error']}")
+            elif job["status"] == "succeeded":
+                st.caption(f"Dataset ID: {job['dataset_id']}")
+
+        with col_action:
+            if job["status"] in ("queued", "running"):
+                if st.button("Cancel", key=f"cancel_job_{job['job_id']}", use_container_width=True):
+                    cancel_result = cancel_job(job["job_id"], st.session_state.user_id, engine)
+                    if not cancel_result["success"]:
+                        st.error(f"❌ {cancel_result['error']}")
+                    st.rerun()
+
+
+if page == "Manage Datasets":
+    st.markdown("---")
+    st.subheader("📦 Upload Jobs")
+
+    # Poll job progress without rerunning the whole page when supported
+    if hasattr(st, "fragment"):
+        st.fragment(run_every=2)(render_upload_jobs)()
+    else:
+        render_upload_jobs()
+        if st.button("🔄 Refresh progress"):
+            st.rerun()
+
 # Footer
 st.markdown("---")
 st.caption("💡 Tip: Use the sidebar to navigate between different actions")
@@ -0,0 +1,322 @@
+#bench_ingestion.py
+"""Time ingest_dataset end to end on synthetic StudentsPerformance-shaped data.
+
+Needs a PostgreSQL database with the app schema (DATABASE_URL, see
+db_utils/db_config.py). Run from the repository root:
+    python -m benchmarks.bench_ingestion --rows 1000,100000,1000000 --columns 8,200
+
+Each (format, rows, columns) case is generated once under --data-dir and
+ingested in a fresh process, so peak RSS is per case. Results (wall time,
+rows/sec, peak RSS and the parse / ddl / load / profile / metadata phase
+breakdown) are written to --output as JSON. With --baseline, cases whose
+rows/sec dropped by more than --tolerance against that file are reported
+and the exit status is 1.
+
+In streaming mode (--chunksize, and always for Parquet) parsing happens
+chunk by chunk inside the load, so "parse" only covers the schema sample.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from db_utils.db_config import get_database_url
+
+# Rows generated and written per step, so 50M-row files never sit in memory
+GENERATE_CHUNK_ROWS = 200_000
+
+BENCHMARK_USERNAME = "benchmark"
+
+# progress_callback phase -> reported phase
+PHASES = {
+    "parsing": "parse",
+    "creating table": "ddl",
+    "loading": "load",
+    "profiling": "profile",
+    "writing metadata": "metadata"
+}
+
+CATEGORICAL_LEVELS = {
+    "gender": ["female", "male"],
+    "race/ethnicity": ["group A", "group B", "group C", "group D", "group E"],
+    "parental level of education": [
+        "some high school", "high school", "some college",
+        "associate's degree", "bachelor's degree", "master's degree"
+    ],
+    "lunch": ["standard", "free/reduced"],
+    "test preparation course": ["none", "completed"]
+}
+SCORE_COLUMNS = ["math score", "reading score", "writing score"]
+
+
+def _column_plan(columns):
+    """(name, kind, base) for each column: the 8 StudentsPerformance columns,
+    then extra score and categorical columns in the same 3:5 mix."""
+
+    base = [(name, "categorical", name) for name in CATEGORICAL_LEVELS] + \
+           [(name, "score", name) for name in SCORE_COLUMNS]
+    plan = base[:columns]
+    copy = 2
+    while len(plan) < columns:
+        for name, kind, origin in base:
+            if len(plan) == columns:
+                break
+            plan.append((f"{name} {copy}", kind, origin))
+        copy += 1
+    return plan
+
+
+def make_students_chunk(rows, plan, rng):
+    """One chunk of StudentsPerformance-like rows: categorical demographics and
+    0-100 integer scores driven by a shared ability so they correlate."""
+
+    ability = rng.normal(66, 13, rows)
+    prepared = rng.random(rows) < 0.36
+    data = {}
+    for name, kind, origin in plan:
+        if kind == "categorical":
+            levels = np.array(CATEGORICAL_LEVELS[origin], dtype=object)
+            if origin == "test preparation course":
+                data[name] = np.where(prepared, "completed", "none").astype(object)
+            else:
+                data[name] = levels[rng.integers(0, len(levels), rows)]
+        else:
+            scores = ability + 5 * prepared + rng.normal(0, 6, rows)
+            data[name] = np.clip(np.round(scores), 0, 100).astype("int64")
+    return pd.DataFrame(data)
+
+
+def generate_dataset(path, rows, columns, file_format, seed=0):
+    """Write a synthetic dataset chunk by chunk; CSV is fully quoted like the original."""
+
+    plan = _column_plan(columns)
+    tmp_path = f"{path}.partial"
+    writer = None
+
+    try:
+        for chunk_index, start in enumerate(range(0, rows, GENERATE_CHUNK_ROWS)):
+            rng = np.random.default_rng([seed, chunk_index])
+            chunk = make_students_chunk(min(GENERATE_CHUNK_ROWS, rows - start), plan, rng)
+
+            if file_format == "csv":
+                chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0,
+                             index=False, quoting=csv.QUOTE_ALL)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, path)
+
+
+def dataset_path(data_dir, rows, columns, file_format):
+    extension = "csv" if file_format == "csv" else "parquet"
+    return os.path.join(data_dir, f"students_{rows}x{columns}.{extension}")
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _benchmark_user(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO user_details (username, password_hash)
+                VALUES (:username, 'not-a-login')
+                ON CONFLICT (username) DO NOTHING;
+            """),
+            {"username": BENCHMARK_USERNAME}
+        )
+        return conn.execute(
+            text("SELECT user_id FROM user_details WHERE username = :username;"),
+            {"username": BENCHMARK_USERNAME}
+        ).scalar_one()
+
+
+def _drop_dataset(engine, dataset_id):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS dataset_{dataset_id}_data;"))
+        conn.execute(text("DELETE FROM datasets_metadata WHERE dataset_id = :dataset_id;"),
+                     {"dataset_id": dataset_id})
+
+
+def run_case(database_url, path, file_format, chunksize, profile_workers, keep_dataset):
+    """Ingest one file (in a worker process) and return its measurements."""
+
+    from db_utils.Ingestion import ingest_dataset
+
+    engine = create_engine(database_url)
+    user_id = _benchmark_user(engine)
+    marks = []
+
+    def progress(phase, rows_loaded):
+        if not marks or marks[-1][0] != phase:
+            marks.append((phase, time.perf_counter()))
+
+    start = time.perf_counter()
+    result = ingest_dataset(path, os.path.basename(path), user_id, engine,
+                            chunksize=chunksize, profile_workers=profile_workers,
+                            progress_callback=progress, file_format=file_format)
+    wall = time.perf_counter() - start
+
+    phases = {}
+    for (phase, began), (_, ended) in zip(marks, marks[1:] + [(None, start + wall)]):
+        name = PHASES.get(phase, phase)
+        phases[name] = phases.get(name, 0.0) + ended - began
+
+    if result["success"] and not keep_dataset:
+        _drop_dataset(engine, result["dataset_id"])
+    engine.dispose()
+
+    return {
+        "success": result["success"],
+        "error": result["error"],
+        "wall_seconds": wall,
+        "load_seconds": result["load_seconds"],
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "phases": phases
+    }
+
+
+def _environment(database_url):
+    environment = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__
+    }
+    try:
+        engine = create_engine(database_url)
+        with engine.connect() as conn:
+            environment["postgres"] = conn.execute(text("SHOW server_version;")).scalar()
+        engine.dispose()
+    except Exception as e:
+        environment["postgres"] = f"unavailable: {e}"
+    return environment
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Cases whose rows/sec fell more than tolerance below the baseline."""
+
+    with open(baseline_path) as f:
+        baseline = {
+            (case["format"], case["rows"], case["columns"], case["mode"]): case
+            for case in json.load(f)["results"]
+            if case["success"]
+        }
+
+    regressions = []
+    for case in results:
+        previous = baseline.get((case["format"], case["rows"], case["columns"], case["mode"]))
+        if previous is None or not case["success"]:
+            continue
+        change = case["rows_per_sec"] / previous["rows_per_sec"] - 1
+        if change < -tolerance:
+            regressions.append({**case, "baseline_rows_per_sec": previous["rows_per_sec"], "change": change})
+    return regressions
+
+
+def _int_list(value):
+    return [int(item.replace("_", "")) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=_int_list, default=[1_000, 100_000])
+    parser.add_argument("--columns", type=_int_list, default=[8])
+    parser.add_argument("--formats", default="csv", help="comma-separated: csv,parquet")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="stream CSVs in chunks of this many rows (in-memory when omitted)")
+    parser.add_argument("--workers", type=int, default=0, help="profile_workers for in-memory ingestion")
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    parser.add_argument("--output", default=None, help="results JSON (default: benchmarks/results/ingestion_<time>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare rows/sec against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--database-url", default=get_database_url())
+    parser.add_argument("--keep-datasets", action="store_true", help="leave ingested datasets in the database")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"ingestion_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+    started_at = datetime.now().isoformat(timespec="seconds")
+    results = []
+    for file_format in args.formats.split(","):
+        mode = "streaming" if args.chunksize is not None or file_format != "csv" else "in-memory"
+        for columns in args.columns:
+            for rows in args.rows:
+                path = dataset_path(args.data_dir, rows, columns, file_format)
+                if not os.path.exists(path):
+                    print(f"Generating {path}")
+                    generate_dataset(path, rows, columns, file_format)
+
+                # A fresh process per case keeps peak RSS per case
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    measured = pool.submit(run_case, args.database_url, path, file_format,
+                                           args.chunksize, args.workers, args.keep_datasets).result()
+
+                case = {
+                    "format": file_format,
+                    "mode": mode,
+                    "rows": rows,
+                    "columns": columns,
+                    "file_bytes": os.path.getsize(path),
+                    **measured,
+                    "rows_per_sec": rows / measured["wall_seconds"] if measured["wall_seconds"] > 0 else None
+                }
+                results.append(case)
+
+                if case["success"]:
+                    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in case["phases"].items())
+                    print(f"{file_format} {rows} x {columns}: {case['wall_seconds']:.2f}s, "
+                          f"{case['rows_per_sec']:,.0f} rows/s, peak RSS {case['peak_rss_bytes'] / 2**20:,.0f} MiB "
+                          f"({phases})")
+                else:
+                    print(f"{file_format} {rows} x {columns}: failed: {case['error']}")
+
+    report = {
+        "started_at": started_at,
+        "environment": _environment(args.database_url),
+        "settings": {"chunksize": args.chunksize, "profile_workers": args.workers},
+        "results": results
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for case in regressions:
+            print(f"REGRESSION {case['format']} {case['rows']} x {case['columns']}: "
+                  f"{case['rows_per_sec']:,.0f} rows/s vs {case['baseline_rows_per_sec']:,.0f} "
+                  f"({case['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
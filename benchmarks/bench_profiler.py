@@ -0,0 +1,118 @@
+#bench_profiler.py
+"""Compare the vectorised profiler with the legacy per-column stats loop.
+
+Run from the repository root:
+    python -m benchmarks.bench_profiler --rows 100000 --numeric 160 --categorical 40 --datetime 10
+
+Pass --workers N to also time the process-pool profiler.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from db_utils.profiler import profile_dataframe
+
+
+def make_wide_frame(rows, numeric, categorical, datetime, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {}
+
+    for i in range(numeric):
+        values = rng.normal(60, 15, rows).round(1)
+        values[rng.random(rows) < 0.01] = np.nan
+        data[f"num_{i}"] = values
+
+    levels = np.array(["group A", "group B", "group C", "group D", "group E"], dtype=object)
+    for i in range(categorical):
+        values = levels[rng.integers(0, len(levels), rows)]
+        values[rng.random(rows) < 0.01] = None
+        data[f"cat_{i}"] = values
+
+    start = np.datetime64("2020-01-01")
+    for i in range(datetime):
+        days = rng.integers(0, 1500, rows)
+        data[f"date_{i}"] = pd.to_datetime(start + days.astype("timedelta64[D]"))
+
+    return pd.DataFrame(data)
+
+
+def legacy_profile(df):
+    """The per-column loop ingest_dataset used before the profiler module."""
+    column_stats = []
+    for col in df.columns:
+        stats = {
+            "column_name": col,
+            "num_missing": int(df[col].isnull().sum()),
+            "unique_value_count": int(df[col].nunique(dropna=True))
+        }
+        if pd.api.types.is_numeric_dtype(df[col]):
+            stats.update({
+                "mean": float(df[col].mean()),
+                "median": float(df[col].median()),
+                "std_dev": float(df[col].std()),
+                "min_value": float(df[col].min(skipna=True)),
+                "max_value": float(df[col].max(skipna=True))
+            })
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            stats.update({
+                "min_datetime": df[col].min(),
+                "max_datetime": df[col].max()
+            })
+        else:
+            stats["distinct_categories"] = json.dumps(df[col].dropna().unique().tolist()[:30])
+        column_stats.append(stats)
+    return column_stats
+
+
+def check_equivalent(legacy, vectorised):
+    for old, new in zip(legacy, vectorised):
+        for key, value in old.items():
+            if isinstance(value, float):
+                assert np.isclose(value, new[key], equal_nan=True), (old["column_name"], key)
+            else:
+                assert value == new[key], (old["column_name"], key)
+
+
+def best_of(func, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--numeric", type=int, default=160)
+    parser.add_argument("--categorical", type=int, default=40)
+    parser.add_argument("--datetime", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    df = make_wide_frame(args.rows, args.numeric, args.categorical, args.datetime)
+    print(f"Frame: {df.shape[0]} rows x {df.shape[1]} columns")
+
+    legacy_time, legacy = best_of(legacy_profile, df, args.repeat)
+    vector_time, vectorised = best_of(profile_dataframe, df, args.repeat)
+    check_equivalent(legacy, vectorised)
+
+    print(f"Legacy per-column loop: {legacy_time:.3f}s")
+    print(f"Vectorised profiler:    {vector_time:.3f}s")
+    print(f"Speedup:                {legacy_time / vector_time:.1f}x")
+
+    if args.workers > 1:
+        parallel_time, parallel = best_of(
+            lambda frame: profile_dataframe(frame, max_workers=args.workers), df, args.repeat
+        )
+        check_equivalent(legacy, parallel)
+        print(f"Parallel ({args.workers} workers): {parallel_time:.3f}s ({legacy_time / parallel_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,121 @@
 #Ingestion.py
 import pandas as pd
+import numpy as np
 from datetime import date
 from sqlalchemy import create_engine, Column, Integer, String, Text,DateTime, insert,text
+from psycopg2.extras import execute_values
 import json
 
+import hashlib
+import itertools
 import re
 import os
+import time
+
+from db_utils.Retrieval import quote_identifier, invalidate_dataset_cache, ROW_ID_COLUMN
+from db_utils.arrow_io import detect_file_format, ArrowSource, arrow_column_types, estimate_arrow_rows
+from db_utils.partitioning import plan_partitions
+from db_utils.profiler import profile_dataframe, StreamingProfiler, NumericAccumulator, MAX_DISTINCT_CATEGORIES
+from db_utils.sketches import DatasetSketcher, write_column_sketches, sketch_from_record
+from db_utils.pairwise import (
+    PairwiseProfiler,
+    PairwiseAccumulator,
+    GroupAggregator,
+    query_spearman,
+    spearman_from_frame,
+    write_pairwise_stats
+)
+from db_utils.type_inference import (
+    infer_column_types,
+    infer_and_apply_column_types,
+    apply_column_types,
+    column_definitions_sql,
+    column_type_from_sql
+)
+
+# Rows serialised per CSV block while streaming a COPY
+COPY_CHUNK_ROWS = 50_000
+
+# Rows read up front to infer the table schema in streaming mode
+SCHEMA_SAMPLE_ROWS = 10_000
+
+# Rows read per chunk when appending to an existing dataset
+APPEND_CHUNK_ROWS = 100_000
+
+# Bytes read per step when fingerprinting an upload
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Aggregates per SELECT when PostgreSQL computes medians and distinct counts
+# (a SELECT list holds at most 1664 entries)
+STATS_PER_QUERY = 1000
+
+
+class IngestionCancelled(Exception):
+    """Raised from a progress callback to abort ingestion and roll back."""
+
+
+def is_file_like(source):
+    return hasattr(source, "read")
+
+
+def rewind(source):
+    """Seek a file-like source back to its start (paths are left alone)."""
+    if is_file_like(source):
+        source.seek(0)
+
+
+def source_size(source):
+    """Size in bytes of a path or a seekable file-like object."""
+    if not is_file_like(source):
+        return os.path.getsize(source)
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+
+def estimate_row_count(source, file_format=None, sample_bytes=1024 * 1024):
+    """Row count from the footer of Parquet/Arrow files, or a rough CSV
+    estimate from the newline density of the first megabyte."""
+    if file_format is None:
+        file_format = detect_file_format(source)
+    if file_format != "csv":
+        return estimate_arrow_rows(source, file_format)
+
+    try:
+        size = source_size(source)
+        if is_file_like(source):
+            position = source.tell()
+            source.seek(0)
+            sample = source.read(sample_bytes)
+            source.seek(position)
+        else:
+            with open(source, "rb") as f:
+                sample = f.read(sample_bytes)
+    except OSError:
+        return None
+
+    lines = sample.count(b"\n")
+    if lines <= 1:
+        return None
+    if len(sample) >= size:
+        return max(lines - 1, 0)
+    return int(size / (len(sample) / lines)) - 1
+
+
+def compute_file_hash(source, chunk_bytes=HASH_CHUNK_BYTES):
+    """SHA-256 of a file's bytes (path or file-like), read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    if is_file_like(source):
+        rewind(source)
+        for block in iter(lambda: source.read(chunk_bytes), b""):
+            digest.update(block)
+        rewind(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(chunk_bytes), b""):
+                digest.update(block)
+    return digest.hexdigest()
 
 
 def make_param_name(col):
@@ -21,205 +131,903 @@ def map_dtype_to_sqltype(dtype):
         return "TIMESTAMP"
     else:
         return "TEXT"
-def ingest_dataset(csv_file_path, original_filename, user_id,engine):
-    """Ingest a CSV into:
+
+
+class _CsvBlockStream:
+    """Read-only file-like object that renders a DataFrame as CSV lazily.
+
+    psycopg2's copy_expert pulls data with read(size); only one block of
+    ``chunk_rows`` rows is materialised as text at a time.
+    """
+
+    def __init__(self, df, chunk_rows=COPY_CHUNK_ROWS, on_block=None, first_row_id=None):
+        self._df = df
+        self._chunk_rows = chunk_rows
+        self._next_row = 0
+        self._buffer = ""
+        self._on_block = on_block
+        self._first_row_id = first_row_id
+
+    def _fill(self):
+        if self._next_row >= len(self._df):
+            return False
+        if self._on_block is not None and self._next_row > 0:
+            self._on_block(self._next_row)
+        block = self._df.iloc[self._next_row:self._next_row + self._chunk_rows]
+        if self._first_row_id is None:
+            self._buffer += block.to_csv(index=False, header=False)
+        else:
+            # Row numbers are written as the leading index column
+            start = self._first_row_id + self._next_row
+            block = block.set_axis(pd.RangeIndex(start, start + len(block)), axis=0)
+            self._buffer += block.to_csv(index=True, header=False)
+        self._next_row += self._chunk_rows
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            data, self._buffer = self._buffer, ""
+            return data
+
+        while len(self._buffer) < size and self._fill():
+            pass
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while "\n" not in self._buffer and self._fill():
+            pass
+        end = self._buffer.find("\n")
+        end = len(self._buffer) if end == -1 else end + 1
+        if size is not None and 0 <= size < end:
+            end = size
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+
+def copy_dataframe_to_table(conn, df, table_name, chunk_rows=COPY_CHUNK_ROWS, progress_callback=None,
+                            first_row_id=None):
+    """Bulk-load a DataFrame into an existing table with COPY FROM STDIN.
+
+    Uses the DBAPI connection behind ``conn`` so the rows are written inside
+    the caller's transaction. progress_callback(rows_sent) is called as each
+    block is handed to the server. With first_row_id set, rows are numbered
+    from it into ROW_ID_COLUMN. Returns the number of rows copied.
+    """
+
+    columns = [str(col) for col in df.columns]
+    if first_row_id is not None:
+        columns.insert(0, ROW_ID_COLUMN)
+    columns_sql = ", ".join(quote_identifier(col) for col in columns)
+    copy_sql = f"COPY {table_name} ({columns_sql}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, _CsvBlockStream(df, chunk_rows, progress_callback, first_row_id))
+    finally:
+        cursor.close()
+
+    return len(df)
+
+
+def _insert_dataset_metadata(conn, dataset_metadata):
+    """Insert the datasets_metadata row and set its table name.
+    Returns (dataset_id, table_name).
+    """
+
+    result = conn.execute(
+        text("""
+            INSERT INTO datasets_metadata 
+            (dataset_name, file_path, upload_date, num_rows,     num_columns, owner_user_id, column_names, file_hash)
+            VALUES 
+            (:dataset_name, :file_path, :upload_date, :num_rows, :num_columns, :owner_user_id, :column_names, :file_hash)
+            RETURNING dataset_id;
+        """),
+        {
+            "dataset_name": dataset_metadata["dataset_name"],
+            "file_path": dataset_metadata["file_path"],
+            "upload_date": dataset_metadata["upload_date"],
+            "num_rows": dataset_metadata["num_rows"],
+            "num_columns": dataset_metadata["num_columns"],
+            "owner_user_id": dataset_metadata["owner_user_id"],
+            "column_names":dataset_metadata["column_names"],
+            "file_hash": dataset_metadata.get("file_hash")
+        }
+    )
+
+    # Retrieving dataset_id and creating table name for dataset table
+
+    dataset_id = result.fetchone()[0]
+
+    print("Inserted dataset_id:", dataset_id)
+
+    # Build table_name based on dataset_id
+    table_name = f"dataset_{dataset_id}_data"
+
+    conn.execute(
+        text("""
+                    UPDATE datasets_metadata
+                    SET table_name = :table_name
+                    WHERE dataset_id = :dataset_id;
+                """),
+        {"table_name": table_name, "dataset_id": dataset_id}
+    )
+
+    print("Updated table name: ",table_name)
+
+    return dataset_id, table_name
+
+
+def legacy_column_types(df):
+    """Column types from map_dtype_to_sqltype, used when inference is off."""
+    return {
+        col: {"sql_type": map_dtype_to_sqltype(df[col].dtype), "kind": "legacy"}
+        for col in df.columns
+    }
+
+
+def _create_dataset_table(conn, table_name, column_types, partitioner=None):
+    """Create dataset_X_data (and any ENUM types it needs) from column_types.
+    Every table gets a leading ROW_ID_COLUMN holding the row number (the
+    key for keyset pagination). With a partitioner (see
+    partitioning.plan_partitions) the table is created partitioned."""
+
+    # Creating sql table column names based on dataset columns
+
+    type_statements, columns_sql = column_definitions_sql(table_name, column_types)
+
+    for statement in type_statements:
+        conn.execute(text(statement))
+
+    columns_sql = f"{ROW_ID_COLUMN} BIGINT NOT NULL, {columns_sql}"
+
+    partition_sql = ""
+    if partitioner is not None:
+        partition_sql = partitioner.partition_clause()
+
+    create_table_sql = f"""
+        CREATE TABLE {table_name} (
+            {columns_sql}
+        ) {partition_sql};
+    """
+
+    conn.execute(text(create_table_sql))
+
+    if partitioner is not None:
+        partitioner.create(conn)
+
+    print(f"Created table: {table_name}")
+
+
+def create_row_key_index(conn, table_name):
+    """Index ROW_ID_COLUMN once the rows are loaded (cheaper than maintaining
+    it during COPY). Not UNIQUE: a table range-partitioned on a datetime
+    column cannot have a unique index without that column."""
+
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {table_name}_row_id_idx ON {table_name} ({quote_identifier(ROW_ID_COLUMN)});"
+    ))
+
+
+def _query_median_and_distinct(conn, table_name, profiler):
+    """Median of every numeric column and distinct count of every column,
+    computed by PostgreSQL. Aggregates are batched STATS_PER_QUERY to a
+    SELECT (PostgreSQL allows 1664 entries in a SELECT list), so wide
+    tables take a few scans instead of failing."""
+
+    select_parts = []
+    numeric_cols = set(profiler.groups["Numerical"])
+    for idx, col in enumerate(profiler.columns):
+        quoted = quote_identifier(str(col))
+        select_parts.append(f"COUNT(DISTINCT {quoted}) AS u{idx}")
+        if col in numeric_cols:
+            if "bool" in profiler.dtypes[col]:
+                quoted = f"{quoted}::int"
+            select_parts.append(
+                f"percentile_cont(0.5) WITHIN GROUP (ORDER BY {quoted}) AS m{idx}"
+            )
+
+    row = {}
+    for start in range(0, len(select_parts), STATS_PER_QUERY):
+        batch = select_parts[start:start + STATS_PER_QUERY]
+        row.update(conn.execute(
+            text(f"SELECT {', '.join(batch)} FROM {table_name}")
+        ).mappings().fetchone())
+
+    medians = {col: row[f"m{idx}"] for idx, col in enumerate(profiler.columns) if col in numeric_cols}
+    unique_counts = {col: row[f"u{idx}"] for idx, col in enumerate(profiler.columns)}
+    return medians, unique_counts
+
+
+# dataset_column_details columns written at ingest, with the stats key for each
+COLUMN_DETAIL_FIELDS = [
+    ("dataset_id", "dataset_id"),
+    ("column_name", "column_name"),
+    ("pandas_dtype", "pandas_dtype"),
+    ("column_type", "col_type"),
+    ("mean", "mean"),
+    ("median", "median"),
+    ("std_dev", "std_dev"),
+    ("min_value", "min_value"),
+    ("max_value", "max_value"),
+    ("missing_values", "num_missing"),
+    ("unique_value_count", "unique_value_count"),
+    ("distinct_categories", "distinct_categories"),
+    ("min_datetime", "min_datetime"),
+    ("max_datetime", "max_datetime"),
+    ("sql_type", "sql_type")
+]
+
+
+def _insert_column_stats(conn, dataset_id, column_stats):
+    """Write all dataset_column_details rows in a single round trip.
+
+    Numerical, Categorical and Datetime rows share one column list (fields
+    that do not apply are NULL), so they go out as one multi-row INSERT.
+    """
+
+    if not column_stats:
+        return
+
+    columns_sql = ", ".join(column for column, _ in COLUMN_DETAIL_FIELDS)
+    rows = [
+        tuple(dataset_id if key == "dataset_id" else stats[key] for _, key in COLUMN_DETAIL_FIELDS)
+        for stats in column_stats
+    ]
+
+    cursor = conn.connection.cursor()
+    try:
+        execute_values(
+            cursor,
+            f"INSERT INTO dataset_column_details ({columns_sql}) VALUES %s",
+            rows,
+            page_size=len(rows)
+        )
+    finally:
+        cursor.close()
+
+
+def _stream_dtypes(sample):
+    """Chunk dtypes derived from the schema sample.
+
+    Integers and booleans use pandas' nullable dtypes so a missing value in a
+    later chunk does not change the column type mid-load. A column that is
+    empty throughout the sample says nothing about its type (pandas reads it
+    as float64), so it stays object and later chunks may hold any values.
+    """
+
+    dtypes = {}
+    for col in sample.columns:
+        dtype = sample[col].dtype
+        if sample[col].isna().all():
+            dtypes[col] = "object"
+        elif pd.api.types.is_bool_dtype(dtype):
+            dtypes[col] = "boolean"
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtypes[col] = "Int64"
+        elif pd.api.types.is_float_dtype(dtype):
+            dtypes[col] = "float64"
+        else:
+            dtypes[col] = "object"
+    return dtypes
+
+
+def ingest_dataset(csv_file_path, original_filename, user_id,engine, load_method="copy",
+                   chunksize=None, sample_rows=SCHEMA_SAMPLE_ROWS, profile_workers=None,
+                   infer_types=True, encode_categoricals=False, progress_callback=None, file_hash=None,
+                   file_format=None, partition_rows=None, partition_method="range"):
+    """Ingest a CSV, Parquet or Arrow IPC/Feather file into:
         - datasets_metadata
         - dynamically generated dataset_X_data table
         - dataset_column_details
+    - dataset_column_sketches, dataset_correlations, dataset_group_aggregates
     Wrapped in a single ACID transaction.
+
+    load_method selects how rows reach dataset_X_data:
+        - "copy": stream the frame with COPY FROM STDIN (default)
+        - "multi": legacy multi-row INSERT via df.to_sql
+    The result reports load_seconds and rows_per_sec for the chosen path.
+
+    When chunksize is set the CSV is streamed instead of read whole: the
+    schema is inferred from the first sample_rows rows, each chunk is COPYed
+    as it is read and column stats are accumulated across chunks, so memory
+    use does not grow with file size.
+
+    profile_workers > 1 profiles columns across that many processes
+    (in-memory mode only); the stats are identical to the serial path.
+
+    infer_types picks the narrowest PostgreSQL type per column (see
+    type_inference) and parses date/time text into DATE/TIMESTAMP; with
+    infer_types=False the legacy map_dtype_to_sqltype mapping is used.
+    encode_categoricals additionally stores low-cardinality text as ENUM
+    types (in-memory mode only). The chosen type is recorded in
+    dataset_column_details.sql_type.
+
+    progress_callback(phase, rows_loaded) is called as ingestion moves
+    through parsing, creating table, loading, profiling and writing
+    metadata; raising IngestionCancelled from it rolls the whole
+    transaction back.
+
+    file_hash (see compute_file_hash) is stored with the metadata so later
+    uploads of the same bytes can reuse this dataset.
+
+    csv_file_path may also be a seekable binary file-like object (e.g. an
+    upload buffer); it is read in place instead of being copied first.
+
+    file_format is 'csv', 'parquet' or 'ipc' (detected from
+    original_filename when None). Parquet and Arrow files are memory-mapped
+    and always streamed record batch by record batch; the column types come
+    from the file's Arrow schema rather than being inferred.
+
+    partition_rows turns on declarative partitioning for datasets expected
+    to hold more rows than that: partition_method "range" partitions on the
+    first datetime column (or the row number when there is none), "hash"
+    on the row number, with partitions of about partition_rows rows (see
+    partitioning.TablePartitioner). Requires load_method='copy'.
     """
 
+    if load_method not in ("copy", "multi"):
+        raise ValueError(f"Unknown load_method: {load_method}")
+
+    if partition_rows and load_method != "copy":
+        raise ValueError("Partitioned ingestion requires load_method='copy'")
+
+    if file_format is None:
+        file_format = detect_file_format(original_filename)
+
+    streaming = chunksize is not None or file_format != "csv"
+
+    if streaming and load_method != "copy":
+        raise ValueError("Streaming ingestion requires load_method='copy'")
+
     ingestion_result = {
         "success": False,
         "dataset_id": None,
-        "error": None
+        "error": None,
+        "cancelled": False,
+        "load_method": load_method,
+        "file_format": file_format,
+        "load_seconds": None,
+        "rows_per_sec": None,
+        "partitioning": None
     }
 
+    def report(phase, rows_loaded=0):
+        if progress_callback is not None:
+            progress_callback(phase, rows_loaded)
+
     # Reading csv file
 
-    df = pd.read_csv(csv_file_path)
-
-    dataset_metadata_table = "datasets_metadata"
-
-    # Extracting important Information
-    df_name = os.path.splitext(original_filename)[0]
-    num_rows = df.shape[0]
-    num_cols = df.shape[1]
-    upload_date = date.today()
-    file_path = original_filename
-    column_names = df.columns.tolist()
-
-    dataset_metadata = {
-        "dataset_name": df_name,
-        "file_path": file_path,
-        "upload_date": upload_date,
-        "num_rows": num_rows,
-        "num_columns": num_cols,
-        "owner_user_id": user_id,
-        "column_names":column_names
-    }
+    report("parsing")
 
-# Postgres connection and inserting into datasets_metadata table
+    source = None
 
+    # Reading errors (a corrupt or empty file) are reported like load errors,
+    # and the source is closed by the finally below
     try:
+        if file_format != "csv":
+            source = ArrowSource(csv_file_path, file_format)
+            column_types = arrow_column_types(source.schema)
+            frames = source.iter_frames(column_types)
+            df = next(frames, None)
+            if df is None:
+                raise ValueError(f"{original_filename} contains no readable record batches")
+            chunks = itertools.chain([df], frames)
+        elif chunksize is None:
+            rewind(csv_file_path)
+            df = pd.read_csv(csv_file_path)
+            if infer_types:
+                df, column_types = infer_and_apply_column_types(df, encode_categoricals=encode_categoricals)
+            else:
+                column_types = legacy_column_types(df)
+        else:
+            rewind(csv_file_path)
+            df = pd.read_csv(csv_file_path, nrows=sample_rows)
+            dtypes = _stream_dtypes(df)
+            df = df.astype(dtypes)
+            if infer_types:
+                column_types = infer_column_types(df, streaming=True)
+            else:
+                column_types = legacy_column_types(df)
+            df = apply_column_types(df, column_types)
+            rewind(csv_file_path)
+            chunks = (
+                apply_column_types(chunk, column_types)
+                for chunk in pd.read_csv(csv_file_path, chunksize=chunksize, dtype=dtypes)
+            )
+
+        # Extracting important Information
+        df_name = os.path.splitext(original_filename)[0]
+        num_rows = df.shape[0]
+        num_cols = df.shape[1]
+        upload_date = date.today()
+        file_path = original_filename
+        column_names = df.columns.tolist()
+
+        if not streaming:
+            estimated_rows = num_rows
+        elif file_format != "csv":
+            estimated_rows = source.num_rows
+        else:
+            estimated_rows = estimate_row_count(csv_file_path, "csv") if partition_rows else None
+
+        dataset_metadata = {
+            "dataset_name": df_name,
+            "file_path": file_path,
+            "upload_date": upload_date,
+            "num_rows": num_rows,
+            "num_columns": num_cols,
+            "owner_user_id": user_id,
+            "column_names":column_names,
+            "file_hash": file_hash
+        }
+
+        # Postgres connection and inserting into datasets_metadata table
+
         with engine.begin() as conn:
 
             print("Connected (transaction started)")
 
+            report("creating table")
+
             # Inserting into datasets_metadata
 
-            result = conn.execute(
-                text("""
-                    INSERT INTO datasets_metadata 
-                    (dataset_name, file_path, upload_date, num_rows,     num_columns, owner_user_id, column_names)
-                    VALUES 
-                    (:dataset_name, :file_path, :upload_date, :num_rows, :num_columns, :owner_user_id, :column_names)
-                    RETURNING dataset_id;
-                """),
-                {
-                    "dataset_name": dataset_metadata["dataset_name"],
-                    "file_path": dataset_metadata["file_path"],
-                    "upload_date": dataset_metadata["upload_date"],
-                    "num_rows": dataset_metadata["num_rows"],
-                    "num_columns": dataset_metadata["num_columns"],
-                    "owner_user_id": dataset_metadata["owner_user_id"],
-                    "column_names":dataset_metadata["column_names"]
-                }
-            )
+            dataset_id, table_name = _insert_dataset_metadata(conn, dataset_metadata)
 
-            # Retrieving dataset_id and creating table name for dataset table
+            ingestion_result["dataset_id"] = dataset_id # Storing current dataset_id in global ingestion_result
 
-            dataset_id = result.fetchone()[0]
+            # Creating dataset table
 
-            ingestion_result["dataset_id"] = dataset_id # Storing current dataset_id in global ingestion_result
+            partitioner = plan_partitions(table_name, column_types, df, estimated_rows,
+                                          partition_rows, partition_method)
+            _create_dataset_table(conn, table_name, column_types, partitioner)
 
-            print("Inserted dataset_id:", dataset_id)
+            if partitioner is not None:
+                ingestion_result["partitioning"] = {"method": partitioner.method, "key": partitioner.key}
 
-            # Build table_name based on dataset_id
-            table_name = f"dataset_{dataset_id}_data"
+            # Insert DataFrame rows into table
 
-            # Creating dataset table
+            load_start = time.perf_counter()
+            report("loading")
 
-            conn.execute(
+            if streaming:
+                profiler = StreamingProfiler(df)
+                sketcher = DatasetSketcher(df)
+                pairwise = PairwiseProfiler(df)
+                num_rows = 0
+                del df
+
+                for chunk in chunks:
+                    if partitioner is not None:
+                        partitioner.prepare(conn, chunk, num_rows + 1)
+                    copy_dataframe_to_table(conn, chunk, table_name, first_row_id=num_rows + 1)
+                    profiler.update(chunk)
+                    sketcher.update(chunk)
+                    pairwise.update(chunk)
+                    num_rows += len(chunk)
+                    report("loading", num_rows)
+                    print(f"Streamed {num_rows} rows into {table_name}")
+
+                conn.execute(
+                    text("""
+                        UPDATE datasets_metadata
+                        SET num_rows = :num_rows
+                        WHERE dataset_id = :dataset_id;
+                    """),
+                    {"num_rows": num_rows, "dataset_id": dataset_id}
+                )
+
+            elif load_method == "copy":
+                if partitioner is not None:
+                    partitioner.prepare(conn, df, 1)
+                copy_dataframe_to_table(conn, df, table_name,
+                                        progress_callback=lambda rows: report("loading", rows),
+                                        first_row_id=1)
+            else:
+                # The index carries the row numbers into ROW_ID_COLUMN
+                df.set_axis(pd.RangeIndex(1, len(df) + 1), axis=0).to_sql(
+                    table_name,
+                    conn,
+                    if_exists="append",
+                    index=True,
+                    index_label=ROW_ID_COLUMN,
+                    method="multi"
+                )
+
+            create_row_key_index(conn, table_name)
+
+            load_seconds = time.perf_counter() - load_start
+            ingestion_result["load_seconds"] = load_seconds
+            ingestion_result["rows_per_sec"] = num_rows / load_seconds if load_seconds > 0 else None
+
+            print(f"Insertion into {table_name} - complete ({load_method}, {num_rows} rows in {load_seconds:.2f}s)")
+
+            # Calculating stats based on column type
+
+            report("profiling", num_rows)
+
+            if streaming:
+                medians, unique_counts = _query_median_and_distinct(conn, table_name, profiler)
+                column_stats = profiler.column_stats(medians, unique_counts)
+                spearman = query_spearman(conn, table_name, pairwise.numeric_columns)
+            else:
+                column_stats = profile_dataframe(df, max_workers=profile_workers)
+                sketcher = DatasetSketcher(df)
+                sketcher.update(df)
+                pairwise = PairwiseProfiler(df)
+                pairwise.update(df)
+                spearman = spearman_from_frame(df, pairwise.numeric_columns)
+
+            for stats in column_stats:
+                stats["sql_type"] = column_types[stats["column_name"]]["sql_type"]
+
+            report("writing metadata", num_rows)
+
+            _insert_column_stats(conn, dataset_id, column_stats)
+            write_column_sketches(conn, dataset_id, sketcher)
+            write_pairwise_stats(conn, dataset_id, 1, pairwise, spearman)
+
+        ingestion_result["success"] = True
+
+    except Exception as e:
+        ingestion_result["error"] = str(e)
+        ingestion_result["cancelled"] = isinstance(e, IngestionCancelled)
+
+    finally:
+        if source is not None:
+            source.close()
+
+    return ingestion_result
+
+def table_column_types(conn, table_name):
+    """column_types of an existing dataset table, read from the catalog."""
+
+    rows = conn.execute(
+        text("""
+            SELECT
+                a.attname AS column_name,
+                format_type(a.atttypid, a.atttypmod) AS sql_type,
+                ARRAY(
+                    SELECT e.enumlabel
+                    FROM pg_enum e
+                    WHERE e.enumtypid = a.atttypid
+                    ORDER BY e.enumsortorder
+                ) AS enum_labels
+            FROM pg_attribute a
+            WHERE a.attrelid = CAST(:table_name AS regclass)
+              AND a.attnum > 0
+              AND NOT a.attisdropped
+            ORDER BY a.attnum;
+        """),
+        {"table_name": table_name}
+    ).fetchall()
+
+    return {row.column_name: column_type_from_sql(row.sql_type, row.enum_labels) for row in rows}
+
+
+def _append_read_dtypes(column_types):
+    """read_csv dtypes that keep appended values in the table's column types.
+    Integer columns are left to pandas so apply_column_types can range-check them."""
+
+    dtypes = {}
+    for col, col_type in column_types.items():
+        if col_type["kind"] == "float":
+            dtypes[col] = "float64"
+        elif col_type["kind"] == "bool":
+            dtypes[col] = "boolean"
+        elif col_type["kind"] != "int":
+            dtypes[col] = "object"
+    return dtypes
+
+
+def _stored_numeric_accumulator(details, columns, num_rows):
+    """NumericAccumulator rebuilt from stored mean/std/min/max/missing."""
+
+    acc = NumericAccumulator(len(columns))
+    for i, col in enumerate(columns):
+        row = details[col]
+        missing = row["missing_values"] or 0
+        count = max(num_rows - missing, 0)
+        acc.count[i] = count
+        acc.missing[i] = missing
+        acc.mean[i] = row["mean"] if count and row["mean"] is not None else 0.0
+        acc.m2[i] = row["std_dev"] ** 2 * (count - 1) if count > 1 and row["std_dev"] is not None else 0.0
+        acc.min[i] = np.nan if row["min_value"] is None else row["min_value"]
+        acc.max[i] = np.nan if row["max_value"] is None else row["max_value"]
+    return acc
+
+
+def _merge_column_stats(details, num_rows, profiler, sketches):
+    """Combine stored dataset_column_details rows with the appended rows' profile.
+
+    Count, mean, std, min/max, missing values, categories and datetime ranges
+    merge exactly. Median and distinct count are not mergeable: they come from
+    the merged quantile and HyperLogLog sketches (the stored values are kept
+    for columns without sketches).
+    """
+
+    numeric_cols = profiler.groups["Numerical"]
+    merged = _stored_numeric_accumulator(details, numeric_cols, num_rows).merge(profiler.numeric)
+    means, stds = merged.means(), merged.std()
+
+    column_stats = []
+    for col in profiler.columns:
+        row = details[col]
+        stats = {key: row[column] for column, key in COLUMN_DETAIL_FIELDS if column != "dataset_id"}
+        sketch = sketches.get(col)
+
+        if sketch is not None:
+            estimate = min(int(round(sketch.hll.estimate())), sketch.count)
+            stats["unique_value_count"] = max(row["unique_value_count"] or 0, estimate)
+
+        if col in numeric_cols:
+            i = numeric_cols.index(col)
+            stats.update({
+                "mean": float(means[i]),
+                "std_dev": float(stds[i]),
+                "min_value": float(merged.min[i]),
+                "max_value": float(merged.max[i]),
+                "num_missing": int(merged.missing[i])
+            })
+            if sketch is not None and sketch.quantiles.n:
+                stats["median"] = float(sketch.quantiles.quantiles([0.5])[0])
+
+        elif col in profiler.groups["Categorical"]:
+            seen = list(row["distinct_categories"] or [])
+            new = json.loads(json.dumps(profiler.categories[col], default=str))
+            seen += [value for value in new if value not in seen]
+            stats["num_missing"] = (row["missing_values"] or 0) + profiler.missing[col]
+            stats["distinct_categories"] = json.dumps(seen[:MAX_DISTINCT_CATEGORIES])
+
+        else:
+            low, high = profiler.datetime_range[col]
+            stats["num_missing"] = (row["missing_values"] or 0) + profiler.missing[col]
+            if low is not None:
+                stats["min_datetime"] = min(pd.Timestamp(row["min_datetime"] or pd.Timestamp.max), pd.Timestamp(low))
+                stats["max_datetime"] = max(pd.Timestamp(row["max_datetime"] or pd.Timestamp.min), pd.Timestamp(high))
+
+        for key in ("mean", "median", "std_dev", "min_value", "max_value"):
+            if stats[key] is not None and np.isnan(stats[key]):
+                stats[key] = None
+
+        column_stats.append(stats)
+
+    return column_stats
+
+
+def _load_pairwise_state(conn, dataset_id, dataset_version, pairwise):
+    """Stored pairwise accumulators for the current version, or None if stale,
+    missing or unreadable.
+
+    The appended rows are accumulated against the stored shift so the two
+    accumulators can be merged.
+    """
+
+    record = conn.execute(
+        text("""
+            SELECT column_names, accumulator
+            FROM dataset_correlations
+            WHERE dataset_id = :dataset_id
+              AND dataset_version = :dataset_version;
+        """),
+        {"dataset_id": dataset_id, "dataset_version": dataset_version}
+    ).fetchone()
+
+    if record is None or record.accumulator is None or list(record.column_names) != pairwise.numeric_columns:
+        return None
+
+    try:
+        stored = PairwiseAccumulator.from_bytes(pairwise.numeric_columns, bytes(record.accumulator))
+    except ValueError:
+        return None
+
+    groups = GroupAggregator(pairwise.groups.group_columns, pairwise.groups.value_columns)
+    groups.overflow = set(groups.group_columns)
+    for row in conn.execute(
+        text("""
+            SELECT group_column, aggregates
+            FROM dataset_group_aggregates
+            WHERE dataset_id = :dataset_id
+              AND dataset_version = :dataset_version;
+        """),
+        {"dataset_id": dataset_id, "dataset_version": dataset_version}
+    ):
+        if row.group_column in groups.overflow:
+            groups.overflow.discard(row.group_column)
+            groups.state[row.group_column] = GroupAggregator.from_aggregates(
+                row.group_column, groups.value_columns, row.aggregates
+            ).state[row.group_column]
+
+    pairwise.correlation = PairwiseAccumulator(stored.columns, stored.shift)
+    return stored, groups
+
+
+def append_to_dataset(dataset_id, csv_file_path, engine, chunksize=APPEND_CHUNK_ROWS, progress_callback=None):
+    """Append the rows of a CSV to an existing dataset without reprocessing it.
+
+    The CSV must have the table's columns (in any order) and its values must
+    fit the existing column types; anything else raises before a row is
+    written. Rows are COPYed into dataset_X_data chunk by chunk while the
+    appended rows are profiled, and the stored column stats, sketches,
+    correlation matrices and group aggregates are merged with the new rows'
+    accumulators, so old rows are never rescanned. The Spearman matrix
+    cannot be merged and is left stale (recomputed on first read).
+
+    num_rows and dataset_version are updated and computed_at is bumped on
+    every stats row, all in one transaction. Datasets shared by several
+    projects (ref_count > 1) cannot be appended to. The stored file_hash is
+    cleared since the table no longer matches the uploaded file.
+
+    progress_callback(phase, rows_appended) behaves as in ingest_dataset.
+    """
+
+    append_result = {
+        "success": False,
+        "dataset_id": dataset_id,
+        "error": None,
+        "cancelled": False,
+        "rows_appended": 0,
+        "num_rows": None,
+        "dataset_version": None,
+        "load_seconds": None,
+        "rows_per_sec": None
+    }
+
+    def report(phase, rows_appended=0):
+        if progress_callback is not None:
+            progress_callback(phase, rows_appended)
+
+    try:
+        with engine.begin() as conn:
+            dataset = conn.execute(
                 text("""
-                            UPDATE datasets_metadata
-                            SET table_name = :table_name
-                            WHERE dataset_id = :dataset_id;
-                        """),
-                {"table_name": table_name, "dataset_id": dataset_id}
+                    SELECT table_name, num_rows, ref_count, dataset_version
+                    FROM datasets_metadata
+                    WHERE dataset_id = :dataset_id
+                    FOR UPDATE;
+                """),
+                {"dataset_id": dataset_id}
+            ).fetchone()
+
+            if dataset is None:
+                raise ValueError("Dataset not found")
+            if dataset.ref_count > 1:
+                raise ValueError("Dataset is shared by several projects and cannot be appended to")
+
+            # Schema check: same columns as the table, values must fit its types
+
+            report("parsing")
+
+            column_types = table_column_types(conn, dataset.table_name)
+            numbered = column_types.pop(ROW_ID_COLUMN, None) is not None
+
+            rewind(csv_file_path)
+            header = pd.read_csv(csv_file_path, nrows=0).columns.tolist()
+            missing = [col for col in column_types if col not in header]
+            extra = [col for col in header if col not in column_types]
+            if missing or extra:
+                raise ValueError(f"CSV columns do not match the dataset (missing: {missing}, unexpected: {extra})")
+
+            rewind(csv_file_path)
+            chunks = (
+                apply_column_types(chunk[list(column_types)], column_types)
+                for chunk in pd.read_csv(csv_file_path, chunksize=chunksize, dtype=_append_read_dtypes(column_types))
             )
+            first = next(chunks, None)
+            if first is None or first.empty:
+                append_result.update({"success": True, "num_rows": dataset.num_rows,
+                                      "dataset_version": dataset.dataset_version})
+                return append_result
 
-            print("Updated table name: ",table_name)
+            details = {
+                row["column_name"]: row
+                for row in conn.execute(
+                    text("SELECT * FROM dataset_column_details WHERE dataset_id = :dataset_id;"),
+                    {"dataset_id": dataset_id}
+                ).mappings()
+            }
 
-            column_definitions = []
+            profiler = StreamingProfiler(first)
+            for column_type, cols in profiler.groups.items():
+                for col in cols:
+                    if details[col]["column_type"] != column_type:
+                        raise ValueError(f"Column {col!r} is {column_type} in the new rows "
+                                         f"but {details[col]['column_type']} in the dataset")
 
-            # Creating sql table column names based on dataset columns
+            sketcher = DatasetSketcher(first)
+            pairwise = PairwiseProfiler(first)
+            pairwise_state = _load_pairwise_state(conn, dataset_id, dataset.dataset_version, pairwise)
 
-            for col in df.columns:
-                sql_type = map_dtype_to_sqltype(df[col].dtype)
-                safe_col = f'"{col}"'  # Quote column names to allow spaces, caps, etc.
-                column_definitions.append(f"{safe_col} {sql_type}")
+            # Load and profile the new rows
 
-            columns_sql = ", ".join(column_definitions)
+            load_start = time.perf_counter()
+            rows_appended = 0
+            report("loading")
 
-            create_table_sql = f"""
-                CREATE TABLE {table_name} (
-                    {columns_sql}
-                );
-            """
+            for chunk in itertools.chain([first], chunks):
+                # Rows outside the existing range partitions go to the DEFAULT partition
+                first_row_id = dataset.num_rows + rows_appended + 1 if numbered else None
+                copy_dataframe_to_table(conn, chunk, dataset.table_name, first_row_id=first_row_id)
+                profiler.update(chunk)
+                sketcher.update(chunk)
+                pairwise.update(chunk)
+                rows_appended += len(chunk)
+                report("loading", rows_appended)
 
-            conn.execute(text(create_table_sql))
+            load_seconds = time.perf_counter() - load_start
 
-            print(f"Created table: {table_name}")
+            # Merge the new rows' accumulators into the stored ones
 
-            # Insert DataFrame rows into table
+            report("profiling", rows_appended)
+
+            stored_sketches = {
+                record["column_name"]: sketch_from_record(record)
+                for record in conn.execute(
+                    text("SELECT * FROM dataset_column_sketches WHERE dataset_id = :dataset_id;"),
+                    {"dataset_id": dataset_id}
+                ).mappings()
+            }
+            for col, sketch in stored_sketches.items():
+                if col in sketcher.sketches and sketch.kind == sketcher.sketches[col].kind:
+                    sketch.merge(sketcher.sketches[col])
+                    sketcher.sketches[col] = sketch
+            merged_sketches = {col: sketcher.sketches[col] for col in stored_sketches if col in sketcher.sketches}
+
+            column_stats = _merge_column_stats(details, dataset.num_rows, profiler, merged_sketches)
 
-            df.to_sql(
-                table_name,
-                conn,
-                if_exists="append",
-                index=False,
-                method="multi"
+            num_rows = dataset.num_rows + rows_appended
+            dataset_version = dataset.dataset_version + 1
+
+            report("writing metadata", rows_appended)
+
+            conn.execute(
+                text("""
+                    UPDATE datasets_metadata
+                    SET num_rows = :num_rows,
+                        dataset_version = :dataset_version,
+                        file_hash = NULL
+                    WHERE dataset_id = :dataset_id;
+                """),
+                {"num_rows": num_rows, "dataset_version": dataset_version, "dataset_id": dataset_id}
             )
 
-            print(f"Insertion into {table_name} - complete")
+            conn.execute(
+                text("DELETE FROM dataset_column_details WHERE dataset_id = :dataset_id;"),
+                {"dataset_id": dataset_id}
+            )
+            _insert_column_stats(conn, dataset_id, column_stats)
 
-            # Calculating stats based on column type
+            # Columns without stored sketches (datasets loaded before sketches
+            # existed) would only describe the new rows, so none are written
+            if len(merged_sketches) == len(sketcher.columns):
+                write_column_sketches(conn, dataset_id, sketcher)
 
-            for col in df.columns:
-                column_name = col
-                pandas_dtype = str(df[col].dtype)
-                num_missing = int(df[col].isnull().sum())
-                unique_values_count = int(df[col].nunique(dropna=True))
-                mean = median = std_dev = min_value = max_value = None
-                distinct_categories = None
-                min_datetime = max_datetime = None
-
-                if pd.api.types.is_numeric_dtype(df[col]):
-                    col_type = "Numerical"
-                    mean = float(df[col].mean())
-                    median = float(df[col].median())
-                    std_dev = float(df[col].std())
-                    min_value = float(df[col].min(skipna=True))
-                    max_value = float(df[col].max(skipna=True))
-
-                    sql = text("""
-                        Insert into dataset_column_details (dataset_id,column_name,pandas_dtype,column_type,mean,median,std_dev,min_value,
-                        max_value,missing_values,unique_value_count) VALUES(:dataset_id, :column_name, :pandas_dtype, :col_type,
-                         :mean, :median, :std_dev, :min_value, :max_value, :num_missing, :unique_value_count);
-                         """)
-
-                elif pd.api.types.is_object_dtype(df[col]):
-                    col_type = "Categorical"
-                    if unique_values_count > 30:
-                        distinct_categories = df[col].dropna().unique().tolist()[:30]
-                    else:
-                        distinct_categories = df[col].dropna().unique().tolist()
-                    distinct_categories = json.dumps(distinct_categories)
-
-                    sql = text(""" Insert into dataset_column_details (dataset_id,column_name,pandas_dtype,column_type,
-                    missing_values,unique_value_count,distinct_categories) VALUES(:dataset_id, :column_name, :pandas_dtype, :col_type,
-                                         :num_missing, :unique_value_count, :distinct_categories);
-                                         """)
-
-                elif pd.api.types.is_datetime64_any_dtype(df[col]):
-                    col_type = "Datetime"
-                    min_datetime = df[col].min()
-                    max_datetime = df[col].max()
-
-                    sql = text("""
-                                Insert into dataset_column_details (dataset_id,column_name,pandas_dtype,column_type,min_datetime,
-                                max_datetime,missing_values,unique_value_count) VALUES(:dataset_id, :column_name, :pandas_dtype, :col_type,
-                                 :min_datetime, :max_datetime, :num_missing, :unique_value_count);
-                                 """)
-
-                # Creating dataset_column_details table
-
-                conn.execute(sql,
-                    {"dataset_id": dataset_id,
-                        "column_name": column_name,
-                        "pandas_dtype": pandas_dtype,
-                        "col_type": col_type,
-                        "mean": mean,
-                        "median": median,
-                        "std_dev": std_dev,
-                        "min_value": min_value,
-                        "max_value": max_value,
-                        "num_missing": num_missing,
-                        "unique_value_count": unique_values_count,
-                        "distinct_categories":distinct_categories,
-                        "min_datetime":min_datetime,
-                        "max_datetime":max_datetime
-
-                    }
-                )
+            if pairwise_state is not None:
+                stored, groups = pairwise_state
+                stored.merge(pairwise.correlation)
+                groups.merge(pairwise.groups)
+                pairwise.correlation, pairwise.groups = stored, groups
+                write_pairwise_stats(conn, dataset_id, dataset_version, pairwise, None)
 
-        ingestion_result["success"] = True
+        # num_rows and the column stats changed
+        invalidate_dataset_cache(dataset_id)
+
+        append_result.update({
+            "success": True,
+            "rows_appended": rows_appended,
+            "num_rows": num_rows,
+            "dataset_version": dataset_version,
+            "load_seconds": load_seconds,
+            "rows_per_sec": rows_appended / load_seconds if load_seconds > 0 else None
+        })
 
     except Exception as e:
-        ingestion_result["error"] = str(e)
+        append_result["error"] = str(e)
+        append_result["cancelled"] = isinstance(e, IngestionCancelled)
 
-    return ingestion_result
+    return append_result
 
 #ingestion_output = ingest_dataset(csv_path,userid,engine)
 
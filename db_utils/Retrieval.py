@@ -3,13 +3,172 @@ import pandas as pd
 from datetime import date
 from sqlalchemy import create_engine, Column, Integer, String, Text,DateTime, insert,text
 import json
+import base64
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from db_utils.db_config import (
+    get_metadata_cache_size,
+    get_metadata_version_ttl,
+    get_result_cache_bytes,
+    get_result_cache_dir,
+    get_result_cache_disk_bytes
+)
+from db_utils.result_cache import QueryResultCache
+from db_utils.arrow_fetch import read_sql_arrow
+from db_utils.sketches import sketch_from_record
+
+
+class MetadataCache:
+    """Process-wide LRU cache of per-dataset lookups, keyed by dataset_id.
+
+    Each entry holds the lookups made so far for one dataset ("metadata",
+    "columns", "table_name"); the least recently used dataset is evicted
+    past max_datasets. Values are deep-copied on the way out so callers
+    can modify what they get. Entries are tagged with the dataset_version
+    they were loaded at: a lookup made with a different version drops the
+    dataset's entry, so appends in other processes (job workers, other
+    servers) are seen as soon as the caller reads the new version. Callers
+    re-read the version at most every version_ttl seconds per dataset
+    (see version_is_fresh). Appends and deletes in this process also call
+    invalidate().
+    """
+
+    def __init__(self, max_datasets, version_ttl=0.0):
+        self.max_datasets = max_datasets
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _forget(self, dataset_id):
+        # Caller holds the lock
+        self._entries.pop(dataset_id, None)
+        self._versions.pop(dataset_id, None)
+        self._checked_at.pop(dataset_id, None)
+
+    def _check_version(self, dataset_id, version):
+        # Caller holds the lock
+        if version is None:
+            return
+        if self._versions.get(dataset_id, version) != version:
+            self._forget(dataset_id)
+        self._checked_at[dataset_id] = time.monotonic()
+
+    def version_is_fresh(self, dataset_id):
+        """True when the dataset's entry was checked against the database
+        within the last version_ttl seconds."""
+        with self._lock:
+            checked_at = self._checked_at.get(dataset_id)
+            return (
+                dataset_id in self._versions
+                and checked_at is not None
+                and time.monotonic() - checked_at < self.version_ttl
+            )
+
+    def get(self, dataset_id, kind, loader, version=None):
+        with self._lock:
+            self._check_version(dataset_id, version)
+            entry = self._entries.get(dataset_id)
+            if entry is not None and kind in entry:
+                self._entries.move_to_end(dataset_id)
+                self.hits += 1
+                return copy.deepcopy(entry[kind])
+            self.misses += 1
+
+        value = loader()
+        self.put(dataset_id, kind, value, version)
+        return copy.deepcopy(value)
+
+    def put(self, dataset_id, kind, value, version=None):
+        if self.max_datasets <= 0:
+            return
+        with self._lock:
+            self._check_version(dataset_id, version)
+            self._entries.setdefault(dataset_id, {})[kind] = copy.deepcopy(value)
+            self._entries.move_to_end(dataset_id)
+            if version is not None:
+                self._versions[dataset_id] = version
+            while len(self._entries) > self.max_datasets:
+                evicted, _ = self._entries.popitem(last=False)
+                self._versions.pop(evicted, None)
+                self._checked_at.pop(evicted, None)
+
+    def invalidate(self, dataset_id=None):
+        """Forget one dataset, or everything when dataset_id is None."""
+        with self._lock:
+            if dataset_id is None:
+                self._entries.clear()
+                self._versions.clear()
+                self._checked_at.clear()
+            else:
+                self._forget(dataset_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "datasets": len(self._entries),
+                "max_datasets": self.max_datasets
+            }
+
+
+_metadata_cache = MetadataCache(get_metadata_cache_size(), get_metadata_version_ttl())
+_result_cache = QueryResultCache(get_result_cache_bytes(), get_result_cache_dir(), get_result_cache_disk_bytes())
+
+def invalidate_dataset_cache(dataset_id=None):
+    """Drop cached lookups and query results for a dataset whose data or
+    metadata changed (or for all datasets)."""
+    _metadata_cache.invalidate(dataset_id)
+    _result_cache.invalidate(dataset_id)
+
+def get_metadata_cache_stats():
+    """Hit/miss counters and size of the dataset metadata cache."""
+    return _metadata_cache.stats()
+
+def get_result_cache_stats():
+    """Hit/miss counters and bytes held by the query result cache (memory and disk)."""
+    return _result_cache.stats()
+
+def _current_version(dataset_id, engine):
+    """dataset_version as committed in datasets_metadata (None when the
+    dataset does not exist). Never cached: appends run in other processes."""
+
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT dataset_version FROM datasets_metadata WHERE dataset_id = :dataset_id;"),
+            {"dataset_id": dataset_id}
+        ).scalar()
+
+def _cached_lookup(dataset_id, engine, kind, loader):
+    """A MetadataCache lookup checked against the committed dataset_version,
+    at most once per METADATA_VERSION_TTL seconds for each dataset."""
+
+    version = None
+    if not _metadata_cache.version_is_fresh(dataset_id):
+        version = _current_version(dataset_id, engine)
+        if version is None:
+            _metadata_cache.invalidate(dataset_id)
+    return _metadata_cache.get(dataset_id, kind, loader, version)
 
 def get_dataset_metadata(dataset_id,engine):
     """
-    Fetch metadata for a given dataset_id.
+    Fetch metadata for a given dataset_id (cached, see MetadataCache).
     Returns a dict or None if dataset does not exist.
     """
 
+    return _cached_lookup(dataset_id, engine, "metadata", lambda: _load_dataset_metadata(dataset_id, engine))
+
+def _load_dataset_metadata(dataset_id,engine):
+
     query = text("""
           SELECT
               dataset_id,
@@ -20,7 +179,8 @@ def get_dataset_metadata(dataset_id,engine):
               upload_date,
               owner_user_id,
               file_path,
-              column_names
+              column_names,
+              dataset_version
           FROM datasets_metadata
           WHERE dataset_id = :dataset_id;
       """)
@@ -31,6 +191,9 @@ def get_dataset_metadata(dataset_id,engine):
             result = conn.execute(query, {"dataset_id": dataset_id})
             row = result.fetchone()
 
+            # The table name comes along, so get_dataframe needs no extra lookup
+            _metadata_cache.put(dataset_id, "table_name", row.table_name, row.dataset_version)
+
             return {
                 "dataset_id": row.dataset_id,
                 "dataset_name": row.dataset_name,
@@ -40,13 +203,19 @@ def get_dataset_metadata(dataset_id,engine):
                 "upload_date": row.upload_date,
                 "owner_user_id": row.owner_user_id,
                 "column_names":row.column_names,
-                "file_name":row.file_path
+                "file_name":row.file_path,
+                "dataset_version": row.dataset_version
             }
 
     except Exception as e:
         raise RuntimeError(f"Error in fetching data {e}")
 
 def get_column_details(dataset_id,engine):
+    """Column-level statistics of a dataset (cached, see MetadataCache)."""
+
+    return _cached_lookup(dataset_id, engine, "columns", lambda: _load_column_details(dataset_id, engine))
+
+def _load_column_details(dataset_id,engine):
 
     query = text("""
         SELECT
@@ -65,7 +234,8 @@ def get_column_details(dataset_id,engine):
 
             distinct_categories,
             min_datetime,
-            max_datetime
+            max_datetime,
+            sql_type
         FROM dataset_column_details
         WHERE dataset_id = :dataset_id
         ORDER BY column_name;
@@ -97,7 +267,8 @@ def get_column_details(dataset_id,engine):
 
                     "distinct_categories": row.distinct_categories,
                     "min_datetime": row.min_datetime,
-                    "max_datetime": row.max_datetime
+                    "max_datetime": row.max_datetime,
+                    "sql_type": row.sql_type
                 })
 
             return columns
@@ -106,6 +277,11 @@ def get_column_details(dataset_id,engine):
         raise RuntimeError(f"Failed to fetch column details: {e}")
 
 def get_table_name(dataset_id,engine):
+    """Name of the dataset_X_data table of a dataset (cached, see MetadataCache)."""
+
+    return _cached_lookup(dataset_id, engine, "table_name", lambda: _load_table_name(dataset_id, engine))
+
+def _load_table_name(dataset_id,engine):
 
     query = text("""
     SELECT dataset_id, table_name 
@@ -137,6 +313,9 @@ def normalize_column_name(col: str) -> str:
 
     return col
 
+# Row number column of every dataset table (not a dataset column); keyset pagination key
+ROW_ID_COLUMN = "_eda_row_id"
+
 def quote_identifier(col: str) -> str:
     # Escape embedded quotes for PostgreSQL
     escaped = col.replace('"', '""')
@@ -170,15 +349,15 @@ def normalize_columns(columns):
     if columns is None:
         return None
     return [col.strip().strip('"') for col in columns]
-def get_dataframe(dataset_id, engine, limit=100, columns=None, where_clause=None):
+# Rows per DataFrame yielded by iter_dataframe / stream_query
+STREAM_CHUNK_ROWS = 50_000
+
+def build_select_sql(table_name, limit=None, columns=None, where_clause=None):
+    """The SELECT get_dataframe runs against a dataset table."""
 
     where_clause = normalize_where_clause(where_clause)
     columns = normalize_columns(columns)
 
-    table_name = get_table_name(dataset_id, engine)
-    if table_name is None:
-        raise ValueError("Dataset not found")
-
     # Normalize + quote columns
     if columns:
         clean_columns = [normalize_column_name(c) for c in columns]
@@ -191,10 +370,447 @@ def get_dataframe(dataset_id, engine, limit=100, columns=None, where_clause=None
     if where_clause:
         sql += f" WHERE {where_clause}"
 
-    sql += f" LIMIT {int(limit)}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+
+    return sql
+
+def _dataframe_sql(dataset_id, engine, limit=None, columns=None, where_clause=None):
+    """(sql, dataset_version); the version comes from the metadata lookup,
+    checked against the database at most every METADATA_VERSION_TTL seconds."""
+
+    metadata = get_dataset_metadata(dataset_id, engine)
+    if metadata["table_name"] is None:
+        raise ValueError("Dataset not found")
+
+    return build_select_sql(metadata["table_name"], limit, columns, where_clause), metadata["dataset_version"]
+
+def cached_query(dataset_id, sql, engine, params=None, run=None, dataset_version=None, fetch="pandas"):
+    """
+    Result of a read-only query against a dataset, from the result cache
+    when the same (normalized) SQL and params were run on the current
+    dataset_version. On a miss run() computes the DataFrame (default:
+    pd.read_sql on engine) and the result is cached. Callers that already
+    read dataset_version in their own transaction pass it; otherwise it is
+    read from datasets_metadata (one primary-key lookup), never from the
+    per-process metadata cache, which can miss appends made elsewhere.
+    fetch names the path run() uses and is part of the cache key, so e.g.
+    get_dataframe never gets the Arrow-backed frame get_dataframe_arrow cached.
+    """
+
+    version = dataset_version
+    if version is None:
+        version = _current_version(dataset_id, engine)
+        if version is None:
+            raise ValueError("Dataset not found")
+    key = _result_cache.key(dataset_id, version, sql, params, fetch)
+
+    df = _result_cache.get(key)
+    if df is not None:
+        return df
+
+    if run is None:
+        def run():
+            with engine.connect() as conn:
+                return pd.read_sql(text(sql), conn, params=params)
+
+    df = run()
+    _result_cache.put(key, df)
+    return df
+
+def get_dataframe(dataset_id, engine, limit=100, columns=None, where_clause=None):
+
+    sql, version = _dataframe_sql(dataset_id, engine, limit, columns, where_clause)
+
+    try:
+        df = cached_query(dataset_id, sql, engine, dataset_version=version)
+        return df.drop(columns=ROW_ID_COLUMN, errors="ignore")
+    except Exception as e:
+        raise RuntimeError(f"SQL execution failed: {e}")
+
+def get_dataframe_arrow(dataset_id, engine, limit=100, columns=None, where_clause=None):
+    """
+    get_dataframe through the Arrow fetch path (see arrow_fetch): same rows,
+    but the columns are Arrow-backed dtypes and NULLs are pd.NA. Needs pyarrow.
+    """
+
+    sql, version = _dataframe_sql(dataset_id, engine, limit, columns, where_clause)
+
+    try:
+        df = cached_query(dataset_id, sql, engine, run=lambda: read_sql_arrow(sql, engine),
+                          dataset_version=version, fetch="arrow")
+        return df.drop(columns=ROW_ID_COLUMN, errors="ignore")
+    except Exception as e:
+        raise RuntimeError(f"SQL execution failed: {e}")
+
+def stream_query(conn, sql, chunk_rows=STREAM_CHUNK_ROWS, params=None):
+    """
+    Run sql on conn through a server-side cursor and yield DataFrames of up
+    to chunk_rows rows, so only one chunk is held in memory at a time.
+    ROW_ID_COLUMN is dropped like in get_dataframe. conn must stay open
+    (and in its transaction) until the generator is exhausted.
+    """
+
+    # yield_per implies stream_results (a named psycopg2 cursor) and caps the row
+    # buffer. Set on the statement: conn.execution_options() would change conn
+    # itself, and later statements on it would be wrapped in DECLARE ... CURSOR
+    chunks = pd.read_sql(
+        text(sql).execution_options(stream_results=True, yield_per=chunk_rows),
+        conn,
+        params=params,
+        chunksize=chunk_rows
+    )
+    for chunk in chunks:
+        yield chunk.drop(columns=ROW_ID_COLUMN, errors="ignore")
+
+def iter_dataframe(dataset_id, engine, chunk_rows=STREAM_CHUNK_ROWS, columns=None, where_clause=None, limit=None):
+    """
+    Streaming get_dataframe: yields the selected rows as DataFrames of up to
+    chunk_rows rows, in constant memory whatever the dataset size. limit is
+    optional here; without it the whole table is read.
+    """
+
+    sql, _ = _dataframe_sql(dataset_id, engine, limit, columns, where_clause)
 
     try:
         with engine.connect() as conn:
-            return pd.read_sql(text(sql), conn)
+            yield from stream_query(conn, sql, chunk_rows)
+    except Exception as e:
+        raise RuntimeError(f"SQL execution failed: {e}")
+
+# Default rows per page for get_page
+PAGE_SIZE = 50
+
+def encode_page_cursor(position):
+    """Opaque cursor token for a page position ({"after": row_id} or {"offset": n})."""
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+def decode_page_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if set(position) not in ({"after"}, {"offset"}):
+            raise ValueError
+        return {key: int(value) for key, value in position.items()}
+    except Exception:
+        raise ValueError("Invalid page cursor")
+
+def _has_row_key(dataset_id, engine, table_name):
+    query = text("""
+        SELECT EXISTS (
+            SELECT 1
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(:table_name)
+              AND attname = :column_name
+              AND NOT attisdropped
+        );
+    """)
+
+    def load():
+        with engine.connect() as conn:
+            return conn.execute(query, {"table_name": table_name, "column_name": ROW_ID_COLUMN}).scalar()
+
+    return _cached_lookup(dataset_id, engine, "row_key", load)
+
+def get_page(dataset_id, engine, page_size=PAGE_SIZE, cursor=None, columns=None, where_clause=None):
+    """
+    One page of a dataset in row order, by keyset pagination on ROW_ID_COLUMN:
+    the next page starts after the last row id seen, so it is an index range
+    scan however deep it is (no OFFSET). cursor is None for the first page,
+    then the "next_cursor" of the previous page.
+
+    Returns {"rows": DataFrame indexed by row number, "next_cursor": token
+    or None on the last page}. Tables created before every dataset had a
+    row key are paged with OFFSET instead.
+    """
+
+    position = decode_page_cursor(cursor) if cursor is not None else None
+    where_clause = normalize_where_clause(where_clause)
+    columns = normalize_columns(columns)
+
+    # The metadata lookup is checked against the committed dataset_version,
+    # which it then gives to cached_query
+    metadata = get_dataset_metadata(dataset_id, engine)
+    table_name = metadata["table_name"]
+    if table_name is None:
+        raise ValueError("Dataset not found")
+
+    if columns:
+        select_cols = ", ".join(quote_identifier(normalize_column_name(c)) for c in columns)
+    else:
+        select_cols = "*"
+
+    row_key = quote_identifier(ROW_ID_COLUMN)
+    keyset = _has_row_key(dataset_id, engine, table_name)
+    params = {"limit": int(page_size) + 1}
+
+    if keyset:
+        if columns:
+            select_cols = f"{row_key}, {select_cols}"
+        sql = f"SELECT {select_cols} FROM {table_name} WHERE {row_key} > :after"
+        params["after"] = position["after"] if position and "after" in position else 0
+        if where_clause:
+            sql += f" AND ({where_clause})"
+        sql += f" ORDER BY {row_key} LIMIT :limit"
+    else:
+        sql = f"SELECT {select_cols} FROM {table_name}"
+        if where_clause:
+            sql += f" WHERE {where_clause}"
+        sql += " ORDER BY ctid LIMIT :limit OFFSET :offset"
+        params["offset"] = position["offset"] if position and "offset" in position else 0
+
+    try:
+        rows = cached_query(dataset_id, sql, engine, params=params,
+                            dataset_version=metadata["dataset_version"])
     except Exception as e:
         raise RuntimeError(f"SQL execution failed: {e}")
+
+    has_next = len(rows) > page_size
+    rows = rows.iloc[:page_size]
+
+    if keyset:
+        rows = rows.set_index(ROW_ID_COLUMN).rename_axis("row")
+        next_position = {"after": int(rows.index[-1])} if has_next else None
+    else:
+        offset = params["offset"]
+        rows.index = pd.RangeIndex(offset + 1, offset + len(rows) + 1, name="row")
+        next_position = {"offset": offset + len(rows)} if has_next else None
+
+    return {
+        "rows": rows,
+        "next_cursor": encode_page_cursor(next_position) if next_position else None
+    }
+
+
+def get_column_sketch(dataset_id, column_name, engine):
+    """
+    Load the stored sketches of one column as a ColumnSketch.
+    Returns None if the column has no sketches.
+    """
+
+    query = text("""
+        SELECT sketch_kind, value_count, hll_registers, quantile_sketch, cms_table, top_values
+        FROM dataset_column_sketches
+        WHERE dataset_id = :dataset_id
+          AND column_name = :column_name;
+    """)
+
+    try:
+        with engine.connect() as conn:
+            record = conn.execute(
+                query, {"dataset_id": dataset_id, "column_name": normalize_column_name(column_name)}
+            ).mappings().fetchone()
+
+            return sketch_from_record(record) if record is not None else None
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch column sketch: {e}")
+
+def _sketch_value(sketch, value):
+    if value is not None and sketch.kind == "datetime":
+        return pd.Timestamp(int(value))
+    return value
+
+def get_approx_quantiles(dataset_id, column_name, engine, quantiles=(0.25, 0.5, 0.75)):
+    """Approximate quantiles {q: value} of a numeric or datetime column."""
+
+    sketch = get_column_sketch(dataset_id, column_name, engine)
+    if sketch is None or sketch.quantiles is None:
+        raise ValueError(f"No quantile sketch for column {column_name}")
+
+    values = sketch.quantiles.quantiles(quantiles)
+    return {q: _sketch_value(sketch, value) for q, value in zip(quantiles, values)}
+
+def get_approx_distinct_count(dataset_id, column_name, engine):
+    """Approximate number of distinct non-null values (HyperLogLog)."""
+
+    sketch = get_column_sketch(dataset_id, column_name, engine)
+    if sketch is None:
+        raise ValueError(f"No sketch for column {column_name}")
+
+    return int(round(sketch.hll.estimate()))
+
+def get_top_values(dataset_id, column_name, engine, k=10):
+    """Most frequent values of a categorical column with estimated counts."""
+
+    sketch = get_column_sketch(dataset_id, column_name, engine)
+    if sketch is None or sketch.frequencies is None:
+        raise ValueError(f"No frequency sketch for column {column_name}")
+
+    return [{"value": value, "count": count} for value, count in sketch.frequencies.top(k)]
+
+def get_approx_frequency(dataset_id, column_name, value, engine):
+    """Estimated occurrences of value in a categorical column (never an undercount)."""
+
+    sketch = get_column_sketch(dataset_id, column_name, engine)
+    if sketch is None or sketch.frequencies is None:
+        raise ValueError(f"No frequency sketch for column {column_name}")
+
+    return int(sketch.frequencies.estimate([str(value)])[0])
+
+def get_histogram(dataset_id, column_name, engine, kind="equi_width"):
+    """Stored histogram of a numeric or datetime column.
+    kind is "equi_width" (edges + counts) or "equi_depth" (edges + rows_per_bin)."""
+
+    query = text("""
+        SELECT histograms
+        FROM dataset_column_sketches
+        WHERE dataset_id = :dataset_id
+          AND column_name = :column_name;
+    """)
+
+    try:
+        with engine.connect() as conn:
+            histograms = conn.execute(
+                query, {"dataset_id": dataset_id, "column_name": normalize_column_name(column_name)}
+            ).scalar()
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch histogram: {e}")
+
+    if not histograms:
+        raise ValueError(f"No histogram for column {column_name}")
+
+    return histograms[kind]
+
+def get_sketch_summary(dataset_id, engine, top_k=5):
+    """
+    Compact per-column distribution summary for every column of a dataset:
+    approximate distinct count, plus quartiles (numeric/datetime) or the
+    top_k most frequent values (categorical). One query, no table scan.
+    """
+
+    query = text("""
+        SELECT column_name, sketch_kind, value_count, hll_registers, quantile_sketch, cms_table, top_values
+        FROM dataset_column_sketches
+        WHERE dataset_id = :dataset_id;
+    """)
+
+    try:
+        with engine.connect() as conn:
+            records = conn.execute(query, {"dataset_id": dataset_id}).mappings().fetchall()
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch sketch summary: {e}")
+
+    summary = {}
+    for record in records:
+        sketch = sketch_from_record(record)
+        column_summary = {"approx_distinct": int(round(sketch.hll.estimate()))}
+
+        if sketch.quantiles is not None:
+            quartiles = sketch.quantiles.quantiles([0.25, 0.5, 0.75])
+            column_summary["approx_quartiles"] = [
+                str(_sketch_value(sketch, value)) if sketch.kind == "datetime" else value
+                for value in quartiles
+            ]
+        if sketch.frequencies is not None:
+            column_summary["top_values"] = sketch.frequencies.top(top_k)
+
+        summary[record["column_name"]] = column_summary
+
+    return summary
+
+CORRELATION_METHODS = ("pearson", "spearman", "covariance")
+
+def _correlation_record(dataset_id, engine):
+    query = text("""
+        SELECT
+            m.dataset_version AS current_version,
+            c.dataset_version,
+            c.spearman_version,
+            c.column_names,
+            c.pearson,
+            c.spearman,
+            c.covariance
+        FROM datasets_metadata m
+        LEFT JOIN dataset_correlations c ON c.dataset_id = m.dataset_id
+        WHERE m.dataset_id = :dataset_id;
+    """)
+
+    with engine.connect() as conn:
+        record = conn.execute(query, {"dataset_id": dataset_id}).mappings().fetchone()
+
+    if record is None:
+        raise ValueError("Dataset not found")
+    return record
+
+def _correlation_is_current(record, method):
+    version = record["spearman_version"] if method == "spearman" else record["dataset_version"]
+    return version is not None and version == record["current_version"]
+
+def get_correlation_matrix(dataset_id, engine, method="pearson"):
+    """
+    Stored correlation matrix of the numeric columns as a square DataFrame.
+    method is "pearson", "spearman" or "covariance". Matrices computed for
+    an older dataset_version are recomputed from the table first.
+    """
+
+    if method not in CORRELATION_METHODS:
+        raise ValueError(f"Unknown correlation method: {method}")
+
+    try:
+        record = _correlation_record(dataset_id, engine)
+
+        if not _correlation_is_current(record, method):
+            # Imported here: pairwise imports this module
+            from db_utils.pairwise import refresh_pairwise_stats
+            refresh_pairwise_stats(dataset_id, engine)
+            record = _correlation_record(dataset_id, engine)
+
+    except ValueError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch correlation matrix: {e}")
+
+    if not _correlation_is_current(record, method):
+        raise ValueError(f"No {method} matrix for dataset {dataset_id}")
+
+    columns = record["column_names"]
+    return pd.DataFrame(record[method], index=columns, columns=columns, dtype="float64")
+
+def get_group_aggregates(dataset_id, engine, group_column=None):
+    """
+    Per-category count/mean/std/min/max of every numeric column, one row per
+    (group_column, category, value_column). Restricted to one grouping column
+    when group_column is given; stale aggregates are recomputed first.
+    """
+
+    query = text("""
+        SELECT g.group_column, g.aggregates, g.dataset_version = m.dataset_version AS current
+        FROM dataset_group_aggregates g
+        JOIN datasets_metadata m ON m.dataset_id = g.dataset_id
+        WHERE g.dataset_id = :dataset_id
+          AND (CAST(:group_column AS VARCHAR) IS NULL OR g.group_column = :group_column)
+        ORDER BY g.group_column;
+    """)
+    params = {
+        "dataset_id": dataset_id,
+        "group_column": normalize_column_name(group_column) if group_column is not None else None
+    }
+
+    try:
+        with engine.connect() as conn:
+            records = conn.execute(query, params).mappings().fetchall()
+
+        if any(not record["current"] for record in records):
+            from db_utils.pairwise import refresh_pairwise_stats
+            refresh_pairwise_stats(dataset_id, engine)
+            with engine.connect() as conn:
+                records = conn.execute(query, params).mappings().fetchall()
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to fetch group aggregates: {e}")
+
+    rows = [
+        {
+            "group_column": record["group_column"],
+            "category": category,
+            "value_column": value_column,
+            **{key: entry[key] for key in ("count", "mean", "std", "min", "max")}
+        }
+        for record in records
+        for category, per_value in record["aggregates"].items()
+        for value_column, entry in per_value.items()
+    ]
+    return pd.DataFrame(rows, columns=["group_column", "category", "value_column",
+                                       "count", "mean", "std", "min", "max"])
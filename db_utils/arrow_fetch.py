@@ -0,0 +1,185 @@
+#arrow_fetch.py
+# Query results as Arrow tables, without building a Python object per
+# value the way pd.read_sql does. With the ADBC PostgreSQL driver
+# installed, results arrive as Arrow record batches straight from libpq.
+# Otherwise the query runs as COPY ... TO STDOUT (CSV), streamed through a
+# pipe into pyarrow's C++ reader, with column types taken from the result's
+# type OIDs. DataFrames use Arrow-backed (pd.ArrowDtype) columns.
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils.arrow_io import pa
+
+try:
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; callers fall back to pd.read_sql
+    pa_csv = None
+
+try:
+    import adbc_driver_postgresql.dbapi as adbc_pg
+except ImportError:  # the ADBC driver is optional; COPY is used without it
+    adbc_pg = None
+
+# PostgreSQL type OIDs -> Arrow types; anything else is read as text
+_OID_TYPES = {
+    16: lambda: pa.bool_(),
+    20: lambda: pa.int64(),
+    21: lambda: pa.int16(),
+    23: lambda: pa.int32(),
+    700: lambda: pa.float32(),
+    701: lambda: pa.float64(),
+    1082: lambda: pa.date32(),
+    1114: lambda: pa.timestamp("us"),
+    1184: lambda: pa.timestamp("us", tz="UTC")
+}
+
+NUMERIC_OID = 1700
+
+# Idle ADBC connections kept per database URI
+ADBC_POOL_SIZE = 4
+
+_adbc_pool = {}
+_adbc_lock = threading.Lock()
+
+
+def arrow_fetch_available():
+    return pa is not None and pa_csv is not None
+
+
+def _literal_sql(sql, params, dialect):
+    """sql with params rendered inline (COPY cannot take bind parameters)."""
+    if not params:
+        return sql
+    return str(text(sql).bindparams(**params).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _adbc_uri(engine):
+    # libpq takes the SQLAlchemy URL without its driver suffix
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def _adbc_fetch(engine, sql):
+    """Run sql on a pooled ADBC connection. A connection goes back to the
+    pool (up to ADBC_POOL_SIZE idle ones) only after a clean fetch."""
+
+    uri = _adbc_uri(engine)
+    with _adbc_lock:
+        idle = _adbc_pool.setdefault(uri, [])
+        adbc_conn = idle.pop() if idle else None
+    if adbc_conn is None:
+        adbc_conn = adbc_pg.connect(uri)
+
+    try:
+        with adbc_conn.cursor() as cursor:
+            cursor.execute(sql)
+            table = cursor.fetch_arrow_table()
+        adbc_conn.rollback()
+    except Exception:
+        adbc_conn.close()
+        raise
+
+    with _adbc_lock:
+        idle = _adbc_pool.setdefault(uri, [])
+        if len(idle) < ADBC_POOL_SIZE:
+            idle.append(adbc_conn)
+            adbc_conn = None
+    if adbc_conn is not None:
+        adbc_conn.close()
+    return table
+
+
+def _result_type(column):
+    """Arrow type of a result column from its type OID. NUMERIC keeps its
+    declared precision as a decimal; computed NUMERIC values without one
+    (AVG, SUM, ...) are float64, as pd.read_sql returns them."""
+
+    if column.type_code == NUMERIC_OID:
+        if column.precision is not None and column.scale is not None:
+            if column.precision <= 38:
+                return pa.decimal128(column.precision, column.scale)
+            if column.precision <= 76:
+                return pa.decimal256(column.precision, column.scale)
+        return pa.float64()
+    if column.type_code in _OID_TYPES:
+        return _OID_TYPES[column.type_code]()
+    return pa.string()
+
+
+def _copy_to_arrow(conn, sql):
+    """Stream COPY output through a pipe into pyarrow's CSV reader, so the
+    CSV text is never held in memory next to the Arrow table."""
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SET LOCAL DateStyle TO 'ISO';")
+        cursor.execute(f"SELECT * FROM ({sql}) AS result LIMIT 0;")
+        column_types = {column.name: _result_type(column) for column in cursor.description}
+
+        read_fd, write_fd = os.pipe()
+        reader = os.fdopen(read_fd, "rb")
+        writer = os.fdopen(write_fd, "wb", buffering=0)
+        copy_error = []
+
+        def copy():
+            try:
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+            except Exception as e:
+                copy_error.append(e)
+            finally:
+                writer.close()
+
+        copier = threading.Thread(target=copy, daemon=True)
+        copier.start()
+        table, read_error = None, None
+        try:
+            # Unquoted empty fields are NULL; "" is an empty string
+            table = pa_csv.open_csv(
+                reader,
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=column_types,
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                    true_values=["t"],
+                    false_values=["f"]
+                )
+            ).read_all()
+        except Exception as e:
+            read_error = e
+        finally:
+            # Closing the read end first unblocks a copy stuck on a full pipe
+            reader.close()
+            copier.join()
+    finally:
+        cursor.close()
+
+    # A server-side COPY error explains a failed read; a broken pipe is its consequence
+    if copy_error and not (read_error is not None and isinstance(copy_error[0], BrokenPipeError)):
+        raise copy_error[0]
+    if read_error is not None:
+        raise read_error
+    return table
+
+
+def read_sql_arrow_table(sql, engine, params=None):
+    """Run a read-only SELECT and return the result as a pyarrow Table."""
+
+    if not arrow_fetch_available():
+        raise ImportError("pyarrow is required for Arrow result fetching (pip install pyarrow)")
+
+    sql = _literal_sql(sql.strip().rstrip(";"), params, engine.dialect)
+
+    if adbc_pg is not None:
+        return _adbc_fetch(engine, sql)
+
+    with engine.connect() as conn:
+        return _copy_to_arrow(conn, sql)
+
+
+def read_sql_arrow(sql, engine, params=None):
+    """pd.read_sql replacement for analytics-sized results: the DataFrame
+    columns are Arrow-backed (pd.ArrowDtype), and NULLs are pd.NA."""
+
+    return read_sql_arrow_table(sql, engine, params).to_pandas(types_mapper=pd.ArrowDtype)
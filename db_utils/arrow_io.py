@@ -0,0 +1,268 @@
+#arrow_io.py
+# Parquet and Arrow IPC/Feather sources for ingestion. Files are opened
+# memory-mapped and read one record batch at a time, and the Arrow schema
+# stored in the file decides the PostgreSQL column types.
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; CSV ingestion does not need it
+    pa = None
+
+# Upload extensions and the reader used for each
+FILE_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "ipc",
+    ".feather": "ipc",
+    ".ipc": "ipc"
+}
+
+# Rows per record batch when reading Parquet row groups
+ARROW_BATCH_ROWS = 100_000
+
+# Decimals up to this precision are loaded through float64 without rounding
+MAX_FLOAT_DECIMAL_PRECISION = 15
+
+
+def detect_file_format(filename):
+    """'csv', 'parquet' or 'ipc' from the file extension (CSV when unknown)."""
+    extension = os.path.splitext(str(filename))[1].lower()
+    return FILE_FORMATS.get(extension, "csv")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required to ingest Parquet and Arrow files (pip install pyarrow)")
+
+
+class ArrowSource:
+    """Parquet or Arrow IPC file read as record batches.
+
+    Paths are memory-mapped; a file-like object is read in place and is
+    not closed by close().
+    """
+
+    def __init__(self, file_path, file_format, batch_rows=ARROW_BATCH_ROWS):
+        require_pyarrow()
+        self.file_path = file_path
+        self.file_format = file_format
+        self.batch_rows = batch_rows
+        self._owns_source = not hasattr(file_path, "read")
+
+        if file_format == "parquet":
+            if not self._owns_source:
+                file_path.seek(0)
+            self._parquet = pq.ParquetFile(file_path, memory_map=self._owns_source)
+            self.schema = self._parquet.schema_arrow
+            self.num_rows = self._parquet.metadata.num_rows
+        elif file_format == "ipc":
+            if self._owns_source:
+                self._source = pa.memory_map(file_path, "r")
+            else:
+                self._source = file_path
+                self._source.seek(0)
+            try:
+                try:
+                    self._reader = pa_ipc.open_file(self._source)
+                    self.num_rows = sum(
+                        self._reader.get_batch(i).num_rows for i in range(self._reader.num_record_batches)
+                    )
+                except pa.ArrowInvalid:
+                    # Arrow IPC stream format (no footer): row count is unknown up front
+                    self._source.seek(0)
+                    self._reader = None
+                    self.num_rows = None
+                self.schema = self._reader.schema if self._reader is not None else pa_ipc.open_stream(self._source).schema
+            except Exception:
+                # Neither format: do not leak the memory map of a corrupt file
+                self.close()
+                raise
+        else:
+            raise ValueError(f"Unsupported Arrow file format: {file_format}")
+
+    def iter_batches(self):
+        if self.file_format == "parquet":
+            yield from self._parquet.iter_batches(batch_size=self.batch_rows)
+        elif self._reader is not None:
+            for i in range(self._reader.num_record_batches):
+                yield self._reader.get_batch(i)
+        else:
+            self._source.seek(0)
+            yield from pa_ipc.open_stream(self._source)
+
+    def iter_frames(self, column_types):
+        """DataFrames for each record batch; always yields at least one (possibly empty) frame."""
+        empty = True
+        for batch in self.iter_batches():
+            empty = False
+            yield record_batch_to_frame(batch, column_types)
+        if empty:
+            yield record_batch_to_frame(pa.RecordBatch.from_pylist([], schema=self.schema), column_types)
+
+    def iter_segments(self, column_types, start=0):
+        """(position, frames) per resumable unit, skipping the first start units.
+
+        A unit is a row group for Parquet and a record batch for Arrow IPC;
+        position is the number of units read once this one is loaded.
+        """
+        if self.file_format == "parquet":
+            for i in range(start, self._parquet.num_row_groups):
+                frames = [
+                    record_batch_to_frame(batch, column_types)
+                    for batch in self._parquet.iter_batches(batch_size=self.batch_rows, row_groups=[i])
+                ]
+                yield i + 1, frames
+        else:
+            for i, batch in enumerate(self.iter_batches()):
+                if i >= start:
+                    yield i + 1, [record_batch_to_frame(batch, column_types)]
+
+    def close(self):
+        if self.file_format == "ipc" and self._owns_source:
+            self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _value_type(arrow_type):
+    return arrow_type.value_type if pa.types.is_dictionary(arrow_type) else arrow_type
+
+
+def arrow_sql_type(arrow_type):
+    """PostgreSQL type and conversion kind for an Arrow type."""
+
+    t = _value_type(arrow_type)
+
+    if pa.types.is_boolean(t):
+        return "BOOLEAN", "bool"
+    if pa.types.is_int8(t) or pa.types.is_int16(t) or pa.types.is_uint8(t):
+        return "SMALLINT", "int"
+    if pa.types.is_int32(t) or pa.types.is_uint16(t):
+        return "INTEGER", "int"
+    if pa.types.is_int64(t) or pa.types.is_uint32(t):
+        return "BIGINT", "int"
+    if pa.types.is_uint64(t):
+        return "NUMERIC(20, 0)", "uint64"
+    if pa.types.is_float16(t) or pa.types.is_float32(t):
+        return "REAL", "float"
+    if pa.types.is_float64(t):
+        return "DOUBLE PRECISION", "float"
+    if pa.types.is_decimal(t):
+        return f"NUMERIC({t.precision}, {t.scale})", "decimal"
+    if pa.types.is_date(t):
+        return "DATE", "datetime"
+    if pa.types.is_timestamp(t):
+        return "TIMESTAMP", "datetime"
+    if pa.types.is_time(t):
+        return "TIME", "text"
+    if pa.types.is_duration(t):
+        return "INTERVAL", "text"
+    if pa.types.is_binary(t) or pa.types.is_large_binary(t) or pa.types.is_fixed_size_binary(t):
+        return "BYTEA", "binary"
+    if pa.types.is_nested(t):
+        return "JSONB", "json"
+    return "TEXT", "text"
+
+
+def arrow_column_types(schema):
+    """Column types in the type_inference format, taken from the file schema."""
+
+    column_types = {}
+    for field in schema:
+        sql_type, kind = arrow_sql_type(field.type)
+        column_types[field.name] = {"sql_type": sql_type, "kind": kind, "arrow_type": str(field.type)}
+    return column_types
+
+
+def _types_mapper(arrow_type):
+    """Nullable pandas dtypes, so a null never turns an integer column into floats."""
+    if pa.types.is_boolean(arrow_type):
+        return pd.BooleanDtype()
+    if pa.types.is_integer(arrow_type) and not pa.types.is_uint64(arrow_type):
+        return pd.Int64Dtype()
+    if pa.types.is_uint64(arrow_type):
+        return pd.UInt64Dtype()
+    return None
+
+
+def _prepare_array(array, col_type):
+    """Arrow-side conversions that give COPY-compatible values."""
+
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+
+    kind = col_type["kind"]
+    if kind == "datetime" and pa.types.is_timestamp(array.type) and array.type.tz is not None:
+        # Stored as UTC wall time, like tz-aware text in type_inference
+        array = array.cast(pa.timestamp(array.type.unit))
+    elif kind == "decimal" and array.type.precision <= MAX_FLOAT_DECIMAL_PRECISION:
+        array = array.cast(pa.float64())
+    elif kind == "binary":
+        array = pa.array(
+            [None if value is None else "\\x" + value.hex() for value in array.to_pylist()],
+            type=pa.string()
+        )
+    elif kind == "json":
+        array = pa.array(
+            [None if value is None else json.dumps(value, default=str) for value in array.to_pylist()],
+            type=pa.string()
+        )
+    return array
+
+
+def record_batch_to_frame(batch, column_types):
+    """Convert one record batch to a DataFrame ready for COPY and profiling."""
+
+    arrays = [
+        _prepare_array(batch.column(i), column_types[name])
+        for i, name in enumerate(batch.schema.names)
+    ]
+    table = pa.Table.from_arrays(arrays, names=batch.schema.names)
+    return table.to_pandas(
+        types_mapper=_types_mapper,
+        date_as_object=False,
+        coerce_temporal_nanoseconds=True
+    )
+
+
+def read_arrow_preview(file, file_format, rows=5):
+    """First rows of a Parquet/Arrow file (path or file-like) without reading it whole."""
+
+    require_pyarrow()
+    if file_format == "parquet":
+        parquet = pq.ParquetFile(file)
+        batch = next(parquet.iter_batches(batch_size=rows), None)
+        schema = parquet.schema_arrow
+    else:
+        try:
+            reader = pa_ipc.open_file(file)
+            batch = reader.get_batch(0) if reader.num_record_batches else None
+            schema = reader.schema
+        except pa.ArrowInvalid:
+            file.seek(0)
+            reader = pa_ipc.open_stream(file)
+            batch = next(iter(reader), None)
+            schema = reader.schema
+    if batch is None:
+        return schema.empty_table().to_pandas()
+    return batch.slice(0, rows).to_pandas()
+
+
+def estimate_arrow_rows(file_path, file_format):
+    """Row count from the file footer, or None when it cannot be read."""
+    try:
+        with ArrowSource(file_path, file_format) as source:
+            return source.num_rows
+    except Exception:
+        return None
@@ -10,4 +10,48 @@ def get_database_url():
 
 def get_engine():
     """Create and return a SQLAlchemy engine"""
-    return create_engine(get_database_url())
\ No newline at end of file
+    return create_engine(get_database_url())
+
+def get_profile_workers():
+    """Worker processes used to profile columns at ingest (0 = serial)"""
+    return int(os.getenv("PROFILE_WORKERS", "0"))
+
+def get_ingest_workers():
+    """Worker processes that run queued ingestion jobs"""
+    return int(os.getenv("INGEST_WORKERS", "2"))
+
+def get_upload_chunk_bytes():
+    """Bytes copied / hashed per step when handling an uploaded file"""
+    return int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+
+def get_partition_target_rows():
+    """Rows per partition for large dataset tables (0 = no partitioning)"""
+    return int(os.getenv("PARTITION_TARGET_ROWS", "0"))
+
+def get_partition_method():
+    """How large dataset tables are partitioned: range or hash"""
+    return os.getenv("PARTITION_METHOD", "range")
+
+def get_replica_dir():
+    """Directory for the Parquet replicas queried through DuckDB ("" = no replicas)"""
+    return os.getenv("REPLICA_DIR", "")
+
+def get_metadata_cache_size():
+    """Datasets whose metadata is kept in the in-process lookup cache (0 = no cache)"""
+    return int(os.getenv("METADATA_CACHE_SIZE", "256"))
+
+def get_metadata_version_ttl():
+    """Seconds a cached dataset's version is trusted before it is re-read (0 = every lookup)"""
+    return float(os.getenv("METADATA_VERSION_TTL", "5"))
+
+def get_result_cache_bytes():
+    """Memory held by cached query results in each process"""
+    return int(os.getenv("RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+def get_result_cache_dir():
+    """Directory for the on-disk (Arrow) tier of the query result cache ("" = memory only)"""
+    return os.getenv("RESULT_CACHE_DIR", "")
+
+def get_result_cache_disk_bytes():
+    """Disk held by the on-disk result cache tier"""
+    return int(os.getenv("RESULT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))
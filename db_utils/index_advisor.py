@@ -0,0 +1,550 @@
+#index_advisor.py
+# Index advisor for dataset_X_data tables. Filters seen in chatbot SQL are
+# counted per column in query_filter_stats; combined with the column
+# cardinality from dataset_column_details and pg_stats, they decide which
+# B-tree, hash or BRIN indexes are worth building within a size budget.
+# Every index built is probed before and after creation so the report can
+# show the latency it saves. Chat requests only record their filters; the
+# advisor itself runs in the background job workers (db_utils.jobs) and
+# builds indexes CONCURRENTLY so loads and appends are never blocked.
+import json
+import re
+
+from sqlalchemy import text
+
+from db_utils.db_config import get_engine
+from db_utils.Retrieval import quote_identifier
+
+# Tables smaller than this are scanned faster than any index lookup
+MIN_INDEX_ROWS = 10_000
+
+# Filter hits on a column before a B-tree/hash index is considered
+MIN_FILTER_HITS = 3
+
+# Re-run the advisor each time a column accumulates this many more hits
+ADVISE_EVERY_HITS = 10
+
+# Equality on a column whose average row share exceeds this is left to a seq scan
+MAX_SELECTIVITY = 0.1
+
+# |pg_stats.correlation| above this means the column follows physical order (BRIN-friendly)
+BRIN_MIN_CORRELATION = 0.9
+
+# Key width (bytes) above which equality-only columns use a hash index
+HASH_MIN_KEY_WIDTH = 16
+
+# Total index size allowed per dataset, as a share of the table size
+INDEX_BUDGET_RATIO = 0.5
+
+_WHERE_RE = re.compile(
+    r'\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|$)',
+    re.IGNORECASE | re.DOTALL
+)
+_PREDICATE_RE = re.compile(
+    r'"([^"]+)"\s*(<=|>=|<>|!=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bBETWEEN\b|\bNOT\s+I?LIKE\b|\bI?LIKE\b)',
+    re.IGNORECASE
+)
+
+
+def extract_filter_columns(sql, allowed_columns):
+    """{(column, predicate)} for indexable WHERE predicates on quoted columns.
+
+    predicate is "eq" (=, IN) or "range" (<, >, <=, >=, BETWEEN); negations
+    and LIKE patterns are ignored since an index rarely helps them.
+    """
+
+    filters = set()
+    for where in _WHERE_RE.findall(sql):
+        for column, operator in _PREDICATE_RE.findall(where):
+            if column not in allowed_columns:
+                continue
+            operator = " ".join(operator.upper().split())
+            if operator in ("=", "IN"):
+                filters.add((column, "eq"))
+            elif operator in ("<", ">", "<=", ">=", "BETWEEN"):
+                filters.add((column, "range"))
+    return filters
+
+
+def record_query_filters(engine, dataset_id, sql, allowed_columns, elapsed_ms):
+    """Count the filters of one executed query. Returns True when a column
+    crossed an ADVISE_EVERY_HITS boundary (time to re-run the advisor)."""
+
+    filters = extract_filter_columns(sql, allowed_columns)
+    if not filters:
+        return False
+
+    due = False
+    with engine.begin() as conn:
+        for column, predicate in sorted(filters):
+            hits = conn.execute(
+                text("""
+                    INSERT INTO query_filter_stats (dataset_id, column_name, predicate, hits, total_ms)
+                    VALUES (:dataset_id, :column_name, :predicate, 1, :elapsed_ms)
+                    ON CONFLICT (dataset_id, column_name, predicate)
+                    DO UPDATE SET hits = query_filter_stats.hits + 1,
+                                  total_ms = query_filter_stats.total_ms + EXCLUDED.total_ms,
+                                  last_seen = NOW()
+                    RETURNING hits;
+                """),
+                {
+                    "dataset_id": dataset_id,
+                    "column_name": column,
+                    "predicate": predicate,
+                    "elapsed_ms": elapsed_ms
+                }
+            ).scalar_one()
+            if hits == MIN_FILTER_HITS or (hits > MIN_FILTER_HITS and hits % ADVISE_EVERY_HITS == 0):
+                due = True
+
+    return due
+
+
+def _load_dataset_profile(conn, dataset_id):
+    dataset = conn.execute(
+        text("""
+            SELECT table_name, num_rows, column_names
+            FROM datasets_metadata
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    ).fetchone()
+
+    if dataset is None:
+        return None, {}
+
+    columns = {}
+    for row in conn.execute(
+        text("""
+            SELECT column_name, column_type, sql_type, unique_value_count
+            FROM dataset_column_details
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    ):
+        columns[row.column_name] = {
+            "column_type": row.column_type,
+            "sql_type": row.sql_type,
+            "unique_value_count": row.unique_value_count or 0,
+            "hits": {"eq": 0, "range": 0},
+            "correlation": None,
+            "avg_width": None
+        }
+
+    for row in conn.execute(
+        text("""
+            SELECT column_name, predicate, hits
+            FROM query_filter_stats
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    ):
+        if row.column_name in columns:
+            columns[row.column_name]["hits"][row.predicate] = row.hits
+
+    for row in conn.execute(
+        text("""
+            SELECT attname, correlation, avg_width
+            FROM pg_stats
+            WHERE schemaname = current_schema() AND tablename = :table_name;
+        """),
+        {"table_name": dataset.table_name}
+    ):
+        if row.attname in columns:
+            columns[row.attname]["correlation"] = row.correlation
+            columns[row.attname]["avg_width"] = row.avg_width
+
+    return dataset, columns
+
+
+def _choose_index(column, info, num_rows, table_pages):
+    """(method, score, estimated_bytes, reason) for one column, or None."""
+
+    hits = info["hits"]
+    total_hits = hits["eq"] + hits["range"]
+    width = info["avg_width"] or 8
+    correlation = abs(info["correlation"] or 0.0)
+
+    if info["sql_type"] == "BOOLEAN":
+        return None
+
+    # BRIN: tiny block-range summaries for columns that follow physical order.
+    # Datetime columns get one right after ingestion, before any queries.
+    ordered = correlation >= BRIN_MIN_CORRELATION
+    if ordered and (info["column_type"] == "Datetime" or hits["range"] >= MIN_FILTER_HITS):
+        size = 8192 * (2 + table_pages // 32768)
+        reason = f"correlation {correlation:.2f}, {hits['range']} range filters"
+        return "brin", max(hits["range"], 1), size, reason
+
+    if total_hits < MIN_FILTER_HITS:
+        return None
+
+    distinct = info["unique_value_count"]
+    selectivity = 1.0 / distinct if distinct else 1.0
+    if hits["range"] == 0 and selectivity > MAX_SELECTIVITY:
+        return None
+
+    score = total_hits * (1.0 - selectivity)
+    reason = f"{hits['eq']} equality / {hits['range']} range filters, {distinct} distinct values"
+
+    if hits["range"] == 0 and width > HASH_MIN_KEY_WIDTH:
+        return "hash", score, int(num_rows * 20 * 1.2), reason
+    return "btree", score, int(num_rows * (width + 20) * 1.1), reason
+
+
+def _probe_sql(conn, table_name, column, predicate):
+    """A representative filter on column plus its parameters, for EXPLAIN."""
+
+    quoted = quote_identifier(column)
+
+    if predicate == "eq":
+        value = conn.execute(
+            text(f"SELECT {quoted} FROM {table_name} WHERE {quoted} IS NOT NULL LIMIT 1;")
+        ).scalar()
+        return f"SELECT * FROM {table_name} WHERE {quoted} = :v", {"v": value}
+
+    low, high = conn.execute(
+        text(f"""
+            SELECT percentile_disc(0.45) WITHIN GROUP (ORDER BY {quoted}),
+                   percentile_disc(0.46) WITHIN GROUP (ORDER BY {quoted})
+            FROM {table_name};
+        """)
+    ).fetchone()
+    return f"SELECT * FROM {table_name} WHERE {quoted} BETWEEN :low AND :high", {"low": low, "high": high}
+
+
+def _execution_ms(conn, sql, params, repeat=2):
+    """Best EXPLAIN ANALYZE execution time of sql over repeat runs."""
+
+    best = None
+    for _ in range(repeat):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        ms = plan[0]["Execution Time"]
+        best = ms if best is None else min(best, ms)
+    return best
+
+
+def _leaf_partitions(conn, table_name):
+    """Leaf partitions of table_name (empty for a plain table)."""
+
+    return [
+        row.relid
+        for row in conn.execute(
+            text("""
+                SELECT CAST(relid AS text) AS relid
+                FROM pg_partition_tree(CAST(:table_name AS regclass))
+                WHERE isleaf AND level > 0;
+            """),
+            {"table_name": table_name}
+        )
+    ]
+
+
+def _create_index_concurrently(engine, table_name, index_name, method, column):
+    """Build an index without blocking writes to the table.
+
+    CREATE INDEX CONCURRENTLY cannot run in a transaction block, so it uses
+    an autocommit connection. Partitioned tables do not support it directly:
+    the parent index is created ON ONLY the parent, each partition is
+    indexed concurrently and attached. A failed build leaves an INVALID
+    index behind, which is dropped before the error is re-raised.
+    """
+
+    columns = f"USING {method} ({quote_identifier(column)})"
+    built = []
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        try:
+            partitions = _leaf_partitions(conn, table_name)
+            if not partitions:
+                built.append(index_name)
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} {columns};"))
+                return
+
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {table_name} {columns};"))
+            built.append(index_name)
+            for partition in partitions:
+                partition_index = f"{partition}_{index_name[len(table_name) + 1:]}"
+                built.append(partition_index)
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {columns};"))
+                attached = conn.execute(
+                    text("SELECT 1 FROM pg_inherits WHERE inhrelid = CAST(:index_name AS regclass);"),
+                    {"index_name": partition_index}
+                ).scalar()
+                if attached is None:
+                    conn.execute(text(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index};"))
+
+        except Exception:
+            for name in reversed(built):
+                conn.execute(text(f"DROP INDEX IF EXISTS {name};"))
+            raise
+
+
+def advise_indexes(engine, dataset_id, budget_bytes=None, apply=True):
+    """Pick (and with apply=True, build) indexes for a dataset table.
+
+    Candidates are ranked by filter hits weighted by selectivity and added
+    while they fit the budget (default INDEX_BUDGET_RATIO of the table size,
+    minus indexes already built). Each new index is timed with EXPLAIN
+    ANALYZE on a probe filter before and after creation.
+    Returns {"success", "created": [...], "skipped": [...]}.
+    """
+
+    try:
+        with engine.begin() as conn:
+            table_name = conn.execute(
+                text("SELECT table_name FROM datasets_metadata WHERE dataset_id = :dataset_id;"),
+                {"dataset_id": dataset_id}
+            ).scalar()
+
+            if table_name is None:
+                return {"success": False, "error": "Dataset not found"}
+
+            # Refresh pg_stats so correlation/avg_width describe the loaded rows
+            conn.execute(text(f"ANALYZE {table_name};"))
+
+        with engine.begin() as conn:
+            dataset, columns = _load_dataset_profile(conn, dataset_id)
+
+            existing = {
+                row.column_name
+                for row in conn.execute(
+                    text("SELECT column_name FROM dataset_indexes WHERE dataset_id = :dataset_id;"),
+                    {"dataset_id": dataset_id}
+                )
+            }
+
+            # A partitioned parent has no storage of its own: sum over its partitions
+            table_bytes, table_pages, used_bytes = conn.execute(
+                text("""
+                    SELECT (SELECT COALESCE(SUM(pg_table_size(t.relid)), 0)
+                            FROM pg_partition_tree(CAST(:table_name AS regclass)) t),
+                           (SELECT COALESCE(SUM(c.relpages), 0)
+                            FROM pg_partition_tree(CAST(:table_name AS regclass)) t
+                            JOIN pg_class c ON c.oid = t.relid
+                            WHERE t.isleaf),
+                           (SELECT COALESCE(SUM(pg_relation_size(t.relid)), 0)
+                            FROM dataset_indexes i,
+                                 pg_partition_tree(CAST(i.index_name AS regclass)) t
+                            WHERE i.dataset_id = :dataset_id);
+                """),
+                {"table_name": dataset.table_name, "dataset_id": dataset_id}
+            ).fetchone()
+
+        if dataset.num_rows < MIN_INDEX_ROWS:
+            return {
+                "success": True,
+                "created": [],
+                "skipped": [{"reason": f"table has fewer than {MIN_INDEX_ROWS} rows"}]
+            }
+
+        if budget_bytes is None:
+            budget_bytes = int(int(table_bytes) * INDEX_BUDGET_RATIO)
+        remaining = budget_bytes - int(used_bytes)
+
+        candidates = []
+        for column, info in columns.items():
+            if column in existing:
+                continue
+            choice = _choose_index(column, info, dataset.num_rows, int(table_pages or 0))
+            if choice is not None:
+                candidates.append((column, info) + choice)
+
+        candidates.sort(key=lambda candidate: candidate[3], reverse=True)
+
+        created, skipped = [], []
+        for column, info, method, score, estimate, reason in candidates:
+            if estimate > remaining:
+                skipped.append({"column_name": column, "method": method,
+                                "reason": f"over budget ({estimate} bytes estimated, {max(remaining, 0)} left)"})
+                continue
+
+            if not apply:
+                created.append({"column_name": column, "method": method,
+                                "estimated_bytes": estimate, "reason": reason})
+                remaining -= estimate
+                continue
+
+            position = dataset.column_names.index(column)
+            index_name = f"{dataset.table_name}_{method}_{position}"
+
+            predicate = "range" if method == "brin" or info["hits"]["range"] > info["hits"]["eq"] else "eq"
+            with engine.begin() as conn:
+                probe_sql, params = _probe_sql(conn, dataset.table_name, column, predicate)
+                baseline_ms = _execution_ms(conn, probe_sql, params)
+
+            _create_index_concurrently(engine, dataset.table_name, index_name, method, column)
+
+            with engine.begin() as conn:
+                conn.execute(text(f"ANALYZE {dataset.table_name};"))
+
+                indexed_ms = _execution_ms(conn, probe_sql, params)
+                size_bytes = conn.execute(
+                    text("""
+                        SELECT COALESCE(SUM(pg_relation_size(relid)), 0)
+                        FROM pg_partition_tree(CAST(:index_name AS regclass));
+                    """),
+                    {"index_name": index_name}
+                ).scalar()
+
+                conn.execute(
+                    text("""
+                        INSERT INTO dataset_indexes
+                        (dataset_id, index_name, column_name, method, reason, size_bytes,
+                         baseline_ms, indexed_ms, hits_at_creation)
+                        VALUES
+                        (:dataset_id, :index_name, :column_name, :method, :reason, :size_bytes,
+                         :baseline_ms, :indexed_ms, :hits)
+                        ON CONFLICT (index_name) DO NOTHING;
+                    """),
+                    {
+                        "dataset_id": dataset_id,
+                        "index_name": index_name,
+                        "column_name": column,
+                        "method": method,
+                        "reason": reason,
+                        "size_bytes": size_bytes,
+                        "baseline_ms": baseline_ms,
+                        "indexed_ms": indexed_ms,
+                        "hits": info["hits"]["eq"] + info["hits"]["range"]
+                    }
+                )
+
+            remaining -= size_bytes
+            created.append({
+                "index_name": index_name,
+                "column_name": column,
+                "method": method,
+                "size_bytes": size_bytes,
+                "baseline_ms": baseline_ms,
+                "indexed_ms": indexed_ms,
+                "reason": reason
+            })
+            print(f"Created {method} index {index_name}: {baseline_ms:.2f} ms -> {indexed_ms:.2f} ms")
+
+        return {"success": True, "created": created, "skipped": skipped}
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def request_index_advice(engine, dataset_id):
+    """Queue an advisor run for a dataset (at most one pending per dataset)."""
+
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO index_advice_requests (dataset_id)
+                VALUES (:dataset_id)
+                ON CONFLICT (dataset_id) DO NOTHING;
+            """),
+            {"dataset_id": dataset_id}
+        )
+
+
+def pending_index_advice(engine):
+    """Dataset ids with a queued advisor run, oldest request first."""
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT dataset_id FROM index_advice_requests ORDER BY requested_at;")
+        ).fetchall()
+    return [row.dataset_id for row in rows]
+
+
+def run_index_advice(dataset_id=None, engine=None):
+    """Worker entry point: claim a pending advice request (a specific
+    dataset's, or the oldest) and run the advisor for it. Returns the
+    advisor result, or None when nothing was claimed."""
+
+    engine = engine or get_engine()
+
+    with engine.begin() as conn:
+        claimed = conn.execute(
+            text("""
+                DELETE FROM index_advice_requests
+                WHERE dataset_id = (
+                    SELECT dataset_id FROM index_advice_requests
+                    WHERE :dataset_id IS NULL OR dataset_id = :dataset_id
+                    ORDER BY requested_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING dataset_id;
+            """),
+            {"dataset_id": dataset_id}
+        ).scalar()
+
+    if claimed is None:
+        return None
+
+    result = advise_indexes(engine, claimed)
+    if not result["success"]:
+        print(f"Index advisor failed for dataset {claimed}: {result['error']}")
+    return result
+
+
+def observe_query(engine, dataset_id, sql, allowed_columns, elapsed_ms):
+    """Record a chatbot query's filters and queue an advisor run when due.
+
+    Returns {"success", "queued"}; with queued=True the caller hands the
+    request to the job workers (db_utils.jobs.submit_index_advice).
+    """
+
+    try:
+        queued = record_query_filters(engine, dataset_id, sql, allowed_columns, elapsed_ms)
+        if queued:
+            request_index_advice(engine, dataset_id)
+        return {"success": True, "queued": queued}
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def get_index_report(dataset_id, engine):
+    """Indexes built for a dataset with their size and latency saved.
+
+    saved_ms_per_query comes from the probe timings; queries_since counts
+    filters on the column seen since the index was built, and
+    total_saved_ms is their product.
+    """
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT i.index_name, i.column_name, i.method, i.reason, i.created_at,
+                       (SELECT COALESCE(SUM(pg_relation_size(t.relid)), 0)
+                        FROM pg_partition_tree(CAST(i.index_name AS regclass)) t) AS size_bytes,
+                       i.baseline_ms, i.indexed_ms, i.hits_at_creation,
+                       COALESCE((
+                           SELECT SUM(q.hits)
+                           FROM query_filter_stats q
+                           WHERE q.dataset_id = i.dataset_id AND q.column_name = i.column_name
+                       ), 0) AS hits
+                FROM dataset_indexes i
+                WHERE i.dataset_id = :dataset_id
+                ORDER BY i.created_at;
+            """),
+            {"dataset_id": dataset_id}
+        ).fetchall()
+
+    report = []
+    for row in rows:
+        saved = max((row.baseline_ms or 0.0) - (row.indexed_ms or 0.0), 0.0)
+        queries_since = max(int(row.hits) - row.hits_at_creation, 0)
+        report.append({
+            "index_name": row.index_name,
+            "column_name": row.column_name,
+            "method": row.method,
+            "reason": row.reason,
+            "created_at": row.created_at,
+            "size_bytes": row.size_bytes,
+            "baseline_ms": row.baseline_ms,
+            "indexed_ms": row.indexed_ms,
+            "saved_ms_per_query": saved,
+            "queries_since": queries_since,
+            "total_saved_ms": saved * queries_since
+        })
+    return report
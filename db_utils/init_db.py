@@ -1,5 +1,6 @@
 from sqlalchemy import text
 import os
+import re
 
 
 def init_postgresql(engine):
@@ -33,6 +34,9 @@ def init_postgresql(engine):
         owner_user_id INTEGER NOT NULL,
         table_name VARCHAR(255),
         column_names TEXT[],
+        file_hash VARCHAR(64),
+        ref_count INTEGER NOT NULL DEFAULT 1,
+        dataset_version INTEGER NOT NULL DEFAULT 1,
         CONSTRAINT fk_owner_user FOREIGN KEY (owner_user_id) 
             REFERENCES user_details(user_id) ON DELETE SET NULL
     );
@@ -45,7 +49,6 @@ def init_postgresql(engine):
         owner_user_id INTEGER,
         dataset_id INTEGER,
         created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
-        CONSTRAINT projects_dataset_id_key UNIQUE (dataset_id),
         CONSTRAINT projects_owner_user_id_fkey FOREIGN KEY (owner_user_id) 
             REFERENCES user_details(user_id),
         CONSTRAINT projects_dataset_id_fkey FOREIGN KEY (dataset_id) 
@@ -70,19 +73,171 @@ def init_postgresql(engine):
         computed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
         min_datetime TIMESTAMP WITHOUT TIME ZONE,
         max_datetime TIMESTAMP WITHOUT TIME ZONE,
+        sql_type VARCHAR(100),
         CONSTRAINT dataset_column_details_dataset_id_fkey FOREIGN KEY (dataset_id) 
             REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
     );
 
+    -- Mergeable distribution sketches per dataset column
+    CREATE TABLE IF NOT EXISTS dataset_column_sketches (
+        dataset_id INTEGER NOT NULL,
+        column_name VARCHAR(255) NOT NULL,
+        sketch_kind VARCHAR(20) NOT NULL,
+        value_count BIGINT NOT NULL DEFAULT 0,
+        hll_registers BYTEA,
+        quantile_sketch BYTEA,
+        histograms JSONB,
+        cms_table BYTEA,
+        top_values JSONB,
+        computed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT dataset_column_sketches_pkey PRIMARY KEY (dataset_id, column_name),
+        CONSTRAINT dataset_column_sketches_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Background ingestion jobs
+    CREATE TABLE IF NOT EXISTS ingestion_jobs (
+        job_id SERIAL PRIMARY KEY,
+        project_id INTEGER NOT NULL,
+        owner_user_id INTEGER NOT NULL,
+        file_path VARCHAR(500) NOT NULL,
+        original_filename VARCHAR(255),
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        phase VARCHAR(50),
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        rows_estimate BIGINT,
+        dataset_id INTEGER,
+        error TEXT,
+        cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+        worker_pid INTEGER,
+        worker_host VARCHAR(255),
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        started_at TIMESTAMP WITHOUT TIME ZONE,
+        load_started_at TIMESTAMP WITHOUT TIME ZONE,
+        heartbeat_at TIMESTAMP WITHOUT TIME ZONE,
+        finished_at TIMESTAMP WITHOUT TIME ZONE,
+        CONSTRAINT ingestion_jobs_status_check
+            CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+        CONSTRAINT ingestion_jobs_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES projects(project_id) ON DELETE CASCADE,
+        CONSTRAINT ingestion_jobs_owner_user_id_fkey FOREIGN KEY (owner_user_id)
+            REFERENCES user_details(user_id)
+    );
+
+    -- Correlation matrices of the numeric columns, stale when dataset_version
+    -- (or spearman_version for the Spearman matrix) is behind datasets_metadata
+    CREATE TABLE IF NOT EXISTS dataset_correlations (
+        dataset_id INTEGER PRIMARY KEY,
+        dataset_version INTEGER NOT NULL,
+        spearman_version INTEGER,
+        column_names TEXT[] NOT NULL,
+        pearson JSONB NOT NULL,
+        spearman JSONB,
+        covariance JSONB NOT NULL,
+        pair_counts JSONB NOT NULL,
+        accumulator BYTEA,
+        computed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT dataset_correlations_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Per-category aggregates of every numeric column, one row per grouping column
+    CREATE TABLE IF NOT EXISTS dataset_group_aggregates (
+        dataset_id INTEGER NOT NULL,
+        group_column VARCHAR(255) NOT NULL,
+        dataset_version INTEGER NOT NULL,
+        aggregates JSONB NOT NULL,
+        computed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT dataset_group_aggregates_pkey PRIMARY KEY (dataset_id, group_column),
+        CONSTRAINT dataset_group_aggregates_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Checkpoints of resumable ingestion (one per owner and file content)
+    CREATE TABLE IF NOT EXISTS ingestion_checkpoints (
+        checkpoint_id SERIAL PRIMARY KEY,
+        owner_user_id INTEGER NOT NULL,
+        file_hash VARCHAR(64) NOT NULL,
+        original_filename VARCHAR(255),
+        file_format VARCHAR(20) NOT NULL,
+        staging_table VARCHAR(255),
+        column_types JSONB NOT NULL,
+        read_dtypes JSONB,
+        byte_offset BIGINT NOT NULL DEFAULT 0,
+        batches_loaded INTEGER NOT NULL DEFAULT 0,
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        profiler_state BYTEA,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT ingestion_checkpoints_file_key UNIQUE (owner_user_id, file_hash),
+        CONSTRAINT ingestion_checkpoints_owner_user_id_fkey FOREIGN KEY (owner_user_id)
+            REFERENCES user_details(user_id) ON DELETE CASCADE
+    );
+
+    -- Filters seen in chatbot SQL, per dataset column (feeds the index advisor)
+    CREATE TABLE IF NOT EXISTS query_filter_stats (
+        dataset_id INTEGER NOT NULL,
+        column_name VARCHAR(255) NOT NULL,
+        predicate VARCHAR(10) NOT NULL,
+        hits BIGINT NOT NULL DEFAULT 0,
+        total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+        last_seen TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT query_filter_stats_pkey PRIMARY KEY (dataset_id, column_name, predicate),
+        CONSTRAINT query_filter_stats_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Index advisor runs waiting for a background worker
+    CREATE TABLE IF NOT EXISTS index_advice_requests (
+        dataset_id INTEGER PRIMARY KEY,
+        requested_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT index_advice_requests_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Indexes built on dataset tables by the index advisor
+    CREATE TABLE IF NOT EXISTS dataset_indexes (
+        index_id SERIAL PRIMARY KEY,
+        dataset_id INTEGER NOT NULL,
+        index_name VARCHAR(255) NOT NULL,
+        column_name VARCHAR(255) NOT NULL,
+        method VARCHAR(10) NOT NULL,
+        reason TEXT,
+        size_bytes BIGINT,
+        baseline_ms DOUBLE PRECISION,
+        indexed_ms DOUBLE PRECISION,
+        hits_at_creation BIGINT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+        CONSTRAINT dataset_indexes_index_name_key UNIQUE (index_name),
+        CONSTRAINT dataset_indexes_dataset_id_fkey FOREIGN KEY (dataset_id)
+            REFERENCES datasets_metadata(dataset_id) ON DELETE CASCADE
+    );
+
+    -- Columns added after the initial schema (no-ops on fresh databases)
+    ALTER TABLE dataset_column_details ADD COLUMN IF NOT EXISTS sql_type VARCHAR(100);
+    ALTER TABLE datasets_metadata ADD COLUMN IF NOT EXISTS file_hash VARCHAR(64);
+    ALTER TABLE datasets_metadata ADD COLUMN IF NOT EXISTS ref_count INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE datasets_metadata ADD COLUMN IF NOT EXISTS dataset_version INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS worker_host VARCHAR(255);
+
+    -- Datasets are shared between projects through content-hash deduplication
+    ALTER TABLE projects DROP CONSTRAINT IF EXISTS projects_dataset_id_key;
+
     -- Indexes for better performance
     CREATE INDEX IF NOT EXISTS idx_projects_owner ON projects(owner_user_id);
     CREATE INDEX IF NOT EXISTS idx_datasets_owner ON datasets_metadata(owner_user_id);
+    CREATE INDEX IF NOT EXISTS idx_datasets_owner_hash ON datasets_metadata(owner_user_id, file_hash);
+    CREATE INDEX IF NOT EXISTS idx_projects_dataset ON projects(dataset_id);
     CREATE INDEX IF NOT EXISTS idx_column_details_dataset ON dataset_column_details(dataset_id);
+    CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, job_id);
+    CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_owner ON ingestion_jobs(owner_user_id, job_id);
+    CREATE INDEX IF NOT EXISTS idx_dataset_indexes_dataset ON dataset_indexes(dataset_id);
     """
 
     try:
         with engine.begin() as conn:
-            for statement in schema_sql.split(';'):
+            # Comments are dropped first so a ';' inside one cannot split a statement
+            for statement in re.sub(r'--[^\n]*', '', schema_sql).split(';'):
                 if statement.strip():
                     conn.execute(text(statement))
 
@@ -0,0 +1,514 @@
+#jobs.py
+# Background ingestion jobs: uploads are queued in ingestion_jobs and run by
+# worker processes. Jobs are claimed atomically, so the Streamlit-owned pool
+# and standalone workers (python -m db_utils.jobs) can run side by side, and
+# queued or orphaned jobs are picked up again after a restart.
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import text
+
+from db_utils.db_config import get_engine, get_ingest_workers
+from db_utils.index_advisor import pending_index_advice, run_index_advice
+from db_utils.Ingestion import IngestionCancelled, estimate_row_count
+from db_utils.replica import replica_available, run_replica_build
+from db_utils.resumable import discard_stale_checkpoints
+
+# Seconds between heartbeat / cancel-flag checks of a running job
+HEARTBEAT_SECONDS = 5
+
+# A running job whose heartbeat is older than this is considered orphaned
+STALE_JOB_SECONDS = 120
+
+# Minimum seconds between progress writes to ingestion_jobs
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# Minimum seconds between orphaned-job sweeps of one process
+SWEEP_INTERVAL_SECONDS = 30
+
+_executor = None
+_last_sweep = 0.0
+
+# dataset_id -> Future of the replica build submitted by this process
+_replica_builds = {}
+
+
+def enqueue_ingestion(project_id, file_path, original_filename, user_id, engine):
+    """Record an upload as a queued job and hand it to the worker pool.
+
+    file_path must be a persistent copy of the upload (not a temp file that
+    is removed when the request ends); the job deletes it when it finishes.
+    Returns {"success", "job_id"} or {"success": False, "error"}.
+    """
+
+    try:
+        with engine.begin() as conn:
+            project = conn.execute(
+                text("""
+                    SELECT project_id, dataset_id
+                    FROM projects
+                    WHERE project_id = :project_id
+                      AND owner_user_id = :user_id
+                    FOR UPDATE;
+                """),
+                {"project_id": project_id, "user_id": user_id}
+            ).fetchone()
+
+            if project is None:
+                return {"success": False, "error": "Project not found or access denied"}
+
+            if project.dataset_id is not None:
+                return {"success": False, "error": "Project already has a dataset"}
+
+            active = conn.execute(
+                text("""
+                    SELECT job_id FROM ingestion_jobs
+                    WHERE project_id = :project_id
+                      AND status IN ('queued', 'running');
+                """),
+                {"project_id": project_id}
+            ).fetchone()
+
+            if active is not None:
+                return {"success": False, "error": f"Upload job {active.job_id} is already in progress for this project"}
+
+            job_id = conn.execute(
+                text("""
+                    INSERT INTO ingestion_jobs
+                    (project_id, owner_user_id, file_path, original_filename, rows_estimate)
+                    VALUES (:project_id, :user_id, :file_path, :original_filename, :rows_estimate)
+                    RETURNING job_id;
+                """),
+                {
+                    "project_id": project_id,
+                    "user_id": user_id,
+                    "file_path": file_path,
+                    "original_filename": original_filename,
+                    "rows_estimate": estimate_row_count(file_path)
+                }
+            ).fetchone()[0]
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+    if _executor is not None:
+        _executor.submit(run_ingestion_job, job_id)
+
+    return {"success": True, "job_id": job_id}
+
+
+def cancel_job(job_id, user_id, engine):
+    """Request cancellation. Queued jobs stop immediately; running jobs roll
+    back at their next progress report."""
+
+    try:
+        with engine.begin() as conn:
+            row = conn.execute(
+                text("""
+                    UPDATE ingestion_jobs
+                    SET cancel_requested = TRUE,
+                        status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                        finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END
+                    WHERE job_id = :job_id
+                      AND owner_user_id = :user_id
+                      AND status IN ('queued', 'running')
+                    RETURNING status, file_path;
+                """),
+                {"job_id": job_id, "user_id": user_id}
+            ).fetchone()
+
+        if row is None:
+            return {"success": False, "error": "Job not found or already finished"}
+
+        if row.status == "cancelled":
+            _remove_upload(row.file_path)
+
+        return {"success": True, "job_id": job_id}
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def _job_to_dict(row):
+    job = dict(row._mapping)
+
+    eta = None
+    if (
+        job["status"] == "running"
+        and job["phase"] == "loading"
+        and job["rows_loaded"]
+        and job["rows_estimate"]
+        and job["load_elapsed"] is not None
+    ):
+        elapsed = float(job["load_elapsed"])
+        remaining = max(job["rows_estimate"] - job["rows_loaded"], 0)
+        eta = elapsed / job["rows_loaded"] * remaining
+
+    job["eta_seconds"] = eta
+    job["progress"] = None
+    if job["status"] == "succeeded":
+        job["progress"] = 1.0
+    elif job["rows_estimate"]:
+        job["progress"] = min(job["rows_loaded"] / job["rows_estimate"], 1.0)
+    return job
+
+
+_JOB_COLUMNS = """
+    job_id, project_id, owner_user_id, original_filename, status, phase,
+    rows_loaded, rows_estimate, dataset_id, error, cancel_requested,
+    created_at, started_at, finished_at,
+    EXTRACT(EPOCH FROM NOW() - load_started_at) AS load_elapsed
+"""
+
+
+def get_job(job_id, engine):
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT {_JOB_COLUMNS} FROM ingestion_jobs WHERE job_id = :job_id;"),
+            {"job_id": job_id}
+        ).fetchone()
+    return _job_to_dict(row) if row is not None else None
+
+
+def list_jobs(user_id, engine, limit=20):
+    """Most recent jobs of a user, newest first, with progress and ETA."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f"""
+                SELECT {_JOB_COLUMNS} FROM ingestion_jobs
+                WHERE owner_user_id = :user_id
+                ORDER BY job_id DESC
+                LIMIT :limit;
+            """),
+            {"user_id": user_id, "limit": limit}
+        ).fetchall()
+    return [_job_to_dict(row) for row in rows]
+
+
+def _remove_upload(file_path):
+    try:
+        if file_path and os.path.exists(file_path):
+            os.unlink(file_path)
+    except OSError:
+        pass
+
+
+class _JobMonitor(threading.Thread):
+    """Keeps the job's heartbeat fresh and watches for cancel requests while
+    the main thread is busy inside ingest_dataset."""
+
+    def __init__(self, job_id, engine):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.engine = engine
+        self.cancelled = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.engine.begin() as conn:
+                    row = conn.execute(
+                        text("""
+                            UPDATE ingestion_jobs SET heartbeat_at = NOW()
+                            WHERE job_id = :job_id
+                            RETURNING cancel_requested;
+                        """),
+                        {"job_id": self.job_id}
+                    ).fetchone()
+                if row is not None and row.cancel_requested:
+                    self.cancelled.set()
+            except Exception:
+                traceback.print_exc()
+
+
+def _claim_job(conn, job_id=None):
+    """Atomically move one queued job (or the given one) to running."""
+
+    if job_id is None:
+        target = """
+            SELECT job_id FROM ingestion_jobs
+            WHERE status = 'queued'
+            ORDER BY job_id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """
+        params = {}
+    else:
+        target = """
+            SELECT job_id FROM ingestion_jobs
+            WHERE job_id = :job_id AND status = 'queued'
+            FOR UPDATE SKIP LOCKED
+        """
+        params = {"job_id": job_id}
+
+    return conn.execute(
+        text(f"""
+            UPDATE ingestion_jobs
+            SET status = 'running', phase = 'starting', rows_loaded = 0,
+                started_at = NOW(), heartbeat_at = NOW(),
+                worker_pid = :pid, worker_host = :host
+            WHERE job_id = ({target})
+            RETURNING job_id, project_id, owner_user_id, file_path, original_filename;
+        """),
+        {**params, "pid": os.getpid(), "host": socket.gethostname()}
+    ).fetchone()
+
+
+def _finish_job(engine, job_id, status, dataset_id=None, error=None):
+    with engine.begin() as conn:
+        conn.execute(
+            text("""
+                UPDATE ingestion_jobs
+                SET status = :status, dataset_id = :dataset_id, error = :error,
+                    phase = CASE WHEN :status = 'succeeded' THEN 'done' ELSE phase END,
+                    finished_at = NOW(), heartbeat_at = NOW()
+                WHERE job_id = :job_id;
+            """),
+            {"job_id": job_id, "status": status, "dataset_id": dataset_id, "error": error}
+        )
+
+
+def _execute_claimed_job(job, engine):
+    # Imported here: utils pulls in streamlit, which workers only need lazily
+    from db_utils.utils import upload_dataset_to_project
+
+    monitor = _JobMonitor(job.job_id, engine)
+    monitor.start()
+    last_report = {"phase": None, "at": 0.0}
+
+    def progress(phase, rows_loaded):
+        if monitor.cancelled.is_set():
+            raise IngestionCancelled(f"Job {job.job_id} cancelled")
+
+        now = time.monotonic()
+        phase_changed = phase != last_report["phase"]
+        if not phase_changed and now - last_report["at"] < PROGRESS_INTERVAL_SECONDS:
+            return
+        last_report.update(phase=phase, at=now)
+
+        with engine.begin() as conn:
+            conn.execute(
+                text("""
+                    UPDATE ingestion_jobs
+                    SET phase = :phase, rows_loaded = :rows_loaded, heartbeat_at = NOW(),
+                        load_started_at = CASE WHEN :load_start THEN NOW() ELSE load_started_at END
+                    WHERE job_id = :job_id;
+                """),
+                {
+                    "phase": phase,
+                    "rows_loaded": rows_loaded,
+                    "job_id": job.job_id,
+                    "load_start": phase_changed and phase == "loading"
+                }
+            )
+
+    try:
+        result = upload_dataset_to_project(
+            project_id=job.project_id,
+            csv_path=job.file_path,
+            original_filename=job.original_filename,
+            user_id=job.owner_user_id,
+            engine=engine,
+            progress_callback=progress
+        )
+    except Exception as e:
+        result = {"success": False, "error": str(e), "cancelled": isinstance(e, IngestionCancelled)}
+    finally:
+        monitor.stopped.set()
+
+    if result["success"]:
+        _finish_job(engine, job.job_id, "succeeded", dataset_id=result["dataset_id"])
+    elif result.get("cancelled"):
+        _finish_job(engine, job.job_id, "cancelled", error="Cancelled by user")
+    else:
+        _finish_job(engine, job.job_id, "failed", error=result["error"])
+
+    _remove_upload(job.file_path)
+    return result
+
+
+def run_ingestion_job(job_id=None, engine=None):
+    """Worker entry point: claim a queued job (a specific one, or the oldest)
+    and run it. Returns the job id, or None when nothing was claimed."""
+
+    engine = engine or get_engine()
+
+    with engine.begin() as conn:
+        job = _claim_job(conn, job_id)
+
+    if job is None:
+        return None
+
+    _execute_claimed_job(job, engine)
+    return job.job_id
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def requeue_orphaned_jobs(engine):
+    """Requeue running jobs whose worker is gone: the heartbeat is older than
+    STALE_JOB_SECONDS, or the worker ran on this host and its process no
+    longer exists (e.g. the Streamlit server was just restarted). Jobs with a
+    pending cancel request are cancelled instead. Returns the requeued ids.
+    """
+
+    host = socket.gethostname()
+
+    with engine.begin() as conn:
+        running = conn.execute(
+            text("""
+                SELECT job_id, worker_pid, worker_host,
+                       heartbeat_at < NOW() - make_interval(secs => :stale) AS stale
+                FROM ingestion_jobs
+                WHERE status = 'running'
+                FOR UPDATE SKIP LOCKED;
+            """),
+            {"stale": STALE_JOB_SECONDS}
+        ).fetchall()
+
+        orphaned = [
+            row.job_id for row in running
+            if row.stale
+            or row.worker_pid is None
+            or (row.worker_host == host and not _pid_alive(row.worker_pid))
+        ]
+        if not orphaned:
+            return []
+
+        rows = conn.execute(
+            text("""
+                UPDATE ingestion_jobs
+                SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,
+                    phase = NULL, rows_loaded = 0, load_started_at = NULL,
+                    worker_pid = NULL, worker_host = NULL,
+                    finished_at = CASE WHEN cancel_requested THEN NOW() ELSE NULL END
+                WHERE job_id = ANY(:job_ids)
+                RETURNING job_id, status, file_path;
+            """),
+            {"job_ids": orphaned}
+        ).fetchall()
+
+    requeued = []
+    for row in rows:
+        if row.status == "cancelled":
+            _remove_upload(row.file_path)
+        else:
+            requeued.append(row.job_id)
+    return requeued
+
+
+def recover_jobs(engine):
+    """Requeue orphaned jobs (see requeue_orphaned_jobs) and return the ids
+    of all queued jobs.
+
+    Requeued jobs over RESUMABLE_THRESHOLD_BYTES continue from their last
+    ingestion checkpoint; checkpoints abandoned for days are dropped here.
+    """
+
+    discard_stale_checkpoints(engine)
+    requeue_orphaned_jobs(engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT job_id FROM ingestion_jobs WHERE status = 'queued' ORDER BY job_id;")
+        ).fetchall()
+
+    return [row.job_id for row in rows]
+
+
+def sweep_jobs(engine):
+    """Periodic orphan check, at most once per SWEEP_INTERVAL_SECONDS per
+    process. Requeued jobs go to this process's pool when it has one."""
+
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return []
+    _last_sweep = now
+
+    try:
+        requeued = requeue_orphaned_jobs(engine)
+    except Exception:
+        traceback.print_exc()
+        return []
+
+    if _executor is not None:
+        for job_id in requeued:
+            _executor.submit(run_ingestion_job, job_id)
+    return requeued
+
+
+def submit_index_advice(dataset_id):
+    """Hand a queued index advisor run (see index_advisor.request_index_advice)
+    to this process's pool. Without a pool, standalone workers pick it up."""
+
+    if _executor is not None:
+        _executor.submit(run_index_advice, dataset_id)
+
+
+def submit_replica_build(dataset_id):
+    """Build a dataset's columnar replica in this process's pool, at most
+    one build per dataset at a time. Queries go to PostgreSQL until the
+    replica exists. Returns False when there is no pool or no replica
+    support."""
+
+    if _executor is None or not replica_available():
+        return False
+    running = _replica_builds.get(dataset_id)
+    if running is None or running.done():
+        _replica_builds[dataset_id] = _executor.submit(run_replica_build, dataset_id)
+    return True
+
+
+def start_job_workers(engine, max_workers=None):
+    """Start (once per process) the worker pool and resubmit queued jobs and
+    index advisor runs.
+
+    Workers are spawned rather than forked so they do not inherit the
+    Streamlit server's threads or open connections.
+    """
+
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=max_workers or get_ingest_workers(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        for job_id in recover_jobs(engine):
+            _executor.submit(run_ingestion_job, job_id)
+        for dataset_id in pending_index_advice(engine):
+            _executor.submit(run_index_advice, dataset_id)
+    return _executor
+
+
+def worker_loop(poll_seconds=2.0):
+    """Standalone worker: python -m db_utils.jobs"""
+    engine = get_engine()
+    print(f"Ingestion worker {os.getpid()} started")
+    recover_jobs(engine)
+    while True:
+        sweep_jobs(engine)
+        job_id = run_ingestion_job(engine=engine)
+        if job_id is None:
+            if run_index_advice(engine=engine) is None:
+                time.sleep(poll_seconds)
+        else:
+            print(f"Finished job {job_id}")
+
+
+if __name__ == "__main__":
+    worker_loop()
@@ -77,6 +77,32 @@ def list_project_knowledge_files(project_id):
     return list(docs)
 
 
+def list_knowledge_files_by_project(project_ids):
+    """
+    Knowledge documents (title, source_type, created_at, _id) of several
+    projects in one aggregation, as {project_id: [docs]} newest first.
+    Projects without documents are absent.
+    """
+    if not project_ids:
+        return {}
+
+    collection = get_mongo_collection()
+    groups = collection.aggregate([
+        {"$match": {"project_id": {"$in": list(project_ids)}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": "$project_id",
+            "files": {"$push": {
+                "_id": "$_id",
+                "title": "$title",
+                "source_type": "$source_type",
+                "created_at": "$created_at"
+            }}
+        }}
+    ])
+    return {group["_id"]: group["files"] for group in groups}
+
+
 def delete_knowledge_document(doc_id):
     """Delete a specific knowledge document by its ObjectId"""
     collection = get_mongo_collection()
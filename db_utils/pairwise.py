@@ -0,0 +1,381 @@
+#pairwise.py
+# Pairwise statistics computed at ingest: Pearson correlation / covariance
+# matrices, Spearman correlation, and per-category aggregates of numeric
+# columns. Pearson and the group aggregates come from mergeable
+# accumulators updated chunk by chunk; Spearman needs global ranks, so it is
+# computed on the whole frame (in-memory ingest) or by PostgreSQL after the
+# load. Stored rows carry the dataset_version they describe, and readers
+# treat rows from an older version as stale.
+import json
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils.Retrieval import quote_identifier, stream_query
+from db_utils.profiler import split_columns, numeric_block
+
+# Numeric columns included in the correlation matrices
+MAX_CORRELATION_COLUMNS = 100
+
+# Categorical columns with more categories than this are not used for grouping
+MAX_GROUP_CATEGORIES = 50
+
+# Rows per chunk when a refresh reads the dataset table back
+REFRESH_CHUNK_ROWS = 100_000
+
+# corr() pairs per query (PostgreSQL allows 1664 entries in a SELECT list)
+SPEARMAN_PAIRS_PER_QUERY = 1000
+
+
+def _json_safe(values):
+    """Nested lists with NaN/inf replaced by None (JSONB rejects NaN)."""
+    array = np.asarray(values, dtype=np.float64)
+    return [[float(x) if np.isfinite(x) else None for x in row] for row in array]
+
+
+class PairwiseAccumulator:
+    """Mergeable pairwise-complete sums for Pearson correlation and covariance.
+
+    For every column pair (i, j) it keeps, over rows where both are present,
+    the count and the sums of x_i, x_i**2 and x_i*x_j. Values are shifted by
+    a per-column reference (the schema sample's means) to keep the sums well
+    conditioned; every update is a handful of (p x rows) @ (rows x p) products.
+    """
+
+    def __init__(self, columns, shift):
+        p = len(columns)
+        self.columns = list(columns)
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.n = np.zeros((p, p))
+        self.sx = np.zeros((p, p))
+        self.sxx = np.zeros((p, p))
+        self.sxy = np.zeros((p, p))
+
+    @classmethod
+    def from_sample(cls, columns, block):
+        """Empty accumulator shifted by the sample's column means."""
+        counts = (~np.isnan(block)).sum(axis=0)
+        shift = np.nansum(block, axis=0) / np.maximum(counts, 1)
+        return cls(columns, shift)
+
+    def update(self, block):
+        if block.shape[0] == 0 or block.shape[1] == 0:
+            return
+        valid = ~np.isnan(block)
+        v = valid.astype(np.float64)
+        x = np.where(valid, block - self.shift, 0.0)
+        self.n += v.T @ v
+        self.sx += x.T @ v
+        self.sxx += (x * x).T @ v
+        self.sxy += x.T @ x
+
+    def merge(self, other):
+        if other.columns != self.columns or not np.array_equal(other.shift, self.shift):
+            raise ValueError("Pairwise accumulators must share columns and shift to merge")
+        self.n += other.n
+        self.sx += other.sx
+        self.sxx += other.sxx
+        self.sxy += other.sxy
+
+    def covariance(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (self.sxy - self.sx * self.sx.T / self.n) / (self.n - 1)
+
+    def pearson(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            co = self.sxy - self.sx * self.sx.T / self.n
+            var_i = self.sxx - self.sx ** 2 / self.n
+            corr = co / np.sqrt(var_i * var_i.T)
+        np.fill_diagonal(corr, np.where(np.diag(var_i) > 0, 1.0, np.nan))
+        return np.clip(corr, -1.0, 1.0)
+
+    def to_bytes(self):
+        """float64 array: shift, then the n, sx, sxx and sxy matrices."""
+        return np.concatenate([self.shift] + [m.ravel() for m in (self.n, self.sx, self.sxx, self.sxy)]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, columns, data):
+        """Rebuild from to_bytes output; columns are stored alongside (column_names)."""
+        p = len(columns)
+        values = np.frombuffer(data, dtype=np.float64)
+        if len(values) != p + 4 * p * p:
+            raise ValueError("Stored pairwise accumulator does not match its columns")
+        accumulator = cls(columns, values[:p].copy())
+        accumulator.n, accumulator.sx, accumulator.sxx, accumulator.sxy = values[p:].reshape(4, p, p).copy()
+        return accumulator
+
+
+class GroupAggregator:
+    """Mergeable count/mean/M2/min/max of numeric columns per category.
+
+    State per group column is a set of DataFrames (categories x value
+    columns); chunks are reduced with one groupby and merged with Chan's
+    pairwise update. Group columns that exceed MAX_GROUP_CATEGORIES are
+    dropped.
+    """
+
+    def __init__(self, group_columns, value_columns):
+        self.group_columns = list(group_columns)
+        self.value_columns = list(value_columns)
+        self.state = {}
+        self.overflow = set()
+
+    def _chunk_state(self, values, keys):
+        grouped = values.groupby(keys, sort=False)
+        count = grouped.count().astype(np.float64)
+        mean = grouped.mean()
+        return {
+            "count": count,
+            "mean": mean,
+            "m2": grouped.var(ddof=0) * count,
+            "min": grouped.min(),
+            "max": grouped.max()
+        }
+
+    @staticmethod
+    def _merge_states(a, b):
+        index = a["count"].index.union(b["count"].index)
+        a = {key: frame.reindex(index) for key, frame in a.items()}
+        b = {key: frame.reindex(index) for key, frame in b.items()}
+
+        na, nb = a["count"].fillna(0), b["count"].fillna(0)
+        n = na + nb
+        ma, mb = a["mean"].fillna(0), b["mean"].fillna(0)
+        delta = mb - ma
+        safe_n = n.where(n > 0)
+
+        return {
+            "count": n,
+            "mean": (ma + delta * nb / safe_n),
+            "m2": a["m2"].fillna(0) + b["m2"].fillna(0) + delta ** 2 * na * nb / safe_n,
+            "min": a["min"].combine(b["min"], np.fmin),
+            "max": a["max"].combine(b["max"], np.fmax)
+        }
+
+    def update(self, chunk):
+        if not self.value_columns:
+            return
+        values = pd.DataFrame(
+            numeric_block(chunk, self.value_columns), columns=self.value_columns, index=chunk.index
+        )
+        for col in self.group_columns:
+            if col in self.overflow:
+                continue
+            keys = chunk[col].astype(str).where(chunk[col].notna())
+            chunk_state = self._chunk_state(values, keys)
+            state = chunk_state if col not in self.state else self._merge_states(self.state[col], chunk_state)
+            if len(state["count"]) > MAX_GROUP_CATEGORIES:
+                self.overflow.add(col)
+                self.state.pop(col, None)
+            else:
+                self.state[col] = state
+
+    def merge(self, other):
+        self.overflow |= other.overflow
+        for col, state in other.state.items():
+            if col in self.overflow:
+                continue
+            merged = state if col not in self.state else self._merge_states(self.state[col], state)
+            if len(merged["count"]) > MAX_GROUP_CATEGORIES:
+                self.overflow.add(col)
+                self.state.pop(col, None)
+            else:
+                self.state[col] = merged
+        for col in self.overflow:
+            self.state.pop(col, None)
+
+    def aggregates(self, col):
+        """{category: {value_column: {count, mean, std, min, max, m2}}} for one group column."""
+
+        state = self.state[col]
+        result = {}
+        for category in state["count"].index:
+            per_value = {}
+            for value_col in self.value_columns:
+                count = float(state["count"].at[category, value_col])
+                m2 = float(state["m2"].at[category, value_col])
+                entry = {
+                    "count": int(count),
+                    "mean": float(state["mean"].at[category, value_col]),
+                    "std": float(np.sqrt(m2 / (count - 1))) if count > 1 else None,
+                    "min": float(state["min"].at[category, value_col]),
+                    "max": float(state["max"].at[category, value_col]),
+                    "m2": m2
+                }
+                per_value[value_col] = {
+                    key: (None if isinstance(value, float) and not np.isfinite(value) else value)
+                    for key, value in entry.items()
+                }
+            result[str(category)] = per_value
+        return result
+
+    @classmethod
+    def from_aggregates(cls, group_column, value_columns, aggregates):
+        """Rebuild a single-column aggregator from stored aggregates (for appends)."""
+
+        aggregator = cls([group_column], value_columns)
+        frames = {key: pd.DataFrame(index=list(aggregates), columns=value_columns, dtype=np.float64)
+                  for key in ("count", "mean", "m2", "min", "max")}
+        for category, per_value in aggregates.items():
+            for value_col, entry in per_value.items():
+                if value_col not in value_columns:
+                    continue
+                for key in frames:
+                    value = entry.get(key)
+                    frames[key].at[category, value_col] = np.nan if value is None else value
+        frames["count"] = frames["count"].fillna(0)
+        frames["m2"] = frames["m2"].fillna(0)
+        aggregator.state[group_column] = frames
+        return aggregator
+
+
+class PairwiseProfiler:
+    """Pairwise accumulators for one dataset, updated chunk by chunk."""
+
+    def __init__(self, sample):
+        groups = split_columns(sample)
+        self.numeric_columns = groups["Numerical"][:MAX_CORRELATION_COLUMNS]
+        self.correlation = PairwiseAccumulator.from_sample(
+            self.numeric_columns, numeric_block(sample, self.numeric_columns)
+        )
+        self.groups = GroupAggregator(groups["Categorical"], groups["Numerical"])
+
+    def update(self, chunk):
+        self.correlation.update(numeric_block(chunk, self.numeric_columns))
+        self.groups.update(chunk)
+
+
+def spearman_from_frame(df, columns):
+    """Exact Spearman matrix (average ranks, pairwise complete) of an in-memory frame."""
+    if not columns:
+        return np.empty((0, 0))
+    return df[columns].astype("float64").corr(method="spearman").to_numpy()
+
+
+def query_spearman(conn, table_name, columns):
+    """Spearman matrix computed by PostgreSQL: average ranks per column, then corr().
+
+    The ranks are materialized once in a temporary table (dropped at
+    commit), and the column pairs are correlated in batches of
+    SPEARMAN_PAIRS_PER_QUERY so no SELECT list exceeds PostgreSQL's limit.
+    """
+
+    if not columns:
+        return np.empty((0, 0))
+
+    rank_parts = []
+    for i, col in enumerate(columns):
+        quoted = quote_identifier(str(col))
+        rank_parts.append(
+            f"CASE WHEN {quoted} IS NULL THEN NULL ELSE "
+            f"rank() OVER (ORDER BY {quoted}) + (COUNT(*) OVER (PARTITION BY {quoted}) - 1) / 2.0 "
+            f"END AS r{i}"
+        )
+    rank_sql = ", ".join(rank_parts)
+
+    conn.execute(text("DROP TABLE IF EXISTS spearman_ranks;"))
+    conn.execute(text(f"CREATE TEMP TABLE spearman_ranks ON COMMIT DROP AS SELECT {rank_sql} FROM {table_name};"))
+
+    matrix = np.eye(len(columns))
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+    for start in range(0, len(pairs), SPEARMAN_PAIRS_PER_QUERY):
+        batch = pairs[start:start + SPEARMAN_PAIRS_PER_QUERY]
+        corr_sql = ", ".join(f"corr(r{i}, r{j}) AS c{i}_{j}" for i, j in batch)
+        row = conn.execute(text(f"SELECT {corr_sql} FROM spearman_ranks")).mappings().fetchone()
+        for i, j in batch:
+            value = row[f"c{i}_{j}"]
+            matrix[i, j] = matrix[j, i] = np.nan if value is None else float(value)
+
+    conn.execute(text("DROP TABLE spearman_ranks;"))
+    return matrix
+
+
+def write_pairwise_stats(conn, dataset_id, dataset_version, profiler, spearman):
+    """Replace a dataset's correlation matrices and group aggregates."""
+
+    accumulator = profiler.correlation
+
+    conn.execute(
+        text("DELETE FROM dataset_correlations WHERE dataset_id = :dataset_id;"),
+        {"dataset_id": dataset_id}
+    )
+    conn.execute(
+        text("""
+            INSERT INTO dataset_correlations
+            (dataset_id, dataset_version, spearman_version, column_names,
+             pearson, spearman, covariance, pair_counts, accumulator)
+            VALUES
+            (:dataset_id, :dataset_version, :spearman_version, :column_names,
+             CAST(:pearson AS JSONB), CAST(:spearman AS JSONB), CAST(:covariance AS JSONB),
+             CAST(:pair_counts AS JSONB), :accumulator);
+        """),
+        {
+            "dataset_id": dataset_id,
+            "dataset_version": dataset_version,
+            "spearman_version": dataset_version if spearman is not None else None,
+            "column_names": profiler.numeric_columns,
+            "pearson": json.dumps(_json_safe(accumulator.pearson())),
+            "spearman": json.dumps(_json_safe(spearman)) if spearman is not None else None,
+            "covariance": json.dumps(_json_safe(accumulator.covariance())),
+            "pair_counts": json.dumps(accumulator.n.astype(int).tolist()),
+            "accumulator": accumulator.to_bytes()
+        }
+    )
+
+    write_group_aggregates(conn, dataset_id, dataset_version, profiler.groups)
+
+
+def write_group_aggregates(conn, dataset_id, dataset_version, aggregator):
+    conn.execute(
+        text("DELETE FROM dataset_group_aggregates WHERE dataset_id = :dataset_id;"),
+        {"dataset_id": dataset_id}
+    )
+    for col in aggregator.group_columns:
+        if col not in aggregator.state:
+            continue
+        conn.execute(
+            text("""
+                INSERT INTO dataset_group_aggregates (dataset_id, group_column, dataset_version, aggregates)
+                VALUES (:dataset_id, :group_column, :dataset_version, CAST(:aggregates AS JSONB));
+            """),
+            {
+                "dataset_id": dataset_id,
+                "group_column": col,
+                "dataset_version": dataset_version,
+                "aggregates": json.dumps(aggregator.aggregates(col))
+            }
+        )
+
+
+def refresh_pairwise_stats(dataset_id, engine, chunk_rows=REFRESH_CHUNK_ROWS):
+    """Recompute all pairwise stats for the current dataset version from the
+    table itself (used when stored stats are missing or stale)."""
+
+    with engine.begin() as conn:
+        dataset = conn.execute(
+            text("""
+                SELECT table_name, dataset_version
+                FROM datasets_metadata
+                WHERE dataset_id = :dataset_id
+                FOR SHARE;
+            """),
+            {"dataset_id": dataset_id}
+        ).fetchone()
+
+        if dataset is None:
+            raise ValueError("Dataset not found")
+
+        profiler = None
+        for chunk in stream_query(conn, f"SELECT * FROM {dataset.table_name}", chunk_rows):
+            if profiler is None:
+                profiler = PairwiseProfiler(chunk)
+            profiler.update(chunk)
+
+        if profiler is None:
+            return False
+
+        spearman = query_spearman(conn, dataset.table_name, profiler.numeric_columns)
+        write_pairwise_stats(conn, dataset_id, dataset.dataset_version, profiler, spearman)
+
+    return True
@@ -0,0 +1,185 @@
+#partitioning.py
+# Declarative partitioning of dataset_X_data. Large datasets are created
+# as range-partitioned tables keyed on a datetime column (or on the row
+# number) or hash-partitioned on the row number, with partitions sized
+# around a target row count. Range partitions are created as chunks arrive,
+# so streamed loads never need the full key range up front; rows outside
+# the planned partitions land in a DEFAULT partition. Queries need no
+# changes: PostgreSQL prunes partitions from the WHERE clause.
+import math
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils.Retrieval import quote_identifier, ROW_ID_COLUMN
+
+PARTITION_METHODS = ("range", "hash")
+
+# Upper bound on partitions per table; later rows go to the DEFAULT partition
+MAX_PARTITIONS = 1024
+
+# A sample whose key is at least this rank-correlated with row order is treated as sorted
+SORTED_KEY_CORRELATION = 0.9
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+class TablePartitioner:
+    """Partition layout for one dataset table.
+
+    Range partitioning uses the first datetime column when there is one
+    (partition width is a whole number of days), otherwise the row number
+    stored in ROW_ID_COLUMN. Hash partitioning always uses the row number.
+    """
+
+    def __init__(self, table_name, column_types, sample, target_rows, estimated_rows, method="range"):
+        if method not in PARTITION_METHODS:
+            raise ValueError(f"Unknown partition method: {method}")
+
+        self.table_name = table_name
+        self.method = method
+        self.target_rows = target_rows
+        self.partition_count = min(max(math.ceil(estimated_rows / target_rows), 1), MAX_PARTITIONS)
+        self.created = set()
+
+        datetime_cols = [col for col, col_type in column_types.items() if col_type["kind"] == "datetime"]
+        if method == "range" and datetime_cols:
+            self.key = datetime_cols[0]
+            self.width_ns = self._datetime_width(sample[self.key], estimated_rows)
+        else:
+            self.key = ROW_ID_COLUMN
+            self.width_ns = None
+
+    def _datetime_width(self, series, estimated_rows):
+        """Days per partition so each holds about target_rows rows.
+
+        When the sample is sorted by the key (e.g. an event log) it covers a
+        short span of a much longer range, so the width comes from its row
+        density; otherwise the sample span approximates the whole range.
+        """
+
+        values = series.to_numpy(dtype="datetime64[ns]").view("int64")
+        valid = values[values != np.iinfo("int64").min]
+        if valid.size < 2 or valid.max() == valid.min():
+            return NS_PER_DAY
+
+        span = float(valid.max() - valid.min())
+        ranks = valid.argsort(kind="stable").argsort()
+        ordered = np.corrcoef(ranks, np.arange(valid.size))[0, 1]
+        if ordered >= SORTED_KEY_CORRELATION:
+            width = span * self.target_rows / valid.size
+        else:
+            width = span * self.target_rows / max(estimated_rows, 1)
+        return max(math.ceil(width / NS_PER_DAY), 1) * NS_PER_DAY
+
+    def partition_clause(self):
+        method = "RANGE" if self.method == "range" else "HASH"
+        return f"PARTITION BY {method} ({quote_identifier(self.key)})"
+
+    def _partition_name(self, bucket):
+        return f"{self.table_name}_p{bucket}" if bucket >= 0 else f"{self.table_name}_pm{-bucket}"
+
+    def _bounds(self, bucket):
+        if self.width_ns is None:
+            return str(bucket * self.target_rows + 1), str((bucket + 1) * self.target_rows + 1)
+        low = pd.Timestamp(bucket * self.width_ns)
+        high = pd.Timestamp((bucket + 1) * self.width_ns)
+        return f"'{low.isoformat(sep=' ')}'", f"'{high.isoformat(sep=' ')}'"
+
+    def create(self, conn):
+        """Create the partitions known up front (all hash partitions, or the
+        DEFAULT partition for range)."""
+
+        if self.method == "hash":
+            for remainder in range(self.partition_count):
+                conn.execute(text(f"""
+                    CREATE TABLE {self.table_name}_p{remainder}
+                    PARTITION OF {self.table_name}
+                    FOR VALUES WITH (MODULUS {self.partition_count}, REMAINDER {remainder});
+                """))
+        else:
+            conn.execute(text(f"CREATE TABLE {self.table_name}_default PARTITION OF {self.table_name} DEFAULT;"))
+
+    def _buckets(self, chunk, first_row_id):
+        if self.width_ns is None:
+            first = (first_row_id - 1) // self.target_rows
+            last = (first_row_id + len(chunk) - 2) // self.target_rows
+            return set(range(first, last + 1))
+
+        values = chunk[self.key].to_numpy(dtype="datetime64[ns]").view("int64")
+        values = values[values != np.iinfo("int64").min]
+        return set(np.unique(np.floor_divide(values, self.width_ns)).tolist())
+
+    def prepare(self, conn, chunk, first_row_id):
+        """Create the range partitions that chunk's rows fall into.
+
+        first_row_id is the row number of the chunk's first row. Buckets past
+        MAX_PARTITIONS are left to the DEFAULT partition.
+        """
+
+        if self.method != "range" or len(chunk) == 0:
+            return
+
+        for bucket in sorted(self._buckets(chunk, first_row_id) - self.created):
+            if len(self.created) >= MAX_PARTITIONS:
+                break
+            low, high = self._bounds(bucket)
+            conn.execute(text(f"""
+                CREATE TABLE {self._partition_name(bucket)}
+                PARTITION OF {self.table_name}
+                FOR VALUES FROM ({low}) TO ({high});
+            """))
+            self.created.add(bucket)
+
+    def rename(self, conn, table_name):
+        """Follow a rename of the parent table (resumable loads publish by renaming)."""
+
+        rows = conn.execute(
+            text("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = CAST(:table_name AS regclass);
+            """),
+            {"table_name": table_name}
+        ).fetchall()
+
+        for row in rows:
+            if row.relname.startswith(self.table_name):
+                conn.execute(text(
+                    f"ALTER TABLE {row.relname} RENAME TO {table_name}{row.relname[len(self.table_name):]};"
+                ))
+        self.table_name = table_name
+
+    def to_state(self):
+        """JSON-serializable layout, for ingestion checkpoints."""
+        return {
+            "table_name": self.table_name,
+            "method": self.method,
+            "target_rows": self.target_rows,
+            "partition_count": self.partition_count,
+            "created": sorted(self.created),
+            "key": self.key,
+            "width_ns": self.width_ns
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        partitioner = cls.__new__(cls)
+        partitioner.table_name = state["table_name"]
+        partitioner.method = state["method"]
+        partitioner.target_rows = state["target_rows"]
+        partitioner.partition_count = state["partition_count"]
+        partitioner.created = set(state["created"])
+        partitioner.key = state["key"]
+        partitioner.width_ns = state["width_ns"]
+        return partitioner
+
+
+def plan_partitions(table_name, column_types, sample, estimated_rows, target_rows, method="range"):
+    """A TablePartitioner when the table is expected to exceed target_rows, else None."""
+
+    if not target_rows or estimated_rows is None or estimated_rows <= target_rows:
+        return None
+    return TablePartitioner(table_name, column_types, sample, target_rows, estimated_rows, method)
@@ -0,0 +1,472 @@
+#profiler.py
+import pandas as pd
+import numpy as np
+import json
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Distinct categories kept per categorical column
+MAX_DISTINCT_CATEGORIES = 30
+
+
+def column_type(series):
+    """Map a pandas Series to the column_type stored in dataset_column_details."""
+    if pd.api.types.is_numeric_dtype(series):
+        return "Numerical"
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        return "Datetime"
+    else:
+        return "Categorical"
+
+
+def split_columns(df):
+    """Group DataFrame columns by column_type, preserving column order."""
+    groups = {"Numerical": [], "Categorical": [], "Datetime": []}
+    for col in df.columns:
+        groups[column_type(df[col])].append(col)
+    return groups
+
+
+def numeric_block(df, columns):
+    """2-D float64 array (rows x columns) with missing values as NaN.
+
+    Fortran order keeps each column contiguous, which is the axis every
+    reduction and sort runs along.
+    """
+    if not columns:
+        return np.empty((len(df), 0), dtype="float64", order="F")
+    block = df[columns].to_numpy(dtype="float64", na_value=np.nan)
+    return np.asfortranarray(block)
+
+
+def datetime_block(df, columns):
+    """2-D int64 nanosecond array plus a validity mask for datetime columns."""
+    if not columns:
+        empty = np.empty((len(df), 0), dtype="int64")
+        return empty, empty.astype(bool)
+    values = np.column_stack([
+        df[col].to_numpy(dtype="datetime64[ns]") for col in columns
+    ])
+    mask = ~np.isnat(values)
+    return np.asfortranarray(values.view("int64")), mask
+
+
+class NumericAccumulator:
+    """Mergeable count/mean/M2/min/max for a block of numeric columns.
+
+    Every statistic is updated with whole-array NumPy operations over the
+    (rows x columns) block, and two accumulators combine with the pairwise
+    update of Chan et al., so chunks and shards can be profiled separately.
+    """
+
+    def __init__(self, num_columns):
+        self.count = np.zeros(num_columns, dtype="int64")
+        self.missing = np.zeros(num_columns, dtype="int64")
+        self.mean = np.zeros(num_columns, dtype="float64")
+        self.m2 = np.zeros(num_columns, dtype="float64")
+        self.min = np.full(num_columns, np.nan)
+        self.max = np.full(num_columns, np.nan)
+
+    @classmethod
+    def from_block(cls, block, with_range=True):
+        """Accumulate a (rows x columns) float block; with_range=False skips
+        min/max when the caller gets them elsewhere (e.g. from a sort)."""
+        acc = cls(block.shape[1])
+        if block.shape[0] == 0:
+            return acc
+
+        missing = np.isnan(block)
+        count = block.shape[0] - np.count_nonzero(missing, axis=0)
+
+        # One scratch copy: NaN -> 0 for the sum, then centred in place for M2
+        scratch = np.array(block, dtype="float64", order="F")
+        np.copyto(scratch, 0.0, where=missing)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = scratch.sum(axis=0) / count
+        mean = np.where(count > 0, mean, 0.0)
+        scratch -= mean
+        np.copyto(scratch, 0.0, where=missing)
+
+        acc.count = count.astype("int64")
+        acc.missing = (block.shape[0] - count).astype("int64")
+        acc.mean = mean
+        acc.m2 = np.einsum("ij,ij->j", scratch, scratch)
+        if with_range:
+            acc.min = np.fmin.reduce(block, axis=0)
+            acc.max = np.fmax.reduce(block, axis=0)
+        return acc
+
+    def merge(self, other):
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(n > 0, n_b / n, 0.0)
+            cross = np.where(n > 0, n_a * n_b / n, 0.0)
+
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta * delta * cross
+        self.count = n
+        self.missing = self.missing + other.missing
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        return self
+
+    def update(self, block):
+        return self.merge(NumericAccumulator.from_block(block))
+
+    def std(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def means(self):
+        return np.where(self.count > 0, self.mean, np.nan)
+
+
+def sorted_block_stats(block, count):
+    """Median, distinct count, min and max for every column from one sort.
+
+    NaN sorts to the end of each column, so the first ``count`` entries of
+    a column are its non-missing values in order.
+    """
+
+    ordered = np.sort(block, axis=0)
+
+    lower = np.clip((count - 1) // 2, 0, None)
+    upper = np.clip(count // 2, 0, None)
+    if ordered.shape[0] == 0:
+        empty = np.full(block.shape[1], np.nan)
+        return empty, np.zeros(block.shape[1], dtype="int64"), empty, empty
+
+    def at(rows):
+        return np.take_along_axis(ordered, rows[None, :], axis=0)[0]
+
+    has_values = count > 0
+    median = np.where(has_values, (at(lower) + at(upper)) / 2, np.nan)
+    low = np.where(has_values, ordered[0], np.nan)
+    high = np.where(has_values, at(np.clip(count - 1, 0, None)), np.nan)
+
+    changes = ordered[1:] != ordered[:-1]
+    changes &= ~np.isnan(ordered[1:])
+    unique = has_values.astype("int64") + np.count_nonzero(changes, axis=0)
+    return median, unique, low, high
+
+
+def _empty_stats(col, pandas_dtype, col_type):
+    return {
+        "column_name": col,
+        "pandas_dtype": pandas_dtype,
+        "col_type": col_type,
+        "mean": None,
+        "median": None,
+        "std_dev": None,
+        "min_value": None,
+        "max_value": None,
+        "num_missing": 0,
+        "unique_value_count": 0,
+        "distinct_categories": None,
+        "min_datetime": None,
+        "max_datetime": None
+    }
+
+
+def _categorical_stats(series):
+    """Missing count, distinct count and first categories from one factorize."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return (
+        int((codes == -1).sum()),
+        len(uniques),
+        list(uniques[:MAX_DISTINCT_CATEGORIES])
+    )
+
+
+def _datetime_stats(values, mask=None):
+    """Missing/unique/min/max for an int64 nanosecond block in one sort."""
+    if mask is None:
+        mask = values != np.iinfo("int64").min  # NaT
+    filled = np.where(mask, values, np.iinfo("int64").max)
+    ordered = np.sort(filled, axis=0)
+    count = mask.sum(axis=0)
+
+    changes = (ordered[1:] != ordered[:-1]) & (np.arange(1, ordered.shape[0])[:, None] < count[None, :])
+    unique = (count > 0).astype("int64") + changes.sum(axis=0)
+
+    first = ordered[0] if ordered.shape[0] else np.zeros(values.shape[1], dtype="int64")
+    last = np.take_along_axis(ordered, np.clip(count - 1, 0, None)[None, :], axis=0)[0] \
+        if ordered.shape[0] else first
+    return count, unique, first, last
+
+
+def _to_timestamp(value, valid):
+    return pd.Timestamp(int(value)) if valid else None
+
+
+def _numeric_block_stats(block):
+    """Per-column numeric stats for a block, as a dict of arrays."""
+    acc = NumericAccumulator.from_block(block, with_range=False)
+    median, unique, low, high = sorted_block_stats(block, acc.count)
+    return {
+        "mean": acc.means(),
+        "std_dev": acc.std(),
+        "median": median,
+        "min_value": low,
+        "max_value": high,
+        "num_missing": acc.missing,
+        "unique_value_count": unique
+    }
+
+
+def _datetime_block_stats(values, mask=None):
+    """Per-column datetime stats for an int64 nanosecond block."""
+    count, unique, first, last = _datetime_stats(values, mask)
+    return {
+        "count": count,
+        "unique_value_count": unique,
+        "first": first,
+        "last": last
+    }
+
+
+def _assemble_stats(df, groups, numeric, datetime, categorical):
+    """Turn per-kind stat arrays into dataset_column_details dicts."""
+
+    results = {}
+
+    for i, col in enumerate(groups["Numerical"]):
+        stats = _empty_stats(col, str(df[col].dtype), "Numerical")
+        stats.update({
+            "mean": float(numeric["mean"][i]),
+            "median": float(numeric["median"][i]),
+            "std_dev": float(numeric["std_dev"][i]),
+            "min_value": float(numeric["min_value"][i]),
+            "max_value": float(numeric["max_value"][i]),
+            "num_missing": int(numeric["num_missing"][i]),
+            "unique_value_count": int(numeric["unique_value_count"][i])
+        })
+        results[col] = stats
+
+    for col in groups["Categorical"]:
+        missing, unique, categories = categorical[col]
+        stats = _empty_stats(col, str(df[col].dtype), "Categorical")
+        stats.update({
+            "num_missing": missing,
+            "unique_value_count": unique,
+            "distinct_categories": json.dumps(categories, default=str)
+        })
+        results[col] = stats
+
+    for i, col in enumerate(groups["Datetime"]):
+        count = datetime["count"][i]
+        stats = _empty_stats(col, str(df[col].dtype), "Datetime")
+        stats.update({
+            "num_missing": int(len(df) - count),
+            "unique_value_count": int(datetime["unique_value_count"][i]),
+            "min_datetime": _to_timestamp(datetime["first"][i], count > 0),
+            "max_datetime": _to_timestamp(datetime["last"][i], count > 0)
+        })
+        results[col] = stats
+
+    return [results[col] for col in df.columns]
+
+
+def profile_dataframe(df, max_workers=None):
+    """Column-level stats for an in-memory DataFrame.
+
+    Numeric and datetime columns are profiled as 2-D blocks so each stat is
+    one vectorised pass over all columns of that kind; categorical columns
+    are profiled with a single factorize each.
+    max_workers > 1 shards the numeric and datetime columns across a process
+    pool (see profile_dataframe_parallel); results are identical.
+    Returns one dict per column, in DataFrame column order.
+    """
+
+    if max_workers is not None and max_workers > 1:
+        return profile_dataframe_parallel(df, max_workers)
+
+    groups = split_columns(df)
+
+    numeric = _numeric_block_stats(numeric_block(df, groups["Numerical"]))
+    datetime = _datetime_block_stats(*datetime_block(df, groups["Datetime"]))
+    categorical = {col: _categorical_stats(df[col]) for col in groups["Categorical"]}
+
+    return _assemble_stats(df, groups, numeric, datetime, categorical)
+
+
+def _attach_shared_block(name, shape, dtype):
+    """Attach to a parent's shared-memory block without taking ownership."""
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        # Pool workers share the parent's resource tracker, so this
+        # registration is deduplicated and released by the parent's unlink
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf, order="F")
+
+
+def _profile_shard(kind, name, shape, dtype, start, stop):
+    """Process-pool task: profile columns [start, stop) of a shared block."""
+    shm, block = _attach_shared_block(name, shape, dtype)
+    try:
+        shard = block[:, start:stop]
+        if kind == "numeric":
+            return _numeric_block_stats(shard)
+        return _datetime_block_stats(shard)
+    finally:
+        del block, shard
+        shm.close()
+
+
+def _share_block(block):
+    """Copy a block into a new shared-memory segment (Fortran order)."""
+    shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+    shared = np.ndarray(block.shape, dtype=block.dtype, buffer=shm.buf, order="F")
+    shared[...] = block
+    del shared
+    return shm
+
+
+def _column_shards(num_columns, num_shards):
+    bounds = np.linspace(0, num_columns, min(num_shards, num_columns) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _concat_stats(parts):
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def profile_dataframe_parallel(df, max_workers):
+    """profile_dataframe with numeric/datetime columns sharded over processes.
+
+    Each block is copied once into shared memory and every task receives
+    only the segment name and its column range, so the frame is never
+    pickled per task. Categorical columns hold Python objects and are
+    profiled in the parent while the workers run. Column stats do not
+    depend on their neighbours, so the output matches the serial path.
+    """
+
+    groups = split_columns(df)
+    kinds = [
+        ("numeric", numeric_block(df, groups["Numerical"])),
+        ("datetime", datetime_block(df, groups["Datetime"])[0])
+    ]
+
+    segments = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for kind, block in kinds:
+                if block.shape[1] == 0:
+                    continue
+                shm = _share_block(block)
+                segments.append(shm)
+                futures[kind] = [
+                    pool.submit(_profile_shard, kind, shm.name, block.shape, block.dtype, start, stop)
+                    for start, stop in _column_shards(block.shape[1], max_workers)
+                ]
+            del kinds, block
+
+            categorical = {col: _categorical_stats(df[col]) for col in groups["Categorical"]}
+
+            results = {kind: _concat_stats([f.result() for f in parts]) for kind, parts in futures.items()}
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    numeric = results.get("numeric") or _numeric_block_stats(numeric_block(df, []))
+    datetime = results.get("datetime") or _datetime_block_stats(*datetime_block(df, []))
+
+    return _assemble_stats(df, groups, numeric, datetime, categorical)
+
+
+class StreamingProfiler:
+    """Column stats accumulated chunk by chunk for streaming ingestion.
+
+    Numeric columns share one NumericAccumulator updated with each chunk's
+    block. Median and distinct counts are not mergeable; column_stats()
+    takes them from the caller (ingestion computes them in PostgreSQL).
+    """
+
+    def __init__(self, sample):
+        self.columns = list(sample.columns)
+        self.dtypes = {col: str(sample[col].dtype) for col in self.columns}
+        self.groups = split_columns(sample)
+        self.numeric = NumericAccumulator(len(self.groups["Numerical"]))
+        self.missing = {col: 0 for col in self.columns}
+        self.categories = {col: [] for col in self.groups["Categorical"]}
+        self.datetime_range = {col: (None, None) for col in self.groups["Datetime"]}
+
+    def update(self, chunk):
+        numeric_cols = self.groups["Numerical"]
+        if numeric_cols:
+            self.numeric.update(numeric_block(chunk, numeric_cols))
+
+        for col in self.groups["Categorical"]:
+            series = chunk[col]
+            self.missing[col] += int(series.isnull().sum())
+            seen = self.categories[col]
+            if len(seen) < MAX_DISTINCT_CATEGORIES:
+                for value in pd.unique(series.dropna()):
+                    if value not in seen:
+                        seen.append(value)
+                        if len(seen) == MAX_DISTINCT_CATEGORIES:
+                            break
+
+        datetime_cols = self.groups["Datetime"]
+        if datetime_cols:
+            values, mask = datetime_block(chunk, datetime_cols)
+            for i, col in enumerate(datetime_cols):
+                self.missing[col] += int((~mask[:, i]).sum())
+                valid = values[mask[:, i], i]
+                if valid.size == 0:
+                    continue
+                low, high = self.datetime_range[col]
+                chunk_low, chunk_high = int(valid.min()), int(valid.max())
+                self.datetime_range[col] = (
+                    chunk_low if low is None else min(low, chunk_low),
+                    chunk_high if high is None else max(high, chunk_high)
+                )
+
+    def column_stats(self, medians, unique_counts):
+        """Finalize stats; medians/unique_counts are dicts keyed by column."""
+
+        results = {}
+        means, stds = self.numeric.means(), self.numeric.std()
+
+        for i, col in enumerate(self.groups["Numerical"]):
+            stats = _empty_stats(col, self.dtypes[col], "Numerical")
+            median = medians.get(col)
+            stats.update({
+                "mean": float(means[i]),
+                "median": float(median) if median is not None else float("nan"),
+                "std_dev": float(stds[i]),
+                "min_value": float(self.numeric.min[i]),
+                "max_value": float(self.numeric.max[i]),
+                "num_missing": int(self.numeric.missing[i])
+            })
+            results[col] = stats
+
+        for col in self.groups["Categorical"]:
+            stats = _empty_stats(col, self.dtypes[col], "Categorical")
+            stats.update({
+                "num_missing": self.missing[col],
+                "distinct_categories": json.dumps(self.categories[col], default=str)
+            })
+            results[col] = stats
+
+        for col in self.groups["Datetime"]:
+            low, high = self.datetime_range[col]
+            stats = _empty_stats(col, self.dtypes[col], "Datetime")
+            stats.update({
+                "num_missing": self.missing[col],
+                "min_datetime": pd.Timestamp(low) if low is not None else None,
+                "max_datetime": pd.Timestamp(high) if high is not None else None
+            })
+            results[col] = stats
+
+        for col in self.columns:
+            results[col]["unique_value_count"] = int(unique_counts.get(col, 0))
+
+        return [results[col] for col in self.columns]
@@ -0,0 +1,249 @@
+#replica.py
+# Columnar replica of dataset_X_data for analytical queries. Each dataset
+# version is exported from PostgreSQL to one Parquet file and queried
+# through an embedded DuckDB connection, where aggregations over wide
+# tables only read the columns they use. PostgreSQL stays the system of
+# record: the replica is rebuilt whenever the dataset version changes,
+# and a query that has no current replica (or fails in DuckDB) is left
+# to PostgreSQL by the caller. A failed export leaves a marker file so the
+# same version is not exported again on every page load.
+import glob
+import json
+import os
+import re
+
+from sqlalchemy import text
+
+from db_utils.arrow_io import pa
+from db_utils.db_config import get_engine, get_replica_dir
+from db_utils.Ingestion import table_column_types
+from db_utils.Retrieval import stream_query, ROW_ID_COLUMN
+
+try:
+    import duckdb
+    import pyarrow.parquet as pq
+except ImportError:  # duckdb is optional; without it every query goes to PostgreSQL
+    duckdb = None
+
+# Rows fetched from PostgreSQL and written per Parquet row group
+EXPORT_CHUNK_ROWS = 100_000
+
+_NUMERIC_RE = re.compile(r'^NUMERIC\((\d+),\s*(\d+)\)$')
+
+# Queries worth running on the column store: aggregates, grouping, distinct, windows
+_ANALYTICAL_RE = re.compile(
+    r'\b(?:GROUP\s+BY|DISTINCT|OVER\s*\(|(?:COUNT|SUM|AVG|MIN|MAX|STDDEV\w*|VARIANCE|VAR_\w+|'
+    r'MEDIAN|QUANTILE\w*|PERCENTILE_\w+|CORR|MODE)\s*\()',
+    re.IGNORECASE
+)
+
+# DuckDB can read and write files and install extensions from SQL; none of that is allowed
+_FORBIDDEN_RE = re.compile(
+    r'\b(?:read_\w+|\w+_scan|glob|attach|detach|copy|export|import|install|load|pragma|set|call)\b',
+    re.IGNORECASE
+)
+
+
+def replica_available():
+    """True when duckdb and pyarrow are installed and REPLICA_DIR is set."""
+    return duckdb is not None and pa is not None and bool(get_replica_dir())
+
+
+def replica_path(dataset_id, dataset_version, replica_dir=None):
+    replica_dir = replica_dir or get_replica_dir()
+    return os.path.join(replica_dir, f"dataset_{dataset_id}_v{dataset_version}.parquet")
+
+
+def _failed_marker(path):
+    return f"{path}.failed"
+
+
+def _arrow_type(col_type):
+    kind = col_type["kind"]
+    sql_type = col_type["sql_type"]
+    if kind == "int":
+        return {"SMALLINT": pa.int16(), "INTEGER": pa.int32()}.get(sql_type, pa.int64())
+    if kind == "float":
+        return pa.float32() if sql_type == "REAL" else pa.float64()
+    if kind == "bool":
+        return pa.bool_()
+    if kind == "datetime":
+        return pa.date32() if sql_type == "DATE" else pa.timestamp("us")
+
+    numeric = _NUMERIC_RE.match(sql_type)
+    if numeric:
+        precision, scale = int(numeric.group(1)), int(numeric.group(2))
+        if precision <= 38:
+            return pa.decimal128(precision, scale)
+        if precision <= 76:
+            return pa.decimal256(precision, scale)
+    if sql_type == "BYTEA":
+        return pa.binary()
+    # Unconstrained NUMERIC, JSON/JSONB, ENUM and text are exported as strings
+    return pa.string()
+
+
+def _arrow_ready(chunk, schema):
+    """Convert the Python objects psycopg2 returns into values Arrow accepts
+    for schema: dict/list (JSONB) to JSON text, memoryview (BYTEA) to bytes,
+    anything else bound for a string column (e.g. Decimal) to str."""
+
+    for field in schema:
+        if field.name not in chunk.columns or chunk[field.name].dtype != object:
+            continue
+        values = chunk[field.name]
+        if pa.types.is_binary(field.type):
+            chunk[field.name] = values.map(lambda v: bytes(v) if isinstance(v, memoryview) else v)
+        elif pa.types.is_string(field.type):
+            chunk[field.name] = values.map(
+                lambda v: v if v is None or isinstance(v, str)
+                else json.dumps(v) if isinstance(v, (dict, list))
+                else str(v)
+            )
+    return chunk
+
+
+def _dataset_version(conn, dataset_id):
+    return conn.execute(
+        text("""
+            SELECT table_name, dataset_version
+            FROM datasets_metadata
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    ).fetchone()
+
+
+def remove_replica(dataset_id, keep_version=None, replica_dir=None):
+    """Delete the replica files (and failed-export markers) of a dataset,
+    except keep_version's replica."""
+
+    replica_dir = replica_dir or get_replica_dir()
+    if not replica_dir:
+        return
+
+    keep = replica_path(dataset_id, keep_version, replica_dir) if keep_version is not None else None
+    paths = glob.glob(os.path.join(replica_dir, f"dataset_{dataset_id}_v*.parquet"))
+    paths += glob.glob(os.path.join(replica_dir, f"dataset_{dataset_id}_v*.parquet.failed"))
+    for path in paths:
+        if path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def build_replica(dataset_id, engine, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Export the current version of a dataset to Parquet.
+
+    The Arrow schema comes from the table's PostgreSQL column types, so
+    every chunk is written with the same types. The file is written under
+    a temporary name and renamed, so readers never see a partial replica.
+    Returns the replica path, or None when replicas are unavailable or the
+    dataset does not exist. A failed export is recorded in a marker file
+    next to the replica path (see ensure_replica) and re-raised.
+    """
+
+    if not replica_available():
+        return None
+
+    with engine.connect() as conn:
+        dataset = _dataset_version(conn, dataset_id)
+        if dataset is None:
+            return None
+
+        column_types = table_column_types(conn, dataset.table_name)
+        column_types.pop(ROW_ID_COLUMN, None)
+        schema = pa.schema([(col, _arrow_type(col_type)) for col, col_type in column_types.items()])
+
+        path = replica_path(dataset_id, dataset.dataset_version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.partial"
+
+        writer = pq.ParquetWriter(tmp_path, schema)
+        try:
+            for chunk in stream_query(conn, f"SELECT * FROM {dataset.table_name}", chunk_rows):
+                chunk = _arrow_ready(chunk, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        except Exception as e:
+            writer.close()
+            os.remove(tmp_path)
+            with open(_failed_marker(path), "w") as marker:
+                marker.write(f"{type(e).__name__}: {e}\n")
+            raise
+        writer.close()
+
+    os.replace(tmp_path, path)
+    if os.path.exists(_failed_marker(path)):
+        os.remove(_failed_marker(path))
+    remove_replica(dataset_id, keep_version=dataset.dataset_version)
+    return path
+
+
+def ensure_replica(dataset_id, engine):
+    """Path of the current replica, building it when it is missing or stale.
+
+    Returns None without retrying when the export of the current version
+    already failed; a new dataset version (or build_replica) tries again.
+    """
+
+    if not replica_available():
+        return None
+
+    with engine.connect() as conn:
+        dataset = _dataset_version(conn, dataset_id)
+    if dataset is None:
+        return None
+
+    path = replica_path(dataset_id, dataset.dataset_version)
+    if os.path.exists(path):
+        return path
+    if os.path.exists(_failed_marker(path)):
+        return None
+    return build_replica(dataset_id, engine)
+
+
+def run_replica_build(dataset_id, engine=None):
+    """Worker entry point: ensure_replica for one dataset. Returns the path
+    or None; a failed export is printed (and marked), not raised."""
+
+    engine = engine or get_engine()
+    try:
+        return ensure_replica(dataset_id, engine)
+    except Exception as e:
+        print(f"Replica build failed for dataset {dataset_id}: {e}")
+        return None
+
+
+def is_analytical_query(sql):
+    """Aggregating queries go to the replica; row lookups stay on PostgreSQL's indexes."""
+    return bool(_ANALYTICAL_RE.search(sql)) and not _FORBIDDEN_RE.search(sql)
+
+
+def query_replica(dataset_id, sql, engine):
+    """Run a validated SELECT against the current replica.
+
+    The dataset table name in sql resolves to a DuckDB view over the
+    Parquet file. Returns a DataFrame, or None when there is no replica
+    for the current dataset version; DuckDB errors are raised.
+    """
+
+    if not replica_available() or _FORBIDDEN_RE.search(sql):
+        return None
+
+    with engine.connect() as conn:
+        dataset = _dataset_version(conn, dataset_id)
+    if dataset is None:
+        return None
+
+    path = replica_path(dataset_id, dataset.dataset_version)
+    if not os.path.exists(path):
+        return None
+
+    quoted_path = path.replace("'", "''")
+    con = duckdb.connect()
+    try:
+        con.execute(f"CREATE VIEW {dataset.table_name} AS SELECT * FROM read_parquet('{quoted_path}');")
+        return con.execute(sql).df()
+    finally:
+        con.close()
@@ -0,0 +1,189 @@
+#result_cache.py
+# Cache of query results against dataset tables. Entries are keyed by the
+# normalized SQL, its parameters, the dataset_id and the dataset_version,
+# so an append (which bumps the version) makes older results unreachable
+# as long as callers key lookups with the version currently committed in
+# datasets_metadata (see Retrieval.cached_query), whichever process ran the
+# append; invalidate() also frees the local entries right away.
+# Results live in a byte-bounded in-process LRU and, when a directory is
+# configured, in Arrow IPC files shared by every process on the host.
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from db_utils.arrow_io import pa
+
+try:
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pyarrow is optional; without it only the memory tier is used
+    pa_ipc = None
+
+# Quoted literals/identifiers are kept verbatim; everything else is case- and whitespace-folded
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql):
+    """Fold case and whitespace outside quotes and drop a trailing semicolon,
+    so trivially different spellings of a query share a cache entry."""
+
+    parts = _QUOTED_RE.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if index % 2 else re.sub(r"\s+", " ", part).lower()
+        for index, part in enumerate(parts)
+    )
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class QueryResultCache:
+    """Two-tier result cache: memory LRU bounded by max_bytes, then Arrow
+    files under disk_dir bounded by max_disk_bytes (oldest files evicted).
+
+    DataFrames are copied on the way in and out, so callers may modify them.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir if disk_dir and pa_ipc is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(dataset_id, dataset_version, sql, params=None, fetch="pandas"):
+        """fetch names the path that produced the DataFrame ("pandas",
+        "arrow", ...), so results with different dtype families never mix."""
+        payload = json.dumps([normalize_sql(sql), params or {}, fetch], sort_keys=True, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return dataset_id, dataset_version, digest
+
+    def _disk_path(self, key):
+        dataset_id, dataset_version, digest = key
+        return os.path.join(self.disk_dir, f"dataset_{dataset_id}_v{dataset_version}_{digest}.arrow")
+
+    def _remember(self, key, df):
+        size = _frame_bytes(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def get(self, key):
+        """Cached DataFrame for key, or None."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0].copy()
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                with pa.memory_map(path, "r") as source:
+                    df = pa_ipc.open_file(source).read_all().to_pandas()
+            except (FileNotFoundError, pa.ArrowInvalid):
+                df = None
+            if df is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, df)
+                return df.copy()
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, df):
+        df = df.copy()
+        self._remember(key, df)
+
+        if self.disk_dir is not None:
+            try:
+                self._write_disk(key, df)
+            except (pa.ArrowException, TypeError, ValueError, OSError):
+                # Frames Arrow cannot hold (e.g. mixed-type object columns) stay memory-only
+                pass
+
+    def _write_disk(self, key, df):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.partial"
+
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa_ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+        files = sorted(
+            (os.path.getmtime(f), os.path.getsize(f), f)
+            for f in glob.glob(os.path.join(self.disk_dir, "dataset_*.arrow"))
+        )
+        total = sum(size for _, size, _ in files)
+        for _, size, f in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, dataset_id=None):
+        """Drop the results of one dataset (every version), or everything."""
+
+        with self._lock:
+            for key in [k for k in self._entries if dataset_id is None or k[0] == dataset_id]:
+                self._bytes -= self._entries.pop(key)[1]
+
+        if self.disk_dir is not None:
+            pattern = "dataset_*.arrow" if dataset_id is None else f"dataset_{dataset_id}_v*.arrow"
+            for path in glob.glob(os.path.join(self.disk_dir, pattern)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        disk_bytes = 0
+        disk_entries = 0
+        if self.disk_dir is not None:
+            for path in glob.glob(os.path.join(self.disk_dir, "dataset_*.arrow")):
+                try:
+                    disk_bytes += os.path.getsize(path)
+                    disk_entries += 1
+                except FileNotFoundError:
+                    pass
+
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes
+            }
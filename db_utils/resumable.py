@@ -0,0 +1,478 @@
+#resumable.py
+# Checkpointed ingestion for very large files. Rows are loaded into a
+# staging table in batches that each commit together with a checkpoint
+# (byte offset for CSV, row group / record batch for Arrow files, plus the
+# profiler and sketch and pairwise state). A crashed load resumes from the last checkpoint, and the
+# dataset only becomes visible when the staging table is renamed to
+# dataset_X_data in the same transaction that publishes its metadata.
+import io
+import json
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils.Ingestion import (
+    IngestionCancelled,
+    SCHEMA_SAMPLE_ROWS,
+    compute_file_hash,
+    copy_dataframe_to_table,
+    create_row_key_index,
+    estimate_row_count,
+    _create_dataset_table,
+    _insert_column_stats,
+    _insert_dataset_metadata,
+    _query_median_and_distinct,
+    _stream_dtypes
+)
+from db_utils.arrow_io import ArrowSource, arrow_column_types, detect_file_format
+from db_utils.pairwise import (
+    GroupAggregator,
+    PairwiseAccumulator,
+    PairwiseProfiler,
+    query_spearman,
+    write_pairwise_stats
+)
+from db_utils.partitioning import TablePartitioner, plan_partitions
+from db_utils.profiler import StreamingProfiler
+from db_utils.sketches import DatasetSketcher, sketch_from_record, write_column_sketches
+from db_utils.type_inference import apply_column_types, infer_column_types
+
+# Target bytes of CSV per committed batch
+CHECKPOINT_BATCH_BYTES = 64 * 1024 * 1024
+
+# Checkpoints not advanced for this long are abandoned and their staging tables dropped
+STALE_CHECKPOINT_DAYS = 7
+
+# NumericAccumulator arrays saved in a checkpoint
+NUMERIC_STATE_FIELDS = ("count", "missing", "mean", "m2", "min", "max")
+
+
+def _read_csv_record(f, quotes=0):
+    """Read lines until the quote count is even, i.e. a whole CSV record."""
+    data = b""
+    while True:
+        line = f.readline()
+        if not line:
+            return data
+        data += line
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            return data
+
+
+def _read_csv_block(f, target_bytes):
+    """About target_bytes of CSV, extended to the end of the last record.
+
+    A record ends at a newline outside quotes; with RFC 4180 quoting ("" for
+    a literal quote) that is a newline after an even number of quotes.
+    """
+
+    block = f.read(target_bytes)
+    if not block:
+        return block
+
+    quotes = block.count(b'"')
+    if block.endswith(b"\n") and quotes % 2 == 0:
+        return block
+    return block + _read_csv_record(f, quotes)
+
+
+def _csv_segments(file_path, byte_offset, columns, dtypes, column_types, batch_bytes):
+    with open(file_path, "rb") as f:
+        if byte_offset == 0:
+            _read_csv_record(f)
+        else:
+            f.seek(byte_offset)
+
+        while True:
+            block = _read_csv_block(f, batch_bytes)
+            if not block.strip():
+                return
+            chunk = pd.read_csv(io.BytesIO(block), header=None, names=columns, dtype=dtypes)
+            yield f.tell(), [apply_column_types(chunk, column_types)]
+
+
+def _encode_state(state):
+    """Profiler, sketch, pairwise and partition state as an .npz archive.
+
+    Arrays are stored as arrays (the sketches in their to_bytes layout) and
+    everything else goes in a JSON header, so a checkpoint is read back with
+    allow_pickle=False and never executes code.
+    """
+
+    profiler, sketcher, pairwise, partitioner = state
+    arrays = {f"numeric_{name}": getattr(profiler.numeric, name) for name in NUMERIC_STATE_FIELDS}
+    arrays["correlation"] = np.frombuffer(pairwise.correlation.to_bytes(), dtype=np.float64)
+
+    sketches = []
+    for i, col in enumerate(sketcher.columns):
+        sketch = sketcher.sketches[col]
+        arrays[f"hll_{i}"] = sketch.hll.registers
+        if sketch.quantiles is not None:
+            arrays[f"kll_{i}"] = np.frombuffer(sketch.quantiles.to_bytes(), dtype=np.float64)
+        if sketch.frequencies is not None:
+            arrays[f"cms_{i}"] = sketch.frequencies.table
+        sketches.append({
+            "kind": sketch.kind,
+            "count": sketch.count,
+            "top_values": sketch.frequencies.candidates if sketch.frequencies is not None else None
+        })
+
+    header = {
+        "columns": profiler.columns,
+        "dtypes": profiler.dtypes,
+        "missing": profiler.missing,
+        "categories": profiler.categories,
+        "datetime_range": profiler.datetime_range,
+        "sketches": sketches,
+        "group_overflow": sorted(pairwise.groups.overflow),
+        "group_aggregates": {col: pairwise.groups.aggregates(col) for col in pairwise.groups.state},
+        "partitioner": partitioner.to_state() if partitioner is not None else None
+    }
+    arrays["header"] = np.frombuffer(json.dumps(header, default=str).encode(), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _decode_state(data):
+    """Inverse of _encode_state: (profiler, sketcher, pairwise, partitioner)."""
+
+    with np.load(io.BytesIO(bytes(data)), allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    header = json.loads(arrays["header"].tobytes())
+
+    # The accumulators are built for an empty frame of the original dtypes,
+    # which gives the same column groups, then filled from the checkpoint
+    sample = pd.DataFrame({col: pd.Series(dtype=header["dtypes"][col]) for col in header["columns"]})
+
+    profiler = StreamingProfiler(sample)
+    profiler.dtypes = header["dtypes"]
+    for name in NUMERIC_STATE_FIELDS:
+        setattr(profiler.numeric, name, arrays[f"numeric_{name}"])
+    profiler.missing = header["missing"]
+    profiler.categories = header["categories"]
+    profiler.datetime_range = {col: tuple(bounds) for col, bounds in header["datetime_range"].items()}
+
+    sketcher = DatasetSketcher(sample)
+    for i, (col, sketch) in enumerate(zip(sketcher.columns, header["sketches"])):
+        sketcher.sketches[col] = sketch_from_record({
+            "sketch_kind": sketch["kind"],
+            "value_count": sketch["count"],
+            "hll_registers": arrays[f"hll_{i}"].tobytes(),
+            "quantile_sketch": arrays[f"kll_{i}"].tobytes() if f"kll_{i}" in arrays else None,
+            "cms_table": arrays[f"cms_{i}"].tobytes() if f"cms_{i}" in arrays else None,
+            "top_values": sketch["top_values"]
+        })
+
+    pairwise = PairwiseProfiler(sample)
+    pairwise.correlation = PairwiseAccumulator.from_bytes(pairwise.numeric_columns, arrays["correlation"].tobytes())
+    groups = pairwise.groups
+    groups.overflow = set(header["group_overflow"])
+    for col, aggregates in header["group_aggregates"].items():
+        groups.state[col] = GroupAggregator.from_aggregates(col, groups.value_columns, aggregates).state[col]
+
+    partitioner = header["partitioner"]
+    if partitioner is not None:
+        partitioner = TablePartitioner.from_state(partitioner)
+
+    return profiler, sketcher, pairwise, partitioner
+
+
+def _load_checkpoint(conn, user_id, file_hash):
+    return conn.execute(
+        text("""
+            SELECT checkpoint_id, staging_table, file_format, column_types, read_dtypes,
+                   byte_offset, batches_loaded, rows_loaded, profiler_state
+            FROM ingestion_checkpoints
+            WHERE owner_user_id = :user_id
+              AND file_hash = :file_hash
+            FOR UPDATE;
+        """),
+        {"user_id": user_id, "file_hash": file_hash}
+    ).fetchone()
+
+
+def _start_checkpoint(engine, file_path, original_filename, user_id, file_hash, file_format, sample_rows,
+                      partition_rows=None, partition_method="range"):
+    """Infer the schema, create the staging table and record an empty checkpoint."""
+
+    if file_format == "csv":
+        sample = pd.read_csv(file_path, nrows=sample_rows)
+        dtypes = _stream_dtypes(sample)
+        sample = sample.astype(dtypes)
+        column_types = infer_column_types(sample, streaming=True)
+        sample = apply_column_types(sample, column_types)
+    else:
+        with ArrowSource(file_path, file_format) as source:
+            column_types = arrow_column_types(source.schema)
+            sample = next(source.iter_frames(column_types))
+        dtypes = None
+
+    state = [StreamingProfiler(sample), DatasetSketcher(sample), PairwiseProfiler(sample), None]
+
+    with engine.begin() as conn:
+        checkpoint_id = conn.execute(
+            text("""
+                INSERT INTO ingestion_checkpoints
+                (owner_user_id, file_hash, original_filename, file_format, column_types, read_dtypes, profiler_state)
+                VALUES
+                (:user_id, :file_hash, :original_filename, :file_format,
+                 CAST(:column_types AS JSONB), CAST(:read_dtypes AS JSONB), :profiler_state)
+                RETURNING checkpoint_id;
+            """),
+            {
+                "user_id": user_id,
+                "file_hash": file_hash,
+                "original_filename": original_filename,
+                "file_format": file_format,
+                "column_types": json.dumps(column_types),
+                "read_dtypes": json.dumps(dtypes),
+                "profiler_state": _encode_state(state)
+            }
+        ).scalar_one()
+
+        staging_table = f"staging_{checkpoint_id}_data"
+        state[3] = plan_partitions(staging_table, column_types, sample,
+                                   estimate_row_count(file_path, file_format),
+                                   partition_rows, partition_method)
+        _create_dataset_table(conn, staging_table, column_types, state[3])
+
+        conn.execute(
+            text("""
+                UPDATE ingestion_checkpoints
+                SET staging_table = :staging_table, profiler_state = :profiler_state
+                WHERE checkpoint_id = :checkpoint_id;
+            """),
+            {
+                "staging_table": staging_table,
+                "profiler_state": _encode_state(state),
+                "checkpoint_id": checkpoint_id
+            }
+        )
+
+        return _load_checkpoint(conn, user_id, file_hash)
+
+
+def _commit_batch(engine, checkpoint, frames, position, rows_loaded, state):
+    """COPY one batch into staging and advance the checkpoint, atomically."""
+
+    column = "byte_offset" if checkpoint.file_format == "csv" else "batches_loaded"
+    partitioner = state[3]
+    next_row_id = rows_loaded - sum(len(frame) for frame in frames) + 1
+
+    with engine.begin() as conn:
+        for frame in frames:
+            if partitioner is not None:
+                partitioner.prepare(conn, frame, next_row_id)
+            copy_dataframe_to_table(conn, frame, checkpoint.staging_table, first_row_id=next_row_id)
+            next_row_id += len(frame)
+
+        updated = conn.execute(
+            text(f"""
+                UPDATE ingestion_checkpoints
+                SET {column} = :position, rows_loaded = :rows_loaded,
+                    profiler_state = :profiler_state, updated_at = NOW()
+                WHERE checkpoint_id = :checkpoint_id
+                  AND rows_loaded = :previous_rows;
+            """),
+            {
+                "position": position,
+                "rows_loaded": rows_loaded,
+                "profiler_state": _encode_state(state),
+                "checkpoint_id": checkpoint.checkpoint_id,
+                "previous_rows": rows_loaded - sum(len(frame) for frame in frames)
+            }
+        ).rowcount
+
+        if updated != 1:
+            raise RuntimeError(f"Checkpoint {checkpoint.checkpoint_id} was advanced by another loader")
+
+
+def discard_checkpoint(engine, checkpoint_id):
+    """Drop a checkpoint and its staging table."""
+
+    with engine.begin() as conn:
+        staging_table = conn.execute(
+            text("""
+                DELETE FROM ingestion_checkpoints
+                WHERE checkpoint_id = :checkpoint_id
+                RETURNING staging_table;
+            """),
+            {"checkpoint_id": checkpoint_id}
+        ).scalar_one_or_none()
+
+        if staging_table:
+            conn.execute(text(f"DROP TABLE IF EXISTS {staging_table};"))
+
+
+def discard_stale_checkpoints(engine, max_age_days=STALE_CHECKPOINT_DAYS):
+    """Abandon checkpoints that have not advanced for max_age_days.
+    Returns the number discarded."""
+
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT checkpoint_id
+                FROM ingestion_checkpoints
+                WHERE updated_at < NOW() - make_interval(days => :max_age_days);
+            """),
+            {"max_age_days": max_age_days}
+        ).fetchall()
+
+    for row in rows:
+        discard_checkpoint(engine, row.checkpoint_id)
+
+    return len(rows)
+
+
+def ingest_dataset_resumable(file_path, original_filename, user_id, engine, file_hash=None,
+                             file_format=None, batch_bytes=CHECKPOINT_BATCH_BYTES,
+                             sample_rows=SCHEMA_SAMPLE_ROWS, progress_callback=None,
+                             partition_rows=None, partition_method="range"):
+    """Checkpointed version of ingest_dataset for very large files.
+
+    The load is keyed by (user_id, file_hash): calling this again for the
+    same file after a crash or error continues from the last committed batch
+    instead of starting over. Schema inference and profiling follow
+    ingest_dataset's streaming mode; stats are published with the dataset.
+
+    Returns the same result dict as ingest_dataset plus "resumed" and
+    "rows_resumed". A cancelled load (IngestionCancelled raised from
+    progress_callback) discards its checkpoint; other failures keep it.
+
+    partition_rows / partition_method partition the table as in
+    ingest_dataset; the layout is fixed when the checkpoint is created.
+    """
+
+    if file_format is None:
+        file_format = detect_file_format(original_filename)
+
+    ingestion_result = {
+        "success": False,
+        "dataset_id": None,
+        "error": None,
+        "cancelled": False,
+        "load_method": "copy",
+        "file_format": file_format,
+        "load_seconds": None,
+        "rows_per_sec": None,
+        "resumed": False,
+        "rows_resumed": 0,
+        "partitioning": None
+    }
+
+    def report(phase, rows_loaded=0):
+        if progress_callback is not None:
+            progress_callback(phase, rows_loaded)
+
+    checkpoint = None
+
+    try:
+        file_hash = file_hash or compute_file_hash(file_path)
+
+        with engine.begin() as conn:
+            checkpoint = _load_checkpoint(conn, user_id, file_hash)
+
+        if checkpoint is None:
+            report("parsing")
+            checkpoint = _start_checkpoint(engine, file_path, original_filename, user_id,
+                                           file_hash, file_format, sample_rows,
+                                           partition_rows, partition_method)
+        else:
+            ingestion_result["resumed"] = True
+            ingestion_result["rows_resumed"] = checkpoint.rows_loaded
+            print(f"Resuming {checkpoint.staging_table} at row {checkpoint.rows_loaded}")
+
+        column_types = checkpoint.column_types
+        profiler, sketcher, pairwise, partitioner = _decode_state(checkpoint.profiler_state)
+        rows_loaded = checkpoint.rows_loaded
+
+        if checkpoint.file_format == "csv":
+            segments = _csv_segments(file_path, checkpoint.byte_offset, profiler.columns,
+                                     checkpoint.read_dtypes, column_types, batch_bytes)
+            source = None
+        else:
+            source = ArrowSource(file_path, checkpoint.file_format)
+            segments = source.iter_segments(column_types, start=checkpoint.batches_loaded)
+
+        load_start = time.perf_counter()
+        report("loading", rows_loaded)
+
+        try:
+            for position, frames in segments:
+                for frame in frames:
+                    profiler.update(frame)
+                    sketcher.update(frame)
+                    pairwise.update(frame)
+                rows_loaded += sum(len(frame) for frame in frames)
+                _commit_batch(engine, checkpoint, frames, position, rows_loaded,
+                              (profiler, sketcher, pairwise, partitioner))
+                report("loading", rows_loaded)
+                print(f"Checkpointed {rows_loaded} rows into {checkpoint.staging_table}")
+        finally:
+            if source is not None:
+                source.close()
+
+        load_seconds = time.perf_counter() - load_start
+        rows_this_run = rows_loaded - ingestion_result["rows_resumed"]
+        ingestion_result["load_seconds"] = load_seconds
+        ingestion_result["rows_per_sec"] = rows_this_run / load_seconds if load_seconds > 0 else None
+
+        # Publish: metadata, rename and stats become visible in one commit
+        report("profiling", rows_loaded)
+
+        with engine.begin() as conn:
+            if _load_checkpoint(conn, user_id, file_hash) is None:
+                raise RuntimeError("Checkpoint was discarded before publishing")
+
+            dataset_metadata = {
+                "dataset_name": os.path.splitext(original_filename)[0],
+                "file_path": original_filename,
+                "upload_date": date.today(),
+                "num_rows": rows_loaded,
+                "num_columns": len(profiler.columns),
+                "owner_user_id": user_id,
+                "column_names": profiler.columns,
+                "file_hash": file_hash
+            }
+
+            dataset_id, table_name = _insert_dataset_metadata(conn, dataset_metadata)
+            conn.execute(text(f"ALTER TABLE {checkpoint.staging_table} RENAME TO {table_name};"))
+            if partitioner is not None:
+                partitioner.rename(conn, table_name)
+            create_row_key_index(conn, table_name)
+
+            medians, unique_counts = _query_median_and_distinct(conn, table_name, profiler)
+            column_stats = profiler.column_stats(medians, unique_counts)
+            for stats in column_stats:
+                stats["sql_type"] = column_types[stats["column_name"]]["sql_type"]
+
+            report("writing metadata", rows_loaded)
+            _insert_column_stats(conn, dataset_id, column_stats)
+            write_column_sketches(conn, dataset_id, sketcher)
+            spearman = query_spearman(conn, table_name, pairwise.numeric_columns)
+            write_pairwise_stats(conn, dataset_id, 1, pairwise, spearman)
+
+            conn.execute(
+                text("DELETE FROM ingestion_checkpoints WHERE checkpoint_id = :checkpoint_id;"),
+                {"checkpoint_id": checkpoint.checkpoint_id}
+            )
+
+        ingestion_result["dataset_id"] = dataset_id
+        ingestion_result["success"] = True
+        if partitioner is not None:
+            ingestion_result["partitioning"] = {"method": partitioner.method, "key": partitioner.key}
+
+    except Exception as e:
+        ingestion_result["error"] = str(e)
+        ingestion_result["cancelled"] = isinstance(e, IngestionCancelled)
+        if ingestion_result["cancelled"] and checkpoint is not None:
+            discard_checkpoint(engine, checkpoint.checkpoint_id)
+
+    return ingestion_result
@@ -0,0 +1,420 @@
+#sketches.py
+# Mergeable distribution sketches built at ingest, one set per column:
+#   - HyperLogLog for distinct counts (every column)
+#   - KLL quantile sketch, plus equi-width / equi-depth histograms derived
+#     from it (numeric and datetime columns)
+#   - count-min sketch with a heavy-hitter list for top-k (categorical columns)
+# All of them are updated chunk by chunk with NumPy and merge exactly, so
+# streamed and appended data never need a rescan of dataset_X_data.
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from db_utils.profiler import split_columns, numeric_block, datetime_block
+
+# HyperLogLog precision: 2**12 registers, ~1.6% standard error
+HLL_PRECISION = 12
+
+# KLL accuracy parameter: ~1.7% normalized rank error (99% confidence) at k=200;
+# the error scales as 1/k, so ~1% would need k of about 330
+KLL_K = 200
+
+# Count-min sketch shape: error <= e/width * N with probability 1 - e**-depth
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+
+# Heavy-hitter candidates tracked (top-k queries use the first TOP_K)
+TOP_K = 20
+
+# Bins of the derived histograms
+HISTOGRAM_BINS = 20
+
+# Fixed 16-byte keys for pandas' SipHash: one for HLL, one per CMS row
+_HLL_KEY = "eda-assistant-hl"
+_CMS_KEYS = ["eda-assistant-c0", "eda-assistant-c1", "eda-assistant-c2", "eda-assistant-c3"][:CMS_DEPTH]
+
+
+def _hash(values, key):
+    """Stable 64-bit hashes of a 1-D array (identical across processes)."""
+    return pd.util.hash_array(np.asarray(values), hash_key=key, categorize=False)
+
+
+def _bit_length(values):
+    """Bit length of each uint64 value, exact (split into 32-bit halves)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        high_bits = np.where(high > 0, np.floor(np.log2(high)) + 33, 0)
+        low_bits = np.where(low > 0, np.floor(np.log2(low)) + 1, 0)
+    return np.where(high > 0, high_bits, low_bits).astype(np.int64)
+
+
+class HyperLogLog:
+    """Distinct-count sketch; merge is an element-wise max of registers."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def update_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        rest = (hashes << p) >> p
+        rank = (64 - self.precision) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(int(math.log2(len(registers))), registers)
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang, Liberty) over float64 values.
+
+    Level h holds items of weight 2**h. When a level overflows, it is sorted
+    and its upper part is compacted: every other item (random offset) is
+    promoted to the next level. The lower half of the capacity stays in
+    place, so bulk updates keep the same accuracy as item-by-item ones
+    while memory stays O(k log n).
+    """
+
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        compacted = True
+        while compacted:
+            compacted = False
+            for level in range(len(self.levels)):
+                items = self.levels[level]
+                if len(items) <= self._capacity(level):
+                    continue
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                keep = self._capacity(level) // 2
+                keep += (len(items) - keep) % 2
+                promoted = items[keep + self._rng.integers(2)::2]
+                self.levels[level] = items[:keep]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                compacted = True
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.levels[0] = np.concatenate([self.levels[0], values.astype(np.float64)])
+        self._compress()
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2.0 ** h) for h, items_h in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return [None for _ in qs]
+        items, cumulative = self._weighted()
+        total = cumulative[-1]
+        result = []
+        for q in qs:
+            if q <= 0:
+                result.append(self.min)
+            elif q >= 1:
+                result.append(self.max)
+            else:
+                position = min(int(np.searchsorted(cumulative, q * total)), len(items) - 1)
+                result.append(float(items[position]))
+        return result
+
+    def ranks(self, values):
+        """Estimated fraction of values <= each of values."""
+        if self.n == 0:
+            return np.zeros(len(values))
+        items, cumulative = self._weighted()
+        positions = np.searchsorted(items, values, side="right")
+        counts = np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)], 0.0)
+        return counts / cumulative[-1]
+
+    def to_bytes(self):
+        """float64 array: k, n, min, max, level count, level sizes, items."""
+        header = [self.k, self.n, self.min, self.max, len(self.levels)]
+        sizes = [len(items) for items in self.levels]
+        return np.concatenate([np.asarray(header + sizes, dtype=np.float64)] + self.levels).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        values = np.frombuffer(data, dtype=np.float64)
+        k, n, low, high, num_levels = values[:5]
+        sketch = cls(int(k))
+        sketch.n = int(n)
+        sketch.min = None if np.isnan(low) else float(low)
+        sketch.max = None if np.isnan(high) else float(high)
+        sizes = values[5:5 + int(num_levels)].astype(int)
+        bounds = np.cumsum(np.concatenate([[5 + int(num_levels)], sizes]))
+        sketch.levels = [values[start:stop].copy() for start, stop in zip(bounds[:-1], bounds[1:])]
+        return sketch
+
+
+class CountMinTopK:
+    """Count-min sketch of value frequencies plus a heavy-hitter candidate list."""
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, top_k=TOP_K, table=None, candidates=None):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.table = np.zeros((depth, width), dtype=np.int64) if table is None else table
+        self.candidates = candidates or []
+
+    def _columns(self, values):
+        return np.stack([_hash(values, key) % np.uint64(self.width) for key in _CMS_KEYS[:self.depth]]).astype(np.intp)
+
+    def estimate(self, values):
+        values = np.asarray(values, dtype=object)
+        if len(values) == 0:
+            return np.empty(0, dtype=np.int64)
+        columns = self._columns(values)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def _refresh_candidates(self, values):
+        pool = np.asarray(list(dict.fromkeys(list(self.candidates) + list(values))), dtype=object)
+        if len(pool) == 0:
+            return
+        counts = self.estimate(pool)
+        order = np.argsort(-counts, kind="stable")[:2 * self.top_k]
+        self.candidates = [pool[i] for i in order]
+
+    def update(self, values):
+        """values: 1-D array of strings (nulls already removed)."""
+        if len(values) == 0:
+            return
+        counts = pd.Series(values).value_counts(sort=True)
+        distinct = counts.index.to_numpy(dtype=object)
+        columns = self._columns(distinct)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts.to_numpy(dtype=np.int64))
+        self._refresh_candidates(distinct[:2 * self.top_k])
+
+    def merge(self, other):
+        self.table += other.table
+        self._refresh_candidates(other.candidates)
+
+    def top(self, k=None):
+        k = k or self.top_k
+        values = self.candidates[:k]
+        return [[value, int(count)] for value, count in zip(values, self.estimate(values))]
+
+    def to_bytes(self):
+        return self.table.tobytes()
+
+    @classmethod
+    def from_record(cls, data, candidates):
+        table = np.frombuffer(data, dtype=np.int64).reshape(CMS_DEPTH, -1).copy()
+        return cls(width=table.shape[1], depth=table.shape[0], table=table, candidates=list(candidates))
+
+
+class ColumnSketch:
+    """All sketches kept for one column; kind is numeric, datetime or categorical."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.count = 0
+        self.hll = HyperLogLog()
+        self.quantiles = KLLSketch() if kind in ("numeric", "datetime") else None
+        self.frequencies = CountMinTopK() if kind == "categorical" else None
+
+    def update(self, values):
+        """values: non-null float64 (numeric), int64 ns (datetime) or str (categorical)."""
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.hll.update_hashes(_hash(values, _HLL_KEY))
+        if self.quantiles is not None:
+            self.quantiles.update(values.astype(np.float64))
+        if self.frequencies is not None:
+            self.frequencies.update(values)
+
+    def merge(self, other):
+        self.count += other.count
+        self.hll.merge(other.hll)
+        if self.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        if self.frequencies is not None:
+            self.frequencies.merge(other.frequencies)
+
+    def _to_value(self, value):
+        if value is None or self.kind != "datetime":
+            return value
+        return pd.Timestamp(int(value)).isoformat()
+
+    def histograms(self, bins=HISTOGRAM_BINS):
+        """Equi-width counts and equi-depth edges derived from the quantile sketch."""
+
+        if self.quantiles is None or self.quantiles.n == 0:
+            return None
+
+        low, high = self.quantiles.min, self.quantiles.max
+        edges = np.linspace(low, high, bins + 1) if high > low else np.array([low, high])
+        cumulative = self.quantiles.ranks(edges) * self.count
+        cumulative[-1] = self.count
+        counts = np.diff(np.concatenate([[0.0], cumulative]))
+        counts[1] += counts[0]
+        counts = np.round(counts[1:]).astype(int)
+
+        depth_edges = sorted(set(self.quantiles.quantiles(np.linspace(0, 1, bins + 1))))
+
+        return {
+            "equi_width": {
+                "edges": [self._to_value(edge) for edge in edges.tolist()],
+                "counts": counts.tolist()
+            },
+            "equi_depth": {
+                "edges": [self._to_value(edge) for edge in depth_edges],
+                "rows_per_bin": self.count / max(len(depth_edges) - 1, 1)
+            }
+        }
+
+
+def _sketch_kind(column_type):
+    return {"Numerical": "numeric", "Datetime": "datetime"}.get(column_type, "categorical")
+
+
+class DatasetSketcher:
+    """ColumnSketch per column of a dataset, updated chunk by chunk."""
+
+    def __init__(self, sample):
+        self.columns = list(sample.columns)
+        self.groups = split_columns(sample)
+        self.sketches = {
+            col: ColumnSketch(_sketch_kind(column_type))
+            for column_type, cols in self.groups.items()
+            for col in cols
+        }
+
+    def update(self, chunk):
+        numeric_cols = self.groups["Numerical"]
+        if numeric_cols:
+            block = numeric_block(chunk, numeric_cols)
+            for i, col in enumerate(numeric_cols):
+                values = block[:, i]
+                self.sketches[col].update(values[~np.isnan(values)])
+
+        datetime_cols = self.groups["Datetime"]
+        if datetime_cols:
+            values, mask = datetime_block(chunk, datetime_cols)
+            for i, col in enumerate(datetime_cols):
+                self.sketches[col].update(values[mask[:, i], i])
+
+        for col in self.groups["Categorical"]:
+            series = chunk[col].dropna()
+            self.sketches[col].update(series.astype(str).to_numpy(dtype=object))
+
+    def merge(self, other):
+        for col, sketch in other.sketches.items():
+            self.sketches[col].merge(sketch)
+
+
+# dataset_column_sketches columns, in insert order
+SKETCH_FIELDS = [
+    "dataset_id", "column_name", "sketch_kind", "value_count", "hll_registers",
+    "quantile_sketch", "histograms", "cms_table", "top_values"
+]
+
+
+def _sketch_row(dataset_id, col, sketch):
+    return (
+        dataset_id,
+        col,
+        sketch.kind,
+        sketch.count,
+        sketch.hll.to_bytes(),
+        sketch.quantiles.to_bytes() if sketch.quantiles is not None else None,
+        json.dumps(sketch.histograms()),
+        sketch.frequencies.to_bytes() if sketch.frequencies is not None else None,
+        json.dumps(sketch.frequencies.candidates) if sketch.frequencies is not None else None
+    )
+
+
+def write_column_sketches(conn, dataset_id, sketcher):
+    """Replace a dataset's sketches with sketcher's, in one round trip."""
+
+    rows = [_sketch_row(dataset_id, col, sketcher.sketches[col]) for col in sketcher.columns]
+    if not rows:
+        return
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("DELETE FROM dataset_column_sketches WHERE dataset_id = %s", (dataset_id,))
+        execute_values(
+            cursor,
+            f"INSERT INTO dataset_column_sketches ({', '.join(SKETCH_FIELDS)}) VALUES %s",
+            rows,
+            page_size=len(rows)
+        )
+    finally:
+        cursor.close()
+
+
+def sketch_from_record(record):
+    """Rebuild a ColumnSketch from a dataset_column_sketches row (mapping)."""
+
+    sketch = ColumnSketch(record["sketch_kind"])
+    sketch.count = record["value_count"]
+    sketch.hll = HyperLogLog.from_bytes(bytes(record["hll_registers"]))
+
+    if record["quantile_sketch"] is not None:
+        sketch.quantiles = KLLSketch.from_bytes(bytes(record["quantile_sketch"]))
+
+    if record["cms_table"] is not None:
+        candidates = record["top_values"]
+        if isinstance(candidates, str):
+            candidates = json.loads(candidates)
+        sketch.frequencies = CountMinTopK.from_record(bytes(record["cms_table"]), candidates)
+
+    return sketch
@@ -0,0 +1,265 @@
+#type_inference.py
+import pandas as pd
+import numpy as np
+import warnings
+
+from pandas.tseries.api import guess_datetime_format
+
+from db_utils.Retrieval import quote_identifier
+
+# Integer types by value range, narrowest first
+INTEGER_TYPES = [
+    ("SMALLINT", -2 ** 15, 2 ** 15 - 1),
+    ("INTEGER", -2 ** 31, 2 ** 31 - 1),
+    ("BIGINT", -2 ** 63, 2 ** 63 - 1)
+]
+
+# Share of non-null values that must parse for a text column to become DATE/TIMESTAMP
+DATETIME_PARSE_THRESHOLD = 1.0
+
+# Low-cardinality text columns become ENUM types when encode_categoricals is on
+MAX_ENUM_LABELS = 256
+MAX_ENUM_RATIO = 0.5
+MAX_ENUM_LABEL_BYTES = 63
+
+
+def _integer_type(low, high, allow_smallint=True):
+    for sql_type, type_min, type_max in INTEGER_TYPES:
+        if sql_type == "SMALLINT" and not allow_smallint:
+            continue
+        if low >= type_min and high <= type_max:
+            return sql_type
+    return None
+
+
+def _is_integral(values):
+    return bool(np.all(np.isfinite(values)) and np.all(values == np.round(values)))
+
+
+def _fits_real(values):
+    """True when every value survives a round trip through float32."""
+    with np.errstate(over="ignore"):
+        return bool(np.all(values.astype("float32").astype("float64") == values))
+
+
+def _guess_datetime(series, threshold):
+    """Return the strptime format if the text column parses as datetimes."""
+
+    non_null = series.dropna()
+    if non_null.empty:
+        return None
+
+    first = str(non_null.iloc[0])
+    fmt = guess_datetime_format(first)
+    if fmt is None:
+        return None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(non_null.astype(str), format=fmt, errors="coerce")
+
+    if parsed.notna().mean() < threshold:
+        return None
+    return fmt
+
+
+def _has_time_component(parsed):
+    valid = parsed.dropna()
+    return bool((valid != valid.dt.normalize()).any())
+
+
+def infer_column_types(df, streaming=False, datetime_threshold=DATETIME_PARSE_THRESHOLD,
+                       encode_categoricals=False):
+    """Pick the narrowest PostgreSQL type for every column of df.
+
+    Returns {column: {"sql_type", "kind", ...}}, where kind tells
+    apply_column_types how to convert values:
+        - "int": SMALLINT/INTEGER/BIGINT by value range (integral floats too)
+        - "float": REAL when every value is exact in float32, else DOUBLE PRECISION
+        - "bool": BOOLEAN
+        - "datetime": DATE or TIMESTAMP when the text parses (format recorded)
+        - "enum": low-cardinality text as a PostgreSQL ENUM (opt-in)
+        - "text": TEXT
+
+    With streaming=True, df is only a prefix sample of the file, so types
+    are chosen to hold for unseen rows: integers are never SMALLINT, floats
+    stay DOUBLE PRECISION and text is never encoded as an ENUM.
+    """
+
+    column_types = {}
+
+    for col in df.columns:
+        series = df[col]
+        dtype = series.dtype
+
+        if pd.api.types.is_bool_dtype(dtype):
+            column_types[col] = {"sql_type": "BOOLEAN", "kind": "bool"}
+            continue
+
+        if pd.api.types.is_numeric_dtype(dtype):
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            values = values[~np.isnan(values)]
+
+            # A sample can look integral while later rows are not, so only
+            # in-memory inference narrows float columns to integers
+            integral = values.size and not streaming and _is_integral(values)
+            if pd.api.types.is_integer_dtype(dtype) or integral:
+                low = series.min() if values.size else 0
+                high = series.max() if values.size else 0
+                sql_type = _integer_type(int(low), int(high), allow_smallint=not streaming)
+                if sql_type is not None:
+                    column_types[col] = {"sql_type": sql_type, "kind": "int"}
+                    continue
+
+            if not streaming and values.size and _fits_real(values):
+                column_types[col] = {"sql_type": "REAL", "kind": "float"}
+            else:
+                column_types[col] = {"sql_type": "DOUBLE PRECISION", "kind": "float"}
+            continue
+
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            sql_type = "TIMESTAMP" if streaming or _has_time_component(series) else "DATE"
+            column_types[col] = {"sql_type": sql_type, "kind": "datetime", "format": None}
+            continue
+
+        fmt = _guess_datetime(series, datetime_threshold)
+        if fmt is not None:
+            has_time = any(token in fmt for token in ("%H", "%I", "%M", "%S"))
+            column_types[col] = {
+                "sql_type": "TIMESTAMP" if has_time or streaming else "DATE",
+                "kind": "datetime",
+                "format": fmt
+            }
+            continue
+
+        if encode_categoricals and not streaming:
+            labels = pd.unique(series.dropna().astype(str))
+            non_null = int(series.notna().sum())
+            if (
+                0 < len(labels) <= MAX_ENUM_LABELS
+                and len(labels) <= MAX_ENUM_RATIO * non_null
+                and all(len(label.encode("utf-8")) <= MAX_ENUM_LABEL_BYTES for label in labels)
+            ):
+                column_types[col] = {
+                    "sql_type": "ENUM",
+                    "kind": "enum",
+                    "labels": sorted(labels.tolist())
+                }
+                continue
+
+        column_types[col] = {"sql_type": "TEXT", "kind": "text"}
+
+    return column_types
+
+
+def apply_column_types(df, column_types, strict=True):
+    """Convert df's columns to match the inferred types.
+
+    Raises ValueError when a non-null value cannot be represented, so a
+    chunk that contradicts the sample-inferred schema fails loudly instead
+    of being silently nulled or truncated. strict=False only relaxes
+    datetime parsing: values that do not parse become NULL.
+    """
+
+    df = df.copy()
+
+    for col, col_type in column_types.items():
+        series = df[col]
+        kind = col_type["kind"]
+
+        if kind == "int":
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+            values = values[~np.isnan(values)]
+            if values.size:
+                if not _is_integral(values):
+                    raise ValueError(f"Column {col!r} has non-integer values but was inferred as {col_type['sql_type']}")
+                for sql_type, type_min, type_max in INTEGER_TYPES:
+                    if sql_type == col_type["sql_type"] and (values.min() < type_min or values.max() > type_max):
+                        raise ValueError(f"Column {col!r} has values outside the {sql_type} range")
+            df[col] = series.astype("Int64")
+
+        elif kind == "float":
+            df[col] = pd.to_numeric(series, errors="raise").astype("float64")
+
+        elif kind == "datetime":
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    parsed = pd.to_datetime(series.astype("object").where(series.notna(), None),
+                                            format=col_type["format"], errors="coerce")
+                failed = int((parsed.isna() & series.notna()).sum())
+                if failed and strict:
+                    raise ValueError(f"Column {col!r} has {failed} values that do not parse as {col_type['sql_type']}")
+                series = parsed
+            if getattr(series.dt, "tz", None) is not None:
+                series = series.dt.tz_convert(None)
+            df[col] = series
+
+        elif kind == "enum":
+            unknown = set(pd.unique(series.dropna().astype(str))) - set(col_type["labels"])
+            if unknown:
+                raise ValueError(f"Column {col!r} has values outside its ENUM labels: {sorted(unknown)[:5]}")
+
+    return df
+
+
+def infer_and_apply_column_types(df, datetime_threshold=DATETIME_PARSE_THRESHOLD, encode_categoricals=False):
+    """In-memory inference: infer on the whole frame, then convert it.
+
+    Returns (converted_df, column_types). With datetime_threshold below 1.0,
+    values of a detected datetime column that do not parse are stored as NULL.
+    """
+
+    column_types = infer_column_types(df, datetime_threshold=datetime_threshold,
+                                      encode_categoricals=encode_categoricals)
+    df = apply_column_types(df, column_types, strict=datetime_threshold >= 1.0)
+
+    # Parsed datetimes may turn out to be date-only once every row is seen
+    for col, col_type in column_types.items():
+        if col_type["kind"] == "datetime" and col_type["sql_type"] == "TIMESTAMP" and not _has_time_component(df[col]):
+            col_type["sql_type"] = "DATE"
+
+    return df, column_types
+
+
+def column_type_from_sql(sql_type, enum_labels=None):
+    """column_types entry for an existing table column.
+
+    sql_type is the catalog name from format_type(); enum_labels are the
+    labels of an ENUM column (empty for other types).
+    """
+
+    if enum_labels:
+        return {"sql_type": "ENUM", "kind": "enum", "labels": list(enum_labels)}
+
+    sql_type = sql_type.upper()
+    if sql_type in ("SMALLINT", "INTEGER", "BIGINT"):
+        return {"sql_type": sql_type, "kind": "int"}
+    if sql_type in ("REAL", "DOUBLE PRECISION"):
+        return {"sql_type": sql_type, "kind": "float"}
+    if sql_type == "BOOLEAN":
+        return {"sql_type": sql_type, "kind": "bool"}
+    if sql_type == "DATE" or sql_type.startswith("TIMESTAMP"):
+        return {"sql_type": "DATE" if sql_type == "DATE" else "TIMESTAMP", "kind": "datetime", "format": None}
+    return {"sql_type": sql_type, "kind": "text"}
+
+
+def enum_type_name(table_name, position):
+    return f"{table_name}_enum_{position}"
+
+
+def column_definitions_sql(table_name, column_types):
+    """CREATE TYPE statements for ENUM columns plus the column definition list."""
+
+    type_statements = []
+    column_definitions = []
+
+    for position, (col, col_type) in enumerate(column_types.items()):
+        sql_type = col_type["sql_type"]
+        if col_type["kind"] == "enum":
+            sql_type = enum_type_name(table_name, position)
+            labels_sql = ", ".join("'" + label.replace("'", "''") + "'" for label in col_type["labels"])
+            type_statements.append(f"CREATE TYPE {sql_type} AS ENUM ({labels_sql});")
+        column_definitions.append(f"{quote_identifier(str(col))} {sql_type}")
+
+    return type_statements, ", ".join(column_definitions)
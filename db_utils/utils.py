@@ -1,12 +1,49 @@
 #utils.py
-from db_utils.Ingestion import ingest_dataset
-from db_utils.Retrieval import get_dataframe,get_column_details,get_dataset_metadata
+from db_utils.Ingestion import (
+    ingest_dataset,
+    append_to_dataset,
+    compute_file_hash,
+    source_size,
+    is_file_like,
+    IngestionCancelled
+)
+from db_utils.resumable import ingest_dataset_resumable
+from db_utils.index_advisor import advise_indexes
+from db_utils.replica import build_replica, remove_replica, replica_available
+from db_utils.Retrieval import (
+    get_dataframe,
+    get_page,
+    get_column_details,
+    get_dataset_metadata,
+    invalidate_dataset_cache,
+    build_select_sql,
+    cached_query,
+    ROW_ID_COLUMN
+)
+from db_utils.db_config import (
+    get_profile_workers,
+    get_upload_chunk_bytes,
+    get_partition_target_rows,
+    get_partition_method
+)
+from db_utils.arrow_io import detect_file_format, read_arrow_preview
+from db_utils.mongo_utils import list_knowledge_files_by_project
 import bcrypt
 from sqlalchemy.exc import IntegrityError
 import streamlit as st
 
 import traceback
 import logging
+import os
+import io
+import pandas as pd
+
+# CSVs larger than this are ingested in streaming mode
+STREAMING_THRESHOLD_BYTES = 200 * 1024 * 1024
+STREAMING_CHUNK_ROWS = 100_000
+
+# Files on disk larger than this use checkpointed, resumable ingestion
+RESUMABLE_THRESHOLD_BYTES = 1024 * 1024 * 1024
 
 logging.basicConfig(
     filename="../app_errors.log",
@@ -111,13 +148,78 @@ def create_new_project(user_id,project_name,description,engine):
             "error": str(e)
         }
 
-def upload_dataset_to_project(project_id, csv_path, original_filename, user_id, engine):
+def save_upload(uploaded_file, dest_path, chunk_bytes=None):
+    """
+    Copy an uploaded file-like object to dest_path in fixed-size chunks,
+    so the upload is never duplicated in memory as one bytes object.
+    Returns the number of bytes written.
+    """
+
+    chunk_bytes = chunk_bytes or get_upload_chunk_bytes()
+    written = 0
+
+    uploaded_file.seek(0)
+    with open(dest_path, "wb") as out:
+        for block in iter(lambda: uploaded_file.read(chunk_bytes), b""):
+            out.write(block)
+            written += len(block)
+    uploaded_file.seek(0)
+
+    return written
+
+
+def preview_upload(uploaded_file, filename, rows=5, chunk_bytes=None):
+    """
+    First rows of an uploaded file. CSV previews are parsed from the first
+    chunk only (cut at the last complete line); Parquet/Arrow previews read
+    just the first record batch.
+    """
+
+    chunk_bytes = chunk_bytes or get_upload_chunk_bytes()
+    file_format = detect_file_format(filename)
+    uploaded_file.seek(0)
+
+    if file_format != "csv":
+        preview_df = read_arrow_preview(uploaded_file, file_format, rows=rows)
+    else:
+        first_chunk = uploaded_file.read(chunk_bytes)
+        end = first_chunk.rfind(b"\n")
+        if end != -1 and len(first_chunk) == chunk_bytes:
+            first_chunk = first_chunk[:end + 1]
+        preview_df = pd.read_csv(io.BytesIO(first_chunk), nrows=rows)
+
+    uploaded_file.seek(0)
+    return preview_df
+
+
+def refresh_replica(dataset_id, engine):
+    """Rebuild the columnar replica of a dataset; failures are logged, not raised."""
+
+    if not replica_available():
+        return
+    try:
+        build_replica(dataset_id, engine)
+    except Exception as e:
+        logging.error(f"Replica build failed for dataset {dataset_id}: {e}")
+
+
+def upload_dataset_to_project(project_id, csv_path, original_filename, user_id, engine, progress_callback=None):
     """
     Upload a dataset and attach it to an existing project.
     Enforces one-dataset-per-project rule.
+    progress_callback is passed through to ingest_dataset.
+    csv_path may be a path or a seekable file-like object.
+
+    Files are fingerprinted by content hash: if the user already has a
+    dataset with the same bytes, the project is linked to it (and its
+    ref_count bumped) instead of ingesting the file again.
     """
 
     try:
+        if progress_callback is not None:
+            progress_callback("hashing", 0)
+        file_hash = compute_file_hash(csv_path, chunk_bytes=get_upload_chunk_bytes())
+
         with engine.begin() as conn:
 
             project = conn.execute(
@@ -142,13 +244,66 @@ def upload_dataset_to_project(project_id, csv_path, original_filename, user_id,
                     "error": "Project already has a dataset"
                 }
 
-            # Ingest dataset
-            ingestion_result = ingest_dataset(csv_path, original_filename, user_id, engine)
+            # Serialise uploads of the same content so only one ingests it
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:lock_key));"),
+                {"lock_key": f"dataset:{user_id}:{file_hash}"}
+            )
 
-            if not ingestion_result["success"]:
-                return ingestion_result
+            existing = conn.execute(
+                text("""
+                    SELECT dataset_id
+                    FROM datasets_metadata
+                    WHERE owner_user_id = :user_id
+                      AND file_hash = :file_hash
+                    ORDER BY dataset_id
+                    LIMIT 1
+                    FOR UPDATE;
+                """),
+                {"user_id": user_id, "file_hash": file_hash}
+            ).fetchone()
 
-            dataset_id = ingestion_result["dataset_id"]
+            reused = existing is not None
+
+            if reused:
+                dataset_id = existing.dataset_id
+
+                conn.execute(
+                    text("""
+                        UPDATE datasets_metadata
+                        SET ref_count = ref_count + 1
+                        WHERE dataset_id = :dataset_id;
+                    """),
+                    {"dataset_id": dataset_id}
+                )
+
+            else:
+                # Ingest dataset (streamed in chunks when the file is large,
+                # checkpointed so a crash can resume when it is very large)
+                file_size = source_size(csv_path)
+
+                if file_size > RESUMABLE_THRESHOLD_BYTES and not is_file_like(csv_path):
+                    ingestion_result = ingest_dataset_resumable(csv_path, original_filename, user_id, engine,
+                                                                file_hash=file_hash,
+                                                                progress_callback=progress_callback,
+                                                                partition_rows=get_partition_target_rows(),
+                                                                partition_method=get_partition_method())
+                else:
+                    chunksize = None
+                    if file_size > STREAMING_THRESHOLD_BYTES:
+                        chunksize = STREAMING_CHUNK_ROWS
+
+                    ingestion_result = ingest_dataset(csv_path, original_filename, user_id, engine, chunksize=chunksize,
+                                                      profile_workers=get_profile_workers(),
+                                                      progress_callback=progress_callback,
+                                                      file_hash=file_hash,
+                                                      partition_rows=get_partition_target_rows(),
+                                                      partition_method=get_partition_method())
+
+                if not ingestion_result["success"]:
+                    return ingestion_result
+
+                dataset_id = ingestion_result["dataset_id"]
 
             # Attach dataset to project
             conn.execute(
@@ -163,12 +318,66 @@ def upload_dataset_to_project(project_id, csv_path, original_filename, user_id,
                 }
             )
 
+        # Initial indexes (BRIN on ordered datetime columns); failures are not fatal
+        if not reused:
+            advice = advise_indexes(engine, dataset_id)
+            if not advice["success"]:
+                logging.error(f"Index advisor failed for dataset {dataset_id}: {advice['error']}")
+            refresh_replica(dataset_id, engine)
+
         return {
             "success": True,
             "project_id": project_id,
-            "dataset_id": dataset_id
+            "dataset_id": dataset_id,
+            "reused": reused
         }
 
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "cancelled": isinstance(e, IngestionCancelled)
+        }
+
+def append_rows_to_project(project_id, csv_path, user_id, engine, progress_callback=None):
+    """
+    Append the rows of a CSV to the dataset attached to a project.
+    See append_to_dataset for the schema rules and how stats are merged.
+    """
+
+    try:
+        with engine.connect() as conn:
+            project = conn.execute(
+                text("""
+                    SELECT dataset_id
+                    FROM projects
+                    WHERE project_id = :project_id
+                      AND owner_user_id = :user_id;
+                """),
+                {"project_id": project_id, "user_id": user_id}
+            ).fetchone()
+
+        if project is None:
+            return {
+                "success": False,
+                "error": "Project not found or access denied"
+            }
+
+        if project.dataset_id is None:
+            return {
+                "success": False,
+                "error": "Project has no dataset to append to"
+            }
+
+        append_result = append_to_dataset(project.dataset_id, csv_path, engine,
+                                          chunksize=STREAMING_CHUNK_ROWS, progress_callback=progress_callback)
+
+        # The appended rows bumped dataset_version, so the old replica is stale
+        if append_result["success"] and append_result.get("rows_appended"):
+            refresh_replica(project.dataset_id, engine)
+
+        return append_result
+
     except Exception as e:
         return {
             "success": False,
@@ -213,6 +422,179 @@ def list_projects(user_id,engine):
             "success" : False,
             "error" : str(e)
         }
+def get_projects_overview(user_id, engine):
+    """
+    Everything the project list shows, in one SQL round trip plus one Mongo
+    aggregation however many projects the user has: each project with its
+    dataset metadata ("dataset", None without one), its column stats
+    ("columns", as get_column_details returns them) and its knowledge files
+    ("knowledge_files", newest first).
+    """
+
+    query = text("""
+        SELECT
+            p.project_id,
+            p.project_name,
+            p.description,
+            p.dataset_id,
+            p.created_at,
+            m.dataset_name,
+            m.table_name,
+            m.num_rows,
+            m.num_columns,
+            m.upload_date,
+            m.file_path,
+            m.column_names,
+            m.dataset_version,
+            COALESCE(c.columns, '[]'::json) AS columns
+        FROM projects p
+        LEFT JOIN datasets_metadata m ON m.dataset_id = p.dataset_id
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                'column_name', '"' || d.column_name || '"',
+                'pandas_dtype', d.pandas_dtype,
+                'column_type', d.column_type,
+                'mean', d.mean,
+                'median', d.median,
+                'std_dev', d.std_dev,
+                'min_value', d.min_value,
+                'max_value', d.max_value,
+                'missing_values', d.missing_values,
+                'unique_value_count', d.unique_value_count,
+                'distinct_categories', d.distinct_categories,
+                'min_datetime', d.min_datetime,
+                'max_datetime', d.max_datetime,
+                'sql_type', d.sql_type
+            ) ORDER BY d.column_name) AS columns
+            FROM dataset_column_details d
+            WHERE d.dataset_id = p.dataset_id
+        ) c ON TRUE
+        WHERE p.owner_user_id = :user_id
+        ORDER BY p.project_id;
+    """)
+
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(query, {"user_id": user_id}).fetchall()
+
+        knowledge_files = list_knowledge_files_by_project([row.project_id for row in rows])
+
+        projects = []
+        for row in rows:
+            dataset = None
+            if row.dataset_id is not None:
+                dataset = {
+                    "dataset_id": row.dataset_id,
+                    "dataset_name": row.dataset_name,
+                    "table_name": row.table_name,
+                    "num_rows": row.num_rows,
+                    "num_columns": row.num_columns,
+                    "upload_date": row.upload_date,
+                    "column_names": row.column_names,
+                    "file_name": row.file_path,
+                    "dataset_version": row.dataset_version
+                }
+
+            projects.append({
+                "project_id": row.project_id,
+                "project_name": row.project_name,
+                "description": row.description,
+                "dataset_id": row.dataset_id,
+                "created_at": row.created_at,
+                "dataset": dataset,
+                "columns": row.columns,
+                "knowledge_files": knowledge_files.get(row.project_id, [])
+            })
+
+        return {
+            "success": True,
+            "projects": projects
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+def drop_dataset_table(conn, dataset_id):
+    """Drop dataset_X_data together with the ENUM types its columns use."""
+
+    table_name = f"dataset_{dataset_id}_data"
+
+    enum_types = conn.execute(
+        text("""
+            SELECT DISTINCT t.typname
+            FROM pg_attribute a
+            JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = to_regclass(:table_name)
+              AND t.typtype = 'e';
+        """),
+        {"table_name": table_name}
+    ).fetchall()
+
+    conn.execute(text(f'DROP TABLE IF EXISTS {table_name};'))
+
+    for row in enum_types:
+        conn.execute(text(f'DROP TYPE IF EXISTS "{row.typname}";'))
+
+
+def release_dataset(conn, dataset_id):
+    """
+    Drop one project reference to a dataset.
+    When it was the last reference, the dataset table, its column metadata
+    and its metadata row are deleted. Returns True if the dataset was deleted.
+    """
+
+    row = conn.execute(
+        text("""
+            SELECT ref_count
+            FROM datasets_metadata
+            WHERE dataset_id = :dataset_id
+            FOR UPDATE;
+        """),
+        {"dataset_id": dataset_id}
+    ).fetchone()
+
+    if row is None:
+        return False
+
+    if row.ref_count > 1:
+        conn.execute(
+            text("""
+                UPDATE datasets_metadata
+                SET ref_count = ref_count - 1
+                WHERE dataset_id = :dataset_id;
+            """),
+            {"dataset_id": dataset_id}
+        )
+        return False
+
+    # a) Drop dynamically created dataset table and its columnar replica
+    drop_dataset_table(conn, dataset_id)
+    remove_replica(dataset_id)
+
+    # b) Delete column metadata
+    conn.execute(
+        text("""
+            DELETE FROM dataset_column_details
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    )
+
+    # c) Delete dataset metadata
+    conn.execute(
+        text("""
+            DELETE FROM datasets_metadata
+            WHERE dataset_id = :dataset_id;
+        """),
+        {"dataset_id": dataset_id}
+    )
+
+    return True
+
+
 def delete_project(project_id, user_id, engine):
     """
     Delete a project and its associated dataset (if any).
@@ -241,31 +623,11 @@ def delete_project(project_id, user_id, engine):
 
             dataset_id = project_row.dataset_id
 
-            # 2. If dataset exists, delete dataset-related artifacts
+            # 2. If dataset exists, release this project's reference to it;
+            #    the dataset itself is dropped with its last reference
+            dataset_deleted = False
             if dataset_id is not None:
-
-                # a) Drop dynamically created dataset table
-                conn.execute(
-                    text(f'DROP TABLE IF EXISTS dataset_{dataset_id}_data;')
-                )
-
-                # b) Delete column metadata
-                conn.execute(
-                    text("""
-                        DELETE FROM dataset_column_details
-                        WHERE dataset_id = :dataset_id;
-                    """),
-                    {"dataset_id": dataset_id}
-                )
-
-                # c) Delete dataset metadata
-                conn.execute(
-                    text("""
-                        DELETE FROM datasets_metadata
-                        WHERE dataset_id = :dataset_id;
-                    """),
-                    {"dataset_id": dataset_id}
-                )
+                dataset_deleted = release_dataset(conn, dataset_id)
 
             # 3. Delete project itself
             conn.execute(
@@ -276,10 +638,13 @@ def delete_project(project_id, user_id, engine):
                 {"project_id": project_id}
             )
 
+        if dataset_deleted:
+            invalidate_dataset_cache(dataset_id)
+
         return {
             "success": True,
             "project_id": project_id,
-            "dataset_deleted": dataset_id is not None
+            "dataset_deleted": dataset_deleted
         }
 
     except Exception as e:
@@ -292,8 +657,9 @@ from sqlalchemy import text
 
 def unlink_dataset_from_project(project_id, user_id, engine):
     """
-    Delete the dataset linked to a project.
-    The project remains, dataset_id is set to NULL via FK (ON DELETE SET NULL).
+    Unlink the dataset from a project.
+    The project remains with dataset_id set to NULL; the dataset itself is
+    deleted only if no other project references it.
     """
 
     try:
@@ -324,34 +690,28 @@ def unlink_dataset_from_project(project_id, user_id, engine):
 
             dataset_id = row.dataset_id
 
-            # 2. Drop dataset data table
-            conn.execute(
-                text(f'DROP TABLE IF EXISTS dataset_{dataset_id}_data;')
-            )
-
-            # 3. Delete column metadata
+            # 2. Detach the dataset from the project
             conn.execute(
                 text("""
-                    DELETE FROM dataset_column_details
-                    WHERE dataset_id = :dataset_id;
+                    UPDATE projects
+                    SET dataset_id = NULL
+                    WHERE project_id = :project_id;
                 """),
-                {"dataset_id": dataset_id}
+                {"project_id": project_id}
             )
 
-            # 4. Delete dataset metadata
-            conn.execute(
-                text("""
-                    DELETE FROM datasets_metadata
-                    WHERE dataset_id = :dataset_id;
-                """),
-                {"dataset_id": dataset_id}
-            )
-            # FK ON DELETE SET NULL updates projects.dataset_id automatically
+            # 3. Release the reference; the dataset table, column metadata and
+            #    dataset metadata are deleted only when no project uses it
+            dataset_deleted = release_dataset(conn, dataset_id)
+
+        if dataset_deleted:
+            invalidate_dataset_cache(dataset_id)
 
         return {
             "success": True,
             "project_id": project_id,
-            "deleted_dataset_id": dataset_id
+            "deleted_dataset_id": dataset_id,
+            "dataset_deleted": dataset_deleted
         }
 
     except Exception as e:
@@ -457,32 +817,44 @@ def normalize_columns(columns):
     return [col.strip().strip('"') for col in columns]
 
 def get_project_data(project_id,engine,columns = None,limit = 100,where_clause = None):
+    """
+    Rows of a project's dataset (see get_dataframe for the arguments).
+    Project, dataset and table are resolved in one joined query, and the
+    data SELECT runs on the same connection (or comes from the result cache).
+    """
 
-    columns = normalize_columns(columns)
-
-    project_meta = get_project_metadata(project_id,engine)
-
-    if not project_meta["success"]:
-        return{
-            "success":False,
-            "error":project_meta["error"]
-        }
-    project = project_meta["project"]
+    try:
+        with engine.connect() as conn:
+            project = conn.execute(
+                text("""
+                    SELECT p.dataset_id, m.table_name, m.dataset_version
+                    FROM projects p
+                    LEFT JOIN datasets_metadata m ON m.dataset_id = p.dataset_id
+                    WHERE p.project_id = :project_id;
+                """),
+                {"project_id": project_id}
+            ).fetchone()
 
-    if not project["has_dataset"]:
-        return {
-            "success":False,
-            "error":"Project does not have a dataset uploaded"
-        }
+            if project is None:
+                return {
+                    "success": False,
+                    "error": "Project not found"
+                }
 
-    dataset_id = project["dataset"]["dataset_id"]
+            if project.dataset_id is None:
+                return {
+                    "success":False,
+                    "error":"Project does not have a dataset uploaded"
+                }
 
-    try:
-        df = get_dataframe(dataset_id,engine,limit,columns,where_clause)
+            sql = build_select_sql(project.table_name, limit, columns, where_clause)
+            df = cached_query(project.dataset_id, sql, engine,
+                              run=lambda: pd.read_sql(text(sql), conn),
+                              dataset_version=project.dataset_version)
 
         return{
             "success":True,
-            "data":df
+            "data":df.drop(columns=ROW_ID_COLUMN, errors="ignore")
         }
     except Exception as e:
         return {
@@ -7,8 +7,14 @@ from db_utils.utils import (
     get_project_metadata,
     get_project_stats
 )
+from db_utils.index_advisor import observe_query
+from db_utils.jobs import submit_index_advice, submit_replica_build
+from db_utils.arrow_fetch import arrow_fetch_available, read_sql_arrow
+from db_utils.Retrieval import get_sketch_summary, cached_query, get_result_cache_stats, ROW_ID_COLUMN
+from db_utils.replica import is_analytical_query, query_replica
 
 import re
+import time
 import pandas as pd
 
 from db_utils.mongo_utils import get_mongo_collection
@@ -164,6 +170,50 @@ def validate_sql(sql, table_name, allowed_columns):
 
 
 
+def answer_data_query(engine, dataset_id, sql, allowed_columns):
+    """Answer a validated query from the result cache, the replica or
+    PostgreSQL, and record its filters for the index advisor.
+
+    The observation wraps the whole dispatch, so cache hits and replica
+    answers count towards the advisor's filter hits like PostgreSQL runs;
+    elapsed_ms is the time the user waited.
+    """
+
+    query_start = time.perf_counter()
+    # Repeated questions are answered from the result cache until the dataset changes
+    df = cached_query(
+        dataset_id, sql, engine,
+        run=lambda: run_data_query(engine, dataset_id, sql),
+        fetch="chatbot"
+    )
+    elapsed_ms = (time.perf_counter() - query_start) * 1000
+
+    # Feed the index advisor with this query's filters; it runs in the job workers
+    observation = observe_query(engine, dataset_id, sql, allowed_columns, elapsed_ms)
+    if observation.get("queued"):
+        submit_index_advice(dataset_id)
+    return df
+
+
+def run_data_query(engine, dataset_id, sql):
+    """Execute a validated query: read-only aggregations go to the columnar
+    replica, PostgreSQL answers everything else and any replica miss."""
+
+    if is_analytical_query(sql):
+        try:
+            df = query_replica(dataset_id, sql, engine)
+            if df is not None:
+                st.write("🦆 Answered from the columnar replica")
+                return df
+        except Exception as e:
+            print(f"Replica query failed, using PostgreSQL: {e}")
+
+    if arrow_fetch_available():
+        return read_sql_arrow(sql, engine)
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn)
+
+
 st.set_page_config(
     page_title="EDA Assistant Chatbot",
     page_icon="📊",
@@ -241,6 +291,15 @@ if (
     stats = get_project_stats(project_id=project_id, engine=engine)
     stats = stats["stats"]
 
+    # Distribution sketches answer quantile / distinct / top-k questions without a scan
+    sketch_summary = get_sketch_summary(metadata["dataset_id"], engine)
+    for column_stats in stats:
+        column_stats.update(sketch_summary.get(column_stats["column_name"].strip('"'), {}))
+
+    # Aggregations run on the DuckDB/Parquet replica once the job workers
+    # have built it; until then they go to PostgreSQL
+    submit_replica_build(metadata["dataset_id"])
+
     column_names = metadata["column_names"]
     table_name = metadata["table_name"]
     allowed_columns = set(column_names)
@@ -433,6 +492,16 @@ with st.sidebar:
         for col in st.session_state.metadata.get('column_names', []):
             st.write(f"- {col}")
 
+    with st.expander("Query Cache"):
+        cache_stats = get_result_cache_stats()
+        hit_rate = cache_stats["hit_rate"]
+        st.write(f"**Hit rate:** {hit_rate:.0%}" if hit_rate is not None else "**Hit rate:** -")
+        st.write(f"**Hits:** {cache_stats['hits'] + cache_stats['disk_hits']} "
+                 f"({cache_stats['disk_hits']} from disk), **Misses:** {cache_stats['misses']}")
+        st.write(f"**Memory:** {cache_stats['bytes'] / 2**20:.1f} MiB in {cache_stats['entries']} results")
+        if cache_stats["disk_entries"]:
+            st.write(f"**Disk:** {cache_stats['disk_bytes'] / 2**20:.1f} MiB in {cache_stats['disk_entries']} results")
+
 # Display chat history
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -494,10 +563,12 @@ if prompt := st.chat_input("Ask about your dataset..."):
                         print(final_sql)
 
                         try:
-                            with engine.connect() as conn:
-                                df = pd.read_sql(text(final_sql), conn)
+                            df = answer_data_query(engine, st.session_state.metadata["dataset_id"],
+                                                   final_sql, st.session_state.allowed_columns)
 
-                            json_data = df.head(100).to_dict(orient="records")
+                            df = df.drop(columns=ROW_ID_COLUMN, errors="ignore")
+                            # to_json handles pd.NA and timestamps, which json.dumps cannot
+                            json_data = json.loads(df.head(100).to_json(orient="records", date_format="iso"))
                             json_text = json.dumps(json_data, indent=2)
                             print(json_data)
                             st.write("🤖 Analyzing data")
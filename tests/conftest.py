@@ -0,0 +1,56 @@
+#conftest.py
+# Database tests run against a scratch PostgreSQL database given in
+# TEST_DATABASE_URL (skipped without one), e.g.
+#   TEST_DATABASE_URL=postgresql://postgres@localhost:5432/eda_test python -m pytest tests
+# Each test gets its own empty schema, dropped afterwards.
+import os
+import uuid
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def empty_engine():
+    """Engine whose search_path is a new, empty schema."""
+
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    pytest.importorskip("psycopg2")
+
+    schema = f"eda_test_{uuid.uuid4().hex[:8]}"
+    admin = sqlalchemy.create_engine(TEST_DATABASE_URL)
+    with admin.begin() as conn:
+        conn.execute(sqlalchemy.text(f"CREATE SCHEMA {schema};"))
+
+    engine = sqlalchemy.create_engine(TEST_DATABASE_URL, connect_args={"options": f"-csearch_path={schema}"})
+    yield engine
+
+    engine.dispose()
+    with admin.begin() as conn:
+        conn.execute(sqlalchemy.text(f"DROP SCHEMA {schema} CASCADE;"))
+    admin.dispose()
+
+
+@pytest.fixture
+def engine(empty_engine):
+    """Engine on a fresh schema with the application tables created."""
+
+    from db_utils.init_db import init_postgresql
+
+    assert init_postgresql(empty_engine)
+    return empty_engine
+
+
+@pytest.fixture
+def user_id(engine):
+    """A user owning the datasets a test ingests."""
+
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        return conn.execute(
+            text("INSERT INTO user_details (username, password_hash) VALUES ('tester', 'x') RETURNING user_id;")
+        ).scalar_one()
@@ -0,0 +1,104 @@
+#test_index_advisor.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from sqlalchemy import text
+
+from db_utils.index_advisor import MIN_INDEX_ROWS, advise_indexes
+from db_utils.Retrieval import ROW_ID_COLUMN
+
+ROWS = MIN_INDEX_ROWS * 3
+PARTITIONS = 3
+
+
+@pytest.fixture
+def partitioned_dataset(engine, user_id):
+    """A range-partitioned dataset table with an ordered datetime column,
+    repeated equality filters on a numeric column and a text column that
+    gives rows a realistic width (so the indexes fit the size budget)."""
+
+    table_name = "dataset_test_data"
+    column_names = ["event_time", "amount", "note"]
+
+    with engine.begin() as conn:
+        dataset_id = conn.execute(
+            text("""
+                INSERT INTO datasets_metadata
+                (dataset_name, upload_date, num_rows, num_columns, owner_user_id, table_name, column_names)
+                VALUES ('advisor_test.csv', NOW(), :num_rows, 3, :user_id, :table_name, :column_names)
+                RETURNING dataset_id;
+            """),
+            {"num_rows": ROWS, "user_id": user_id, "table_name": table_name, "column_names": column_names}
+        ).scalar_one()
+
+        conn.execute(text(f"""
+            CREATE TABLE {table_name} (
+                {ROW_ID_COLUMN} BIGINT NOT NULL,
+                "event_time" TIMESTAMP,
+                "amount" DOUBLE PRECISION,
+                "note" TEXT
+            ) PARTITION BY RANGE ({ROW_ID_COLUMN});
+        """))
+        for part in range(PARTITIONS):
+            low, high = part * MIN_INDEX_ROWS + 1, (part + 1) * MIN_INDEX_ROWS + 1
+            conn.execute(text(f"""
+                CREATE TABLE {table_name}_p{part} PARTITION OF {table_name}
+                FOR VALUES FROM ({low}) TO ({high});
+            """))
+        conn.execute(text(f"""
+            INSERT INTO {table_name}
+            SELECT n, TIMESTAMP '2024-01-01' + n * INTERVAL '1 minute', n, repeat(md5(n::text), 3)
+            FROM generate_series(1, {ROWS}) AS n;
+        """))
+
+        conn.execute(
+            text("""
+                INSERT INTO dataset_column_details
+                (dataset_id, column_name, column_type, sql_type, unique_value_count)
+                VALUES (:dataset_id, 'event_time', 'Datetime', 'TIMESTAMP', :rows),
+                       (:dataset_id, 'amount', 'Numerical', 'DOUBLE PRECISION', :rows),
+                       (:dataset_id, 'note', 'Categorical', 'TEXT', :rows);
+            """),
+            {"dataset_id": dataset_id, "rows": ROWS}
+        )
+        conn.execute(
+            text("""
+                INSERT INTO query_filter_stats (dataset_id, column_name, predicate, hits)
+                VALUES (:dataset_id, 'amount', 'eq', 5);
+            """),
+            {"dataset_id": dataset_id}
+        )
+
+    return dataset_id, table_name
+
+
+def test_partitioned_table_gets_a_budget(engine, partitioned_dataset):
+    dataset_id, _ = partitioned_dataset
+
+    result = advise_indexes(engine, dataset_id, apply=False)
+
+    assert result["success"], result
+    assert not any("over budget" in skip["reason"] for skip in result["skipped"])
+    assert {index["column_name"] for index in result["created"]} == {"event_time", "amount"}
+
+
+def test_partitioned_table_indexes_every_partition(engine, partitioned_dataset):
+    dataset_id, _ = partitioned_dataset
+
+    result = advise_indexes(engine, dataset_id)
+
+    assert result["success"], result
+    assert {index["column_name"] for index in result["created"]} == {"event_time", "amount"}
+    with engine.connect() as conn:
+        for index in result["created"]:
+            assert index["size_bytes"] > 0
+            partitions = conn.execute(
+                text("""
+                    SELECT COUNT(*) FROM pg_partition_tree(CAST(:index_name AS regclass))
+                    WHERE isleaf;
+                """),
+                {"index_name": index["index_name"]}
+            ).scalar()
+            assert partitions == PARTITIONS
@@ -0,0 +1,46 @@
+#test_ingestion.py
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from db_utils.Ingestion import _stream_dtypes
+
+
+def test_column_empty_in_sample_accepts_later_text():
+    rows = ["id,score,comment"]
+    rows += [f"{i},{i * 0.5}," for i in range(100)]
+    rows += [f"{i},{i * 0.5},late text {i}" for i in range(100, 150)]
+    csv = io.StringIO("\n".join(rows) + "\n")
+
+    sample = pd.read_csv(csv, nrows=100)
+    dtypes = _stream_dtypes(sample)
+    assert dtypes == {"id": "Int64", "score": "float64", "comment": "object"}
+
+    csv.seek(0)
+    chunks = list(pd.read_csv(csv, chunksize=40, dtype=dtypes))
+    comments = pd.concat(chunks)["comment"]
+    assert comments.isna().sum() == 100
+    assert comments.iloc[-1] == "late text 149"
+
+
+def test_streamed_ingest_of_a_wide_table(engine, user_id, tmp_path):
+    from db_utils.Ingestion import ingest_dataset
+    from db_utils.Retrieval import get_column_details
+
+    # 900 numeric columns: one median and one distinct count each
+    np = pytest.importorskip("numpy")
+    df = pd.DataFrame(np.arange(20 * 900).reshape(20, 900), columns=[f"c{i}" for i in range(900)])
+    path = tmp_path / "wide.csv"
+    df.to_csv(path, index=False)
+
+    result = ingest_dataset(str(path), "wide.csv", user_id, engine, chunksize=10)
+    assert result["success"], result
+
+    details = {d["column_name"].strip('"'): d for d in get_column_details(result["dataset_id"], engine)}
+    assert len(details) == 900
+    assert details["c899"]["median"] == df["c899"].median()
+    assert details["c899"]["unique_value_count"] == 20
@@ -0,0 +1,26 @@
+#test_init_db.py
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import text
+
+from db_utils.init_db import init_postgresql
+
+
+def test_init_postgresql_on_empty_database(empty_engine):
+    assert init_postgresql(empty_engine)
+    # Safe to run again
+    assert init_postgresql(empty_engine)
+
+    with empty_engine.connect() as conn:
+        tables = set(conn.execute(
+            text("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema();")
+        ).scalars())
+
+    assert {
+        "user_details", "datasets_metadata", "projects", "dataset_column_details",
+        "dataset_column_sketches", "ingestion_jobs", "dataset_correlations",
+        "dataset_group_aggregates", "ingestion_checkpoints", "query_filter_stats",
+        "index_advice_requests", "dataset_indexes"
+    } <= tables
@@ -0,0 +1,78 @@
+#test_pairwise.py
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from db_utils.Ingestion import append_to_dataset, ingest_dataset
+from db_utils.Retrieval import get_correlation_matrix
+from db_utils.pairwise import PairwiseAccumulator
+
+
+def _numeric_frame(rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(rng.normal(size=(rows, columns)), columns=[f"x{i}" for i in range(columns)])
+
+
+def test_spearman_over_select_list_limit(engine, user_id, tmp_path):
+    # 60 columns -> 1770 pairs, more than one SELECT list can hold
+    df = _numeric_frame(200, 60)
+    path = tmp_path / "wide.csv"
+    df.to_csv(path, index=False)
+
+    result = ingest_dataset(str(path), "wide.csv", user_id, engine, chunksize=50)
+    assert result["success"], result
+
+    spearman = get_correlation_matrix(result["dataset_id"], engine, "spearman")
+    expected = df.corr(method="spearman")
+    assert spearman.shape == (60, 60)
+    np.testing.assert_allclose(spearman.to_numpy(), expected.to_numpy(), atol=1e-9)
+
+
+def test_spearman_after_append(engine, user_id, tmp_path):
+    df = _numeric_frame(100, 3)
+    extra = _numeric_frame(50, 3, seed=1)
+    path, extra_path = tmp_path / "base.csv", tmp_path / "extra.csv"
+    df.to_csv(path, index=False)
+    extra.to_csv(extra_path, index=False)
+
+    result = ingest_dataset(str(path), "base.csv", user_id, engine)
+    assert result["success"], result
+    appended = append_to_dataset(result["dataset_id"], str(extra_path), engine)
+    assert appended["success"], appended
+
+    spearman = get_correlation_matrix(result["dataset_id"], engine, "spearman")
+    expected = pd.concat([df, extra]).corr(method="spearman")
+    np.testing.assert_allclose(spearman.to_numpy(), expected.to_numpy(), atol=1e-9)
+
+
+def test_accumulator_round_trip():
+    df = _numeric_frame(100, 4)
+    df.iloc[::7, 1] = np.nan
+    accumulator = PairwiseAccumulator.from_sample(list(df.columns), df.to_numpy())
+    accumulator.update(df.to_numpy())
+
+    restored = PairwiseAccumulator.from_bytes(list(df.columns), accumulator.to_bytes())
+    np.testing.assert_array_equal(restored.shift, accumulator.shift)
+    np.testing.assert_array_equal(restored.pearson(), accumulator.pearson())
+    with pytest.raises(ValueError):
+        PairwiseAccumulator.from_bytes(list(df.columns)[:3], accumulator.to_bytes())
+
+
+def test_pearson_after_append(engine, user_id, tmp_path):
+    df = _numeric_frame(100, 3)
+    extra = _numeric_frame(50, 3, seed=1)
+    path, extra_path = tmp_path / "base.csv", tmp_path / "extra.csv"
+    df.to_csv(path, index=False)
+    extra.to_csv(extra_path, index=False)
+
+    result = ingest_dataset(str(path), "base.csv", user_id, engine)
+    assert result["success"], result
+    appended = append_to_dataset(result["dataset_id"], str(extra_path), engine)
+    assert appended["success"], appended
+
+    pearson = get_correlation_matrix(result["dataset_id"], engine, "pearson")
+    expected = pd.concat([df, extra]).corr()
+    np.testing.assert_allclose(pearson.to_numpy(), expected.to_numpy(), atol=1e-9)
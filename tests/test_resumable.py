@@ -0,0 +1,89 @@
+#test_resumable.py
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+from sqlalchemy import text
+
+from db_utils.pairwise import PairwiseProfiler
+from db_utils.partitioning import plan_partitions
+from db_utils.profiler import StreamingProfiler
+from db_utils.resumable import _decode_state, _encode_state, ingest_dataset_resumable
+from db_utils.sketches import DatasetSketcher
+
+
+def _frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    amount = rng.normal(size=rows)
+    amount[::9] = np.nan
+    return pd.DataFrame({
+        "amount": amount,
+        "quantity": pd.array(rng.integers(0, 100, size=rows), dtype="Int64"),
+        "region": rng.choice(["north", "south", "east", None], size=rows),
+        "event_time": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 10 ** 6, size=rows), unit="s")
+    })
+
+
+def test_checkpoint_state_round_trip():
+    first, second = _frame(500), _frame(300, seed=1)
+    column_types = {"event_time": {"kind": "datetime"}}
+    partitioner = plan_partitions("staging_1_data", column_types, first, 10_000, 1_000)
+
+    state = (StreamingProfiler(first), DatasetSketcher(first), PairwiseProfiler(first), partitioner)
+    for part in state[:3]:
+        part.update(first)
+    partitioner.created.update({3, 4})
+
+    restored = _decode_state(_encode_state(state))
+    for original, copy in zip(state[:3], restored[:3]):
+        original.update(second)
+        copy.update(second)
+
+    profiler, sketcher, pairwise, restored_partitioner = restored
+    medians = {"amount": 0.0, "quantity": 50.0}
+    assert profiler.column_stats(medians, {}) == state[0].column_stats(medians, {})
+
+    for col in first.columns:
+        sketch, expected = sketcher.sketches[col], state[1].sketches[col]
+        assert sketch.count == expected.count
+        assert sketch.hll.estimate() == expected.hll.estimate()
+        if expected.frequencies is not None:
+            assert sketch.frequencies.top() == expected.frequencies.top()
+
+    np.testing.assert_allclose(pairwise.correlation.pearson(), state[2].correlation.pearson())
+    assert pairwise.groups.aggregates("region") == state[2].groups.aggregates("region")
+    assert restored_partitioner.to_state() == partitioner.to_state()
+
+
+def test_resume_after_failure(engine, user_id, tmp_path):
+    df = _frame(2000)
+    path = tmp_path / "events.csv"
+    df.to_csv(path, index=False)
+
+    def fail_after_first_batch(phase, rows_loaded):
+        if phase == "loading" and rows_loaded > 0:
+            raise RuntimeError("worker lost")
+
+    failed = ingest_dataset_resumable(str(path), "events.csv", user_id, engine, batch_bytes=16 * 1024,
+                                      sample_rows=100, progress_callback=fail_after_first_batch)
+    assert not failed["success"]
+
+    result = ingest_dataset_resumable(str(path), "events.csv", user_id, engine, batch_bytes=16 * 1024,
+                                      sample_rows=100)
+    assert result["success"], result
+    assert result["resumed"] and 0 < result["rows_resumed"] < len(df)
+
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT missing_values, mean
+                FROM dataset_column_details
+                WHERE dataset_id = :dataset_id AND column_name = 'amount';
+            """),
+            {"dataset_id": result["dataset_id"]}
+        ).fetchone()
+    assert row.missing_values == df["amount"].isna().sum()
+    assert row.mean == pytest.approx(df["amount"].mean())
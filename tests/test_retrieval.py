@@ -0,0 +1,76 @@
+#test_retrieval.py
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sqlalchemy")
+
+from db_utils.Retrieval import MetadataCache
+
+
+def test_metadata_cache_trusts_version_within_ttl():
+    cache = MetadataCache(8, version_ttl=60)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"num_rows": len(loads)}
+
+    assert not cache.version_is_fresh(1)
+    assert cache.get(1, "metadata", loader, version=1) == {"num_rows": 1}
+    assert cache.version_is_fresh(1)
+
+    # Within the TTL callers skip the version read and get the cached value
+    assert cache.get(1, "metadata", loader) == {"num_rows": 1}
+    assert len(loads) == 1
+
+    # A newer version (an append elsewhere) drops the entry
+    assert cache.get(1, "metadata", loader, version=2) == {"num_rows": 2}
+
+
+def test_metadata_cache_rechecks_after_ttl():
+    cache = MetadataCache(8, version_ttl=0)
+    cache.get(1, "metadata", lambda: {}, version=1)
+    assert not cache.version_is_fresh(1)
+
+    cache.invalidate(1)
+    assert not cache.version_is_fresh(1)
+
+
+@pytest.fixture
+def small_dataset(engine, user_id, tmp_path):
+    pd = pytest.importorskip("pandas")
+    from db_utils.Ingestion import ingest_dataset
+
+    path = tmp_path / "small.csv"
+    pd.DataFrame({"score": [61.5, 70.25, 74.4], "group": ["a", "b", "a"]}).to_csv(path, index=False)
+    result = ingest_dataset(str(path), "small.csv", user_id, engine)
+    assert result["success"], result
+    return result["dataset_id"]
+
+
+def test_arrow_and_pandas_fetches_are_cached_apart(engine, small_dataset):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    from db_utils.Retrieval import get_dataframe, get_dataframe_arrow
+
+    arrow_df = get_dataframe_arrow(small_dataset, engine)
+    pandas_df = get_dataframe(small_dataset, engine)
+
+    assert isinstance(arrow_df["score"].dtype, pd.ArrowDtype)
+    assert not isinstance(pandas_df["score"].dtype, pd.ArrowDtype)
+
+
+def test_untyped_numeric_results_are_floats(engine, small_dataset):
+    pytest.importorskip("pyarrow")
+    from db_utils.arrow_fetch import read_sql_arrow_table
+    from db_utils.Retrieval import get_table_name
+
+    table_name = get_table_name(small_dataset, engine)
+    table = read_sql_arrow_table(
+        f'SELECT AVG("score"::numeric) AS avg_score, CAST(1.5 AS NUMERIC(4, 2)) AS typed FROM {table_name}',
+        engine
+    )
+
+    assert str(table.schema.field("avg_score").type) == "double"
+    assert table.column("avg_score")[0].as_py() == pytest.approx(68.716666, rel=1e-6)
+    assert str(table.schema.field("typed").type) == "decimal128(4, 2)"